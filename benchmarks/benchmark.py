@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Benchmarks of the codec, the message dispatch and the end-to-end
+# message processing of the echonetlite package.
+#
+#   python benchmarks/benchmark.py --output result.json
+#   python benchmarks/benchmark.py --compare result.json
+#
+# The results are written as JSON.  With --compare, the results are
+# compared with a previous result and the exit status is 1 if any
+# benchmark is slower by more than --threshold.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import types
+
+# measure the package of this checkout, even if another one is
+# installed.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from echonetlite.interfaces import monitor
+from echonetlite import asyncioadapter
+from echonetlite import middleware
+from echonetlite.protocol import *
+
+def measure(func, min_time=0.2, repeat=5):
+    # returns the best time in seconds of one call of func.
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+def _message(opc, pdc, esv=ESV_CODE['GET_RES']):
+    return Message(tid=1,
+                   seoj=EOJ(CLSGRP_CODE['SENSOR'],
+                            CLS_SE_CODE['TEMPERATURE'], 1),
+                   deoj=EOJ(CLSGRP_CODE['MANAGEMENT_OPERATION'],
+                            CLS_MO_CODE['CONTROLLER'], 1),
+                   esv=esv,
+                   properties=[Property(0x80 + i, bytes(range(pdc)))
+                               for i in range(opc)])
+
+
+class _LoopbackRuntime(asyncioadapter.Runtime):
+    # an asyncio runtime which opens no socket.
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        pass
+
+    def listen_shell(self, port):
+        pass
+
+    def run(self):
+        pass
+
+    def new_sender(self, local_addr):
+        return _CountingSender(local_addr)
+
+
+class _CountingSender(object):
+    def __init__(self, local_addr):
+        self.count = 0
+
+    def sendDatagram(self, datagram, node_id=None):
+        self.count += 1
+
+
+_loopback = types.SimpleNamespace(Runtime=_LoopbackRuntime)
+
+SELF_NODE_ID = '192.0.2.1'
+REMOTE_NODE_ID = '192.0.2.2'
+
+
+class Temperature(middleware.NodeSuperObject):
+    def __init__(self, eoj):
+        super(Temperature, self).__init__(eoj=eoj)
+        self._add_property(EPC_TEMPERATURE, [0x01, 0x0e])
+        self.get_property_map += [EPC_TEMPERATURE]
+
+
+def bench_codec(results):
+    for opc in (1, 4, 16, 64):
+        for pdc in (1, 4, 16):
+            msg = _message(opc, pdc)
+            data = bytes(encode(msg))
+            buf = bytearray(len(data))
+            name = 'opc={0},pdc={1}'.format(opc, pdc)
+            results['decode/' + name] = measure(lambda: decode(data))
+            results['encode/' + name] = measure(lambda: encode(msg))
+            results['encode_into/' + name] = measure(
+                lambda: encode_into(msg, buf))
+
+def start_monitor():
+    monitor.set_adapter(_loopback)
+    profile = middleware.NodeProfile()
+    controller = middleware.Controller(instance_id=1)
+    sensor = Temperature(EOJ(CLSGRP_CODE['SENSOR'],
+                             CLS_SE_CODE['TEMPERATURE'], 1))
+    monitor.start(SELF_NODE_ID, [profile, controller, sensor],
+                  shell_port=None)
+    return (profile, controller, sensor)
+
+def _devices(n, device_class, clsgrp):
+    # n devices of distinct EOJs of the class group, with instance
+    # codes from 1 to 0xff (0 is for all the instances).
+    return [device_class(EOJ(clsgrp, i // 0xff + 1, i % 0xff + 1))
+            for i in range(n)]
+
+def bench_dispatch(results, controller):
+    self_node = monitor.get_self_node()
+    for n in (1, 10, 100, 1000):
+        local = _devices(n, middleware.Device, CLSGRP_CODE['HEALTH'])
+        for d in local:
+            self_node.add_device(d)
+        remote = _devices(n, middleware.RemoteDevice, CLSGRP_CODE['SENSOR'])
+        node = middleware.Node(REMOTE_NODE_ID, remote)
+        monitor.nodes[REMOTE_NODE_ID] = node
+        remote[0].add_listener(0x80, lambda *args: None)
+        msg = _message(4, 2)
+        msg.seoj = remote[0].eoj
+        msg.deoj = controller.eoj
+        data = bytes(encode(msg))
+        listener = monitor._listener
+        results['dispatch/devices={0}'.format(n)] = measure(
+            lambda: listener.on_did_receive(msg, node))
+        results['receive/devices={0}'.format(n)] = measure(
+            lambda: monitor.on_did_receive(data, REMOTE_NODE_ID))
+        batch = [(data, REMOTE_NODE_ID)] * 64
+        results['receive_batch/devices={0}'.format(n)] = measure(
+            lambda: monitor.on_did_receive_batch(batch)) / len(batch)
+        for d in local:
+            self_node.remove_device(d.eoj)
+        del monitor.nodes[REMOTE_NODE_ID]
+
+def bench_update_device_numbers(results, profile):
+    for n in (1, 10, 100, 1000):
+        devices = {int(d.eoj): d
+                   for d in _devices(n, middleware.Device,
+                                     CLSGRP_CODE['HEALTH'])}
+        results['update_device_numbers/devices={0}'.format(n)] = measure(
+            lambda: profile.update_device_numbers(devices))
+    profile.update_device_numbers(monitor.get_self_node().devices)
+    # the same properties kept up to date by Node.add_device() and
+    # remove_device(), with n devices already added.
+    self_node = monitor.get_self_node()
+    for n in (1, 10, 100, 1000):
+        local = _devices(n, middleware.Device, CLSGRP_CODE['HEALTH'])
+        for d in local[:-1]:
+            self_node.add_device(d)
+        def add_remove():
+            self_node.add_device(local[-1])
+            self_node.remove_device(local[-1].eoj)
+        results['add_remove_device/devices={0}'.format(n)] = measure(
+            add_remove)
+        for d in local[:-1]:
+            self_node.remove_device(d.eoj)
+
+def bench_end_to_end(results, sensor, count=20000):
+    # GET requests received from a remote node are answered by a local
+    # temperature sensor.  Reports the time per request.
+    loop = monitor.runtime.loop
+    request = bytes(encode(Message(
+        tid=1,
+        seoj=EOJ(CLSGRP_CODE['MANAGEMENT_OPERATION'],
+                 CLS_MO_CODE['CONTROLLER'], 1),
+        deoj=sensor.eoj,
+        esv=ESV_CODE['GET'],
+        properties=[Property(EPC_TEMPERATURE)])))
+
+    async def run():
+        sender = monitor.sender
+        await asyncio.sleep(0.01)
+        sent = sender.count
+        start = time.perf_counter()
+        for i in range(count):
+            monitor.on_did_receive(request, REMOTE_NODE_ID)
+            if i % 256 == 0:
+                await asyncio.sleep(0)
+        while sender.count - sent < count:
+            await asyncio.sleep(0)
+        return time.perf_counter() - start
+
+    elapsed = loop.run_until_complete(run())
+    results['end_to_end/get'] = elapsed / count
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help='write the results to a file')
+    parser.add_argument('-c', '--compare',
+                        help='compare with the results in a file')
+    parser.add_argument('-t', '--threshold', type=float, default=0.1,
+                        help='allowed slowdown ratio (default 0.1)')
+    args = parser.parse_args()
+
+    (profile, controller, sensor) = start_monitor()
+    results = {}
+    bench_codec(results)
+    bench_dispatch(results, controller)
+    bench_update_device_numbers(results, profile)
+    bench_end_to_end(results, sensor)
+    output = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'seconds per operation',
+        'results': results,
+    }
+    text = json.dumps(output, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        regressed = False
+        for name in sorted(results):
+            if name not in baseline:
+                continue
+            ratio = results[name] / baseline[name] - 1
+            if ratio > args.threshold:
+                regressed = True
+                print('{0}: {1:+.1%}'.format(name, ratio), file=sys.stderr)
+        if regressed:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from echonetlite import udp
+from echonetlite.udp import Sender
+
+class Receiver(asyncio.DatagramProtocol):
+    def __init__(self, **kwargs):
+        super(Receiver, self).__init__()
+        self._local_addr = kwargs['local_addr']
+        self._on_did_receive = kwargs['on_did_receive']
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, datagram, address):
+        node_id = address[0]
+        self._on_did_receive(datagram, node_id)
+
+    def error_received(self, exc):
+        print('receive error: {0}'.format(exc))
+
+class _LoopingCall(object):
+    # calls callback now and then every interval seconds, like
+    # twisted.internet.task.LoopingCall.
+    def __init__(self, loop, interval, callback, kwargs):
+        self._loop = loop
+        self._interval = interval
+        self._callback = callback
+        self._kwargs = kwargs
+        self._handle = None
+        self._next = None
+        self.running = False
+
+    def start(self):
+        self.running = True
+        self._next = self._loop.time()
+        self._handle = self._loop.call_soon(self._call)
+
+    def _call(self):
+        self._handle = None
+        self._callback(**self._kwargs)
+        if not self.running:
+            return
+        # keep the original phase even if the callback was late.
+        now = self._loop.time()
+        self._next += self._interval
+        if self._next < now:
+            skip = (now - self._next) // self._interval + 1
+            self._next += skip * self._interval
+        self._handle = self._loop.call_at(self._next, self._call)
+
+    def stop(self):
+        self.running = False
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+class Runtime(object):
+    # The asyncio event loop used by interfaces.Monitor.  When the
+    # loop is already running, Monitor.start() returns immediately so
+    # that the monitor can be embedded in an existing application.
+    # With batch_size, up to batch_size datagrams are received and
+    # processed in one go, see udp.BatchReceiver.
+    def __init__(self, loop=None, batch_size=None):
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._servers = []
+        self._owns_loop = False
+        self._batch_size = batch_size
+        self._batch_receiver = None
+        # _readers: the file descriptors added by add_reader()
+        self._readers = []
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def now(self):
+        return self._loop.time()
+
+    def _bind(self, callback, args, kwargs):
+        if kwargs:
+            return lambda: callback(*args, **kwargs)
+        return lambda: callback(*args)
+
+    def call_soon(self, callback, *args, **kwargs):
+        return self._loop.call_soon(self._bind(callback, args, kwargs))
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        return self._loop.call_later(delay,
+                                     self._bind(callback, args, kwargs))
+
+    def looping_call(self, interval, callback, **kwargs):
+        l = _LoopingCall(self._loop, interval, callback, kwargs)
+        l.start()
+        return l
+
+    def new_deferred(self, canceller):
+        fut = self._loop.create_future()
+        def on_done(f):
+            if f.cancelled():
+                canceller()
+        fut.add_done_callback(on_done)
+        return fut
+
+    def resolve(self, fut, result):
+        if not fut.done():
+            fut.set_result(result)
+
+    def reject(self, fut, error):
+        if not fut.done():
+            fut.set_exception(error)
+
+    def add_callbacks(self, fut, callback, errback):
+        def on_done(f):
+            if f.cancelled():
+                errback(asyncio.CancelledError())
+            elif f.exception() is not None:
+                errback(f.exception())
+            else:
+                callback(f.result())
+        fut.add_done_callback(on_done)
+
+    def succeeded(self, result):
+        fut = self._loop.create_future()
+        fut.set_result(result)
+        return fut
+
+    def failed(self, error):
+        fut = self._loop.create_future()
+        fut.set_exception(error)
+        return fut
+
+    def _start_server(self, coro):
+        task = self._loop.create_task(coro)
+        def on_done(t):
+            if t.cancelled():
+                return
+            if t.exception() is not None:
+                self._loop.call_exception_handler({
+                    'message': 'failed to listen',
+                    'exception': t.exception(),
+                    'task': t,
+                })
+                return
+            self._servers.append(t.result()[0])
+        task.add_done_callback(on_done)
+        if not self._loop.is_running():
+            self._loop.run_until_complete(task)
+
+    def new_sender(self, local_addr):
+        return Sender(local_addr)
+
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        if self._batch_size and on_did_receive_batch is not None:
+            self._batch_receiver = udp.BatchReceiver(
+                local_addr, on_did_receive_batch, self._batch_size)
+            self.add_reader(self._batch_receiver.socket,
+                            self._batch_receiver.on_readable)
+            return
+        sock = udp.multicast_socket(local_addr)
+        self._start_server(self._loop.create_datagram_endpoint(
+            lambda: Receiver(local_addr=local_addr,
+                             on_did_receive=on_did_receive),
+            sock=sock))
+
+    def add_reader(self, sock, callback):
+        # call callback whenever sock becomes readable, until stop().
+        fd = sock.fileno()
+        self._loop.add_reader(fd, callback)
+        self._readers.append(fd)
+
+    def listen_shell(self, port):
+        from echonetlite import shellservice
+        async def serve():
+            server = await self._loop.create_server(
+                shellservice.AsyncioShellServer, port=port)
+            return (server, None)
+        self._start_server(serve())
+
+    def run(self):
+        if self._loop.is_running():
+            return
+        self._owns_loop = True
+        try:
+            self._loop.run_forever()
+        finally:
+            self._owns_loop = False
+
+    def stop(self):
+        for server in self._servers:
+            server.close()
+        self._servers = []
+        for fd in self._readers:
+            self._loop.remove_reader(fd)
+        self._readers = []
+        if self._batch_receiver is not None:
+            self._batch_receiver.close()
+            self._batch_receiver = None
+        # an embedding application stops its own loop.
+        if self._owns_loop:
+            self._loop.stop()
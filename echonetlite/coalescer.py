@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import echonetlite
+from echonetlite import edtcodec
+from echonetlite import protocol
+
+# the largest frame expected in reply to merged requests.  An ECHONET
+# Lite frame must fit in one UDP datagram, and OPC is one octet.  The
+# GET_RES carries an EDT for each EPC, so a batch is budgeted on the
+# size of the reply: the EDT size of the codec in edtcodec.registry if
+# it is fixed, UNKNOWN_EDT_LEN otherwise.
+MAX_FRAME_LEN = 1400
+MAX_OPC = 0xff
+UNKNOWN_EDT_LEN = 32
+
+def _reply_len(deoj, epc):
+    # the expected length of EPC, PDC and EDT of epc in the reply.
+    codec = edtcodec.registry.get(deoj, epc)
+    if isinstance(codec, edtcodec.Array):
+        if codec.count is not None:
+            return 2 + codec.size
+    elif isinstance(codec, edtcodec.Scalar):
+        return 2 + codec.size
+    return 2 + UNKNOWN_EDT_LEN
+
+class _Waiter(object):
+    # a request() caller waiting for a part of the merged reply.
+    __slots__ = ('epcs', 'deferred')
+
+    def __init__(self, epcs, deferred):
+        self.epcs = epcs
+        self.deferred = deferred
+
+
+class _Batch(object):
+    # GET requests to one (node, SEOJ, DEOJ) collected in a window.
+    __slots__ = ('key', 'seoj', 'deoj', 'to_node_id', 'epcs', 'reply_len',
+                 'waiters', 'has_sends', 'timeout', 'retries', 'timer',
+                 'deferred')
+
+    def __init__(self, key, seoj, deoj, to_node_id):
+        self.key = key
+        self.seoj = seoj
+        self.deoj = deoj
+        self.to_node_id = to_node_id
+        # epcs: the requested EPCs in order, without duplicates
+        self.epcs = []
+        # reply_len: the expected length of the reply frame
+        self.reply_len = protocol.COMMON_HDR_LEN
+        self.waiters = []
+        # has_sends: set if any of the requests is sent with send()
+        self.has_sends = False
+        self.timeout = 0
+        self.retries = 0
+        self.timer = None
+        # deferred: the merged request once sent, if it has waiters
+        self.deferred = None
+
+    def new_epcs(self, msg):
+        epcs = []
+        for p in msg.properties:
+            if p.epc not in self.epcs and p.epc not in epcs:
+                epcs.append(p.epc)
+        return epcs
+
+    def epcs_reply_len(self, epcs):
+        return sum(_reply_len(self.deoj, epc) for epc in epcs)
+
+    def fits(self, epcs):
+        return (len(self.epcs) + len(epcs) <= MAX_OPC
+                and (self.reply_len + self.epcs_reply_len(epcs)
+                     <= MAX_FRAME_LEN))
+
+
+class GetCoalescer(object):
+    # Merges GET requests sent to the same (node, SEOJ, DEOJ) within
+    # a short window into one multi-property frame.  Replies are
+    # dispatched to listeners per property as usual, and the reply to
+    # each request() caller only contains the properties it asked for.
+    # Enabled with Monitor.enable_coalescing().
+    def __init__(self, monitor, window=0.05):
+        self._monitor = monitor
+        self._window = window
+        # _batches: a dict with key as (to_node_id, int(seoj),
+        # int(deoj)), value as _Batch()
+        self._batches = {}
+
+    def _accepts(self, msg):
+        if msg.esv != protocol.ESV_CODE['GET'] or msg.tid is not None:
+            return False
+        # a GET request carries no EDT.
+        for p in msg.properties:
+            if p.pdc != 0:
+                return False
+        return len(msg.properties) > 0
+
+    def _get_batch(self, msg, to_node_id):
+        key = (to_node_id, int(msg.seoj), int(msg.deoj))
+        batch = self._batches.get(key)
+        epcs = None
+        if batch is not None:
+            epcs = batch.new_epcs(msg)
+            if not batch.fits(epcs):
+                self.flush(batch)
+                batch = None
+        if batch is None:
+            batch = _Batch(key, msg.seoj, msg.deoj, to_node_id)
+            batch.timer = self._monitor.runtime.call_later(
+                self._window, self._on_timer, batch)
+            self._batches[key] = batch
+            epcs = batch.new_epcs(msg)
+        batch.epcs += epcs
+        batch.reply_len += batch.epcs_reply_len(epcs)
+        return batch
+
+    def add_send(self, msg, to_node_id):
+        # returns False if msg must be sent as it is.
+        if not self._accepts(msg):
+            return False
+        batch = self._get_batch(msg, to_node_id)
+        batch.has_sends = True
+        return True
+
+    def add_request(self, msg, to_node_id, timeout, retries):
+        # returns a Deferred for the reply, or None if msg must be sent
+        # as it is.
+        if not self._accepts(msg):
+            return None
+        batch = self._get_batch(msg, to_node_id)
+        # use the longest timeout and retry count of the callers, with
+        # the defaults of the monitor for the ones not given.
+        if timeout is None:
+            timeout = self._monitor.request_timeout
+        if retries is None:
+            retries = self._monitor.request_retries
+        batch.timeout = max(batch.timeout, timeout)
+        batch.retries = max(batch.retries, retries)
+        waiter = _Waiter(frozenset(p.epc for p in msg.properties), None)
+        waiter.deferred = self._monitor.runtime.new_deferred(
+            lambda: self._cancel_waiter(batch, waiter))
+        batch.waiters.append(waiter)
+        return waiter.deferred
+
+    def _cancel_waiter(self, batch, waiter):
+        if waiter not in batch.waiters:
+            return
+        batch.waiters.remove(waiter)
+        if batch.waiters:
+            return
+        # nobody waits for the merged request any more.
+        if batch.deferred is not None:
+            batch.deferred.cancel()
+        elif not batch.has_sends and self._batches.get(batch.key) is batch:
+            del self._batches[batch.key]
+            if batch.timer is not None:
+                batch.timer.cancel()
+            batch.timer = None
+
+    def _on_timer(self, batch):
+        batch.timer = None
+        self.flush(batch)
+
+    def flush(self, batch=None):
+        # send the batch now, or all the batches if batch is None.
+        if batch is None:
+            for batch in list(self._batches.values()):
+                self.flush(batch)
+            return
+        if self._batches.get(batch.key) is not batch:
+            return
+        del self._batches[batch.key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+        batch.timer = None
+
+        msg = protocol.Message(seoj=batch.seoj,
+                               deoj=batch.deoj,
+                               esv=protocol.ESV_CODE['GET'],
+                               properties=[protocol.Property(epc)
+                                           for epc in batch.epcs])
+        msg.opc = len(msg.properties)
+        monitor = self._monitor
+        if not batch.waiters:
+            monitor.send(msg, batch.to_node_id, coalesce=False)
+            return
+        d = monitor.request(msg, batch.to_node_id, batch.timeout,
+                            batch.retries, coalesce=False)
+        batch.deferred = d
+        monitor.runtime.add_callbacks(
+            d,
+            lambda reply: self._on_reply(batch, reply),
+            lambda error: self._on_error(batch, error))
+
+    def _split(self, reply, epcs, esv):
+        props = [p for p in reply.properties if p.epc in epcs]
+        return protocol.Message(tid=reply.tid,
+                                seoj=reply.seoj,
+                                deoj=reply.deoj,
+                                esv=esv,
+                                opc=len(props),
+                                properties=props)
+
+    def _on_reply(self, batch, reply):
+        runtime = self._monitor.runtime
+        for waiter in batch.waiters:
+            runtime.resolve(waiter.deferred,
+                            self._split(reply, waiter.epcs, reply.esv))
+
+    def _on_error(self, batch, error):
+        # an error reply to the merged frame only fails the callers
+        # whose properties were not available.
+        RequestError = echonetlite.interfaces.RequestError
+        runtime = self._monitor.runtime
+        for waiter in batch.waiters:
+            if not isinstance(error, RequestError):
+                runtime.reject(waiter.deferred, error)
+                continue
+            reply = error.msg
+            failed = False
+            for p in reply.properties:
+                if p.epc in waiter.epcs and p.pdc == 0:
+                    failed = True
+                    break
+            if failed:
+                runtime.reject(waiter.deferred, RequestError(
+                    self._split(reply, waiter.epcs, reply.esv)))
+            else:
+                runtime.resolve(waiter.deferred, self._split(
+                    reply, waiter.epcs, protocol.ESV_CODE['GET_RES']))
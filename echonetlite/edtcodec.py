@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Typed codecs of EDT.  A codec declares the layout of the EDT of a
+# property, and is registered for (class group, class, EPC) in a
+# CodecRegistry.  Values are decoded into Python numbers by one
+# struct call per EDT.  If NumPy is installed, array properties and
+# batches of EDTs of one property can be decoded into NumPy arrays
+# without a Python loop per element.
+#
+#   edtcodec.registry.decode(eoj, EPC_TEMPERATURE, edt)       -> 24.0
+#   edtcodec.registry.decode_batch(eoj, EPC_INSTANTENEOUS_ELECTRIC,
+#                                  edts)                      -> ndarray
+
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from echonetlite.protocol import *
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError('NumPy is required to decode into arrays.')
+
+def _as_bytes(edt):
+    if isinstance(edt, (bytes, bytearray, memoryview)):
+        return edt
+    return bytes(edt)
+
+
+class Raw(object):
+    # EDT as it is.
+    def decode(self, edt):
+        return bytes(edt)
+
+    def encode(self, value):
+        return bytes(value)
+
+
+class Map(object):
+    # a property map (0x9d, 0x9e and 0x9f), decoded into a
+    # PropertyMap().  Any iterable of EPCs can be encoded.
+    def decode(self, edt):
+        return PropertyMap.decode(_as_bytes(edt))
+
+    def encode(self, value):
+        return PropertyMap(value).encode()
+
+
+class Scalar(object):
+    # one big endian number of the struct format character fmt.  The
+    # decoded value is multiplied by scale if given, and values in
+    # invalid (e.g. 0x7fff for overflow) are decoded into None.
+    def __init__(self, fmt, scale=None, invalid=()):
+        self._struct = struct.Struct('!' + fmt)
+        self._dtype = '>' + fmt
+        self.size = self._struct.size
+        self.scale = scale
+        # dividing by 10 is exact where multiplying by 0.1 is not.
+        self._divisor = None
+        if scale is not None and 0 < scale < 1:
+            divisor = round(1 / scale)
+            if abs(divisor * scale - 1) < 1e-9:
+                self._divisor = divisor
+        self.invalid = frozenset(invalid)
+
+    def _scaled(self, value):
+        if self._divisor is not None:
+            return value / self._divisor
+        return value * self.scale
+
+    def decode(self, edt):
+        (value,) = self._struct.unpack(_as_bytes(edt))
+        if value in self.invalid:
+            return None
+        if self.scale is not None:
+            return self._scaled(value)
+        return value
+
+    def encode(self, value):
+        if self.scale is not None:
+            value = int(round(value / self.scale))
+        return self._struct.pack(value)
+
+    def _to_array(self, values):
+        # apply scale and invalid to a NumPy array of raw values.
+        if self.scale is None and not self.invalid:
+            return values
+        result = values.astype(numpy.float64)
+        if self.scale is not None:
+            result = self._scaled(result)
+        if self.invalid:
+            result[numpy.isin(values, list(self.invalid))] = numpy.nan
+        return result
+
+    def decode_batch(self, edts):
+        # decode many EDTs into a 1-D array.
+        _require_numpy()
+        data = b''.join(_as_bytes(edt) for edt in edts)
+        return self._to_array(numpy.frombuffer(data, dtype=self._dtype))
+
+
+class Array(Scalar):
+    # count big endian numbers of the struct format character fmt,
+    # following the fields of the struct format header if given.  If
+    # count is None, the elements fill the rest of EDT.  decode()
+    # returns a list of the elements, or a tuple of the header fields
+    # and the list if there is a header.
+    def __init__(self, fmt, count=None, header=None, scale=None,
+                 invalid=()):
+        super(Array, self).__init__(fmt, scale, invalid)
+        self.count = count
+        self._header = None
+        self._header_size = 0
+        if header:
+            self._header = struct.Struct('!' + header)
+            self._header_size = self._header.size
+            self._header_dtype = [('f{0}'.format(i), '>' + f)
+                                  for (i, f) in enumerate(header)]
+        self._element_size = self.size
+        if count is not None:
+            self.size = self._header_size + count * self._element_size
+        self._structs = {}
+
+    def _elements_struct(self, count):
+        s = self._structs.get(count)
+        if s is None:
+            s = struct.Struct('!{0}{1}'.format(count, self._dtype[1:]))
+            self._structs[count] = s
+        return s
+
+    def _count(self, length):
+        if self.count is not None:
+            return self.count
+        return (length - self._header_size) // self._element_size
+
+    def _scale_list(self, values):
+        invalid = self.invalid
+        if invalid:
+            values = [None if v in invalid else v for v in values]
+        if self.scale is not None:
+            scaled = self._scaled
+            values = [None if v is None else scaled(v) for v in values]
+        return values
+
+    def decode(self, edt):
+        edt = _as_bytes(edt)
+        count = self._count(len(edt))
+        values = self._elements_struct(count).unpack_from(
+            edt, self._header_size)
+        values = self._scale_list(list(values))
+        if self._header is None:
+            return values
+        return (self._header.unpack_from(edt), values)
+
+    def encode(self, value):
+        if self._header is not None:
+            (header, values) = value
+        else:
+            values = value
+        if self.scale is not None:
+            values = [int(round(v / self.scale)) for v in values]
+        data = self._elements_struct(len(values)).pack(*values)
+        if self._header is not None:
+            data = self._header.pack(*header) + data
+        return data
+
+    def decode_array(self, edt):
+        # decode one EDT into a 1-D array of the elements, preceded by
+        # the header fields as in decode().
+        _require_numpy()
+        edt = _as_bytes(edt)
+        count = self._count(len(edt))
+        values = self._to_array(numpy.frombuffer(
+            edt, dtype=self._dtype, count=count, offset=self._header_size))
+        if self._header is None:
+            return values
+        return (self._header.unpack_from(edt), values)
+
+    def decode_batch(self, edts):
+        # decode EDTs of the same length into a 2-D array with a row
+        # for each EDT, preceded by a structured array of the header
+        # fields if there is a header.
+        _require_numpy()
+        edts = [_as_bytes(edt) for edt in edts]
+        length = len(edts[0]) if edts else self._header_size
+        count = self._count(length)
+        fields = [('values', self._dtype, (count,))]
+        if self._header is not None:
+            fields = self._header_dtype + fields
+        records = numpy.frombuffer(b''.join(edts), dtype=numpy.dtype(fields))
+        values = self._to_array(records['values'])
+        if self._header is None:
+            return values
+        return (records[[name for (name, _) in self._header_dtype]], values)
+
+
+class CodecRegistry(object):
+    # Codecs keyed by (class group, class, EPC).  Codecs registered
+    # with clsgrp and cls of None apply to the EPC of any class, such
+    # as the properties of the device object super class.
+    def __init__(self):
+        # _codecs: a dict with key as (grpcls, EPC), where grpcls is
+        # (clsgrp << 8 | cls) or None, value as a codec
+        self._codecs = {}
+
+    def register(self, clsgrp, cls, epc, codec):
+        if clsgrp is None:
+            grpcls = None
+        else:
+            grpcls = clsgrp << 8 | cls
+        self._codecs[(grpcls, epc)] = codec
+
+    def get(self, eoj, epc):
+        # returns the codec for EPC of eoj, or None.
+        codec = self._codecs.get((int(eoj) >> 8, epc))
+        if codec is None:
+            codec = self._codecs.get((None, epc))
+        return codec
+
+    def _get(self, eoj, epc):
+        codec = self.get(eoj, epc)
+        if codec is None:
+            raise KeyError('no codec for EPC {0:#04x} of {1}'.format(
+                epc, eoj))
+        return codec
+
+    def decode(self, eoj, epc, edt):
+        return self._get(eoj, epc).decode(edt)
+
+    def decode_property(self, eoj, prop):
+        return self._get(eoj, prop.epc).decode(prop.edt)
+
+    def encode(self, eoj, epc, value):
+        return self._get(eoj, epc).encode(value)
+
+    def decode_batch(self, eoj, epc, edts):
+        return self._get(eoj, epc).decode_batch(edts)
+
+
+# the codecs of the properties defined in the protocol module
+registry = CodecRegistry()
+
+# the super class
+registry.register(None, None, EPC_OPERATING_STATUS, Scalar('B'))
+registry.register(None, None, EPC_INSTALLATION_LOCATION, Scalar('B'))
+registry.register(None, None, EPC_VERSION_INFORMATION, Raw())
+registry.register(None, None, EPC_IDENTIFICATION_NUMBER, Raw())
+registry.register(None, None, EPC_FAULT_STATUS, Scalar('B'))
+registry.register(None, None, EPC_MANUFACTURE_CODE, Raw())
+registry.register(None, None, EPC_STATUS_CHANGE_PROPERTY_MAP, Map())
+registry.register(None, None, EPC_SET_PROPERTY_MAP, Map())
+registry.register(None, None, EPC_GET_PROPERTY_MAP, Map())
+
+# temperature sensor, in degrees Celsius from -273.2 (0xf554) to
+# 3276.6 (0x7ffe); 0x7fff is for overflow and 0x8000 for underflow.
+registry.register(CLSGRP_CODE['SENSOR'], CLS_SE_CODE['TEMPERATURE'],
+                  EPC_TEMPERATURE,
+                  Scalar('h', scale=0.1, invalid=(0x7fff, -0x8000)))
+
+# low-voltage smart electric energy meter
+_METER = (CLSGRP_CODE['HOUSING_FACILITIES'],
+          CLS_HF_CODE['LV_ELECTRIC_ENERGY_METER'])
+# the multiplier of the cumulative amounts in kWh for each unit code
+ELECTRIC_UNITS = {
+    0x00: 1, 0x01: 0.1, 0x02: 0.01, 0x03: 0.001, 0x04: 0.0001,
+    0x0a: 10, 0x0b: 100, 0x0c: 1000, 0x0d: 10000,
+}
+registry.register(*_METER, EPC_CUMULATIVE_NORMAL, Scalar('I'))
+registry.register(*_METER, EPC_ELECTRIC_UNIT, Scalar('B'))
+# the day of the history, followed by 48 half-hourly cumulative
+# amounts; 0xfffffffe is for no data.
+registry.register(*_METER, EPC_HISTORICAL_CUMULATIVE_NORMAL,
+                  Array('I', count=48, header='H', invalid=(0xfffffffe,)))
+# in watts, from -2147483647 (0x80000001) to 2147483645 (0x7ffffffd);
+# 0x7ffffffe is for no data, 0x7fffffff for overflow and 0x80000000
+# for underflow.
+registry.register(*_METER, EPC_INSTANTENEOUS_ELECTRIC,
+                  Scalar('i', invalid=(0x7ffffffe, 0x7fffffff, -0x80000000)))
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Recent history of received property values.  Each (node, EOJ, EPC)
+# has a Series, a ring buffer of fixed capacity with a timestamp
+# column and a value column in one flat buffer, so that memory does
+# not grow with time and no object is kept per sample.  Values with
+# a numeric codec in edtcodec.registry are stored as float64 (NaN for
+# no data), others as raw EDT in fixed size slots.  The buffers are
+# bytearrays, or memory mapped files if a directory is given.
+# Enabled with Monitor.enable_history().
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import time
+
+from echonetlite import edtcodec
+
+KIND_NUMERIC = 0
+KIND_RAW = 1
+
+# magic, version, kind, raw slot size, capacity, head, count
+_HEADER = struct.Struct('<4sBBHIII')
+_HEADER_LEN = 32
+_MAGIC = b'ELTS'
+_VERSION = 1
+
+def _buffer_len(kind, capacity, size):
+    if kind == KIND_NUMERIC:
+        return _HEADER_LEN + capacity * 16
+    return _HEADER_LEN + capacity * (8 + 2 + size)
+
+
+class Series(object):
+    # a ring buffer of (timestamp, value) of one property.
+    def __init__(self, kind, capacity, size=0, path=None):
+        self.kind = kind
+        self.path = path
+        self._file = None
+        if path is not None and os.path.exists(path):
+            self._open(path)
+        else:
+            self.capacity = capacity
+            self.size = size
+            self._head = 0
+            self._count = 0
+            length = _buffer_len(kind, capacity, size)
+            if path is not None:
+                with open(path, 'wb') as f:
+                    f.truncate(length)
+                self._file = open(path, 'r+b')
+                self._buffer = mmap.mmap(self._file.fileno(), length)
+            else:
+                self._buffer = bytearray(length)
+            self._write_header()
+        self._map_columns()
+
+    def _open(self, path):
+        self._file = open(path, 'r+b')
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0)
+        except ValueError:
+            # an empty file cannot be mapped.
+            self._file.close()
+            self._file = None
+            raise ValueError('{0} is not a compatible series file.'.format(
+                path))
+        if len(self._buffer) < _HEADER_LEN:
+            self.close()
+            raise ValueError('{0} is not a compatible series file.'.format(
+                path))
+        (magic, version, kind, size, capacity, head, count) = (
+            _HEADER.unpack_from(self._buffer))
+        if (magic != _MAGIC or version != _VERSION or kind != self.kind
+            or len(self._buffer) != _buffer_len(kind, capacity, size)):
+            self.close()
+            raise ValueError('{0} is not a compatible series file.'.format(
+                path))
+        self.capacity = capacity
+        self.size = size
+        self._head = head
+        self._count = count
+
+    def _map_columns(self):
+        view = memoryview(self._buffer)
+        capacity = self.capacity
+        offset = _HEADER_LEN
+        self._timestamps = view[offset:offset + capacity * 8].cast('d')
+        offset += capacity * 8
+        if self.kind == KIND_NUMERIC:
+            self._values = view[offset:offset + capacity * 8].cast('d')
+        else:
+            self._lengths = view[offset:offset + capacity * 2].cast('H')
+            offset += capacity * 2
+            self._data = view[offset:offset + capacity * self.size]
+
+    def _write_header(self):
+        _HEADER.pack_into(self._buffer, 0, _MAGIC, _VERSION, self.kind,
+                          self.size, self.capacity, self._head, self._count)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        # value is a number for a numeric series (None for no data),
+        # EDT otherwise, truncated to the slot size.
+        i = self._head
+        self._timestamps[i] = timestamp
+        if self.kind == KIND_NUMERIC:
+            self._values[i] = float('nan') if value is None else value
+        else:
+            n = min(len(value), self.size)
+            self._lengths[i] = n
+            offset = i * self.size
+            self._data[offset:offset + n] = value[:n]
+        self._head = (i + 1) % self.capacity
+        if self._count < self.capacity:
+            self._count += 1
+        self._write_header()
+
+    def _ranges(self):
+        # the (start, end) index ranges of the samples, oldest first.
+        if self._count < self.capacity:
+            return [(0, self._count)]
+        return [(self._head, self.capacity), (0, self._head)]
+
+    def _column(self, column):
+        a = array.array(column.format)
+        for (start, end) in self._ranges():
+            a.frombytes(column[start:end].cast('B'))
+        return a
+
+    def timestamps(self):
+        # returns an array('d') of the timestamps, oldest first.
+        return self._column(self._timestamps)
+
+    def values(self):
+        # returns an array('d') of the values of a numeric series, or a
+        # list of EDTs, oldest first.
+        if self.kind == KIND_NUMERIC:
+            return self._column(self._values)
+        size = self.size
+        data = self._data
+        lengths = self._lengths
+        return [bytes(data[i * size:i * size + lengths[i]])
+                for (start, end) in self._ranges()
+                for i in range(start, end)]
+
+    def since(self, timestamp):
+        # returns (timestamps, values) of the samples at or after
+        # timestamp.  Timestamps are assumed to be increasing.
+        timestamps = self.timestamps()
+        i = bisect.bisect_left(timestamps, timestamp)
+        return (timestamps[i:], self.values()[i:])
+
+    def latest(self):
+        # returns (timestamp, value) of the last sample, or None.
+        if self._count == 0:
+            return None
+        i = (self._head - 1) % self.capacity
+        if self.kind == KIND_NUMERIC:
+            return (self._timestamps[i], self._values[i])
+        offset = i * self.size
+        return (self._timestamps[i],
+                bytes(self._data[offset:offset + self._lengths[i]]))
+
+    def flush(self):
+        if self._file is not None:
+            self._buffer.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self._timestamps = self._values = None
+        self._lengths = self._data = None
+        self._buffer.close()
+        self._file.close()
+        self._file = None
+
+
+class HistoryStore(object):
+    # Series of received property values keyed by (node_id, EOJ, EPC).
+    # Each series holds the last capacity samples, and at most
+    # max_series series are created.  EDTs without a numeric codec
+    # are stored in slots of raw_size bytes.  If directory is given,
+    # each series is a memory mapped file there and is reopened on
+    # the next start.
+    def __init__(self, capacity=1024, max_series=10000, raw_size=32,
+                 directory=None, clock=time.time):
+        self.capacity = capacity
+        self.max_series = max_series
+        self.raw_size = raw_size
+        self.directory = directory
+        self.clock = clock
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        # _series: a dict with key as (node_id, int(eoj), EPC), value
+        # as Series()
+        self._series = {}
+        # samples dropped since max_series was reached
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._series)
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        (node_id, eoj, epc) = key
+        name = '{0}_{1:06x}_{2:02x}.ts'.format(
+            str(node_id).replace(':', '-').replace('/', '-'), eoj, epc)
+        return os.path.join(self.directory, name)
+
+    def _kind(self, eoj, epc):
+        codec = edtcodec.registry.get(eoj, epc)
+        if (isinstance(codec, edtcodec.Scalar)
+            and not isinstance(codec, edtcodec.Array)):
+            return KIND_NUMERIC
+        return KIND_RAW
+
+    def track(self, node_id, eoj, epc, capacity=None, raw_size=None):
+        # returns the series of the property, created with capacity
+        # and raw_size if it does not exist.
+        key = (node_id, int(eoj), epc)
+        series = self._series.get(key)
+        if series is None:
+            kind = self._kind(eoj, epc)
+            path = self._path(key)
+            args = (kind, capacity or self.capacity,
+                    raw_size or self.raw_size)
+            try:
+                series = Series(*args, path=path)
+            except ValueError as e:
+                # start over if the file was written with another
+                # layout, keeping the old file as path + '.bad'.
+                print('{0} Moved to {1}.bad.'.format(e, path))
+                os.replace(path, path + '.bad')
+                series = Series(*args, path=path)
+            self._series[key] = series
+        return series
+
+    def get(self, node_id, eoj, epc):
+        # returns the series of the property, or None.
+        key = (node_id, int(eoj), epc)
+        series = self._series.get(key)
+        if series is None:
+            path = self._path(key)
+            if path is not None and os.path.exists(path):
+                series = self.track(node_id, eoj, epc)
+        return series
+
+    def record(self, node_id, eoj, props, timestamp=None):
+        # append the values of props (Property()s) sent by eoj.
+        if timestamp is None:
+            timestamp = self.clock()
+        for p in props:
+            if p.pdc == 0:
+                continue
+            key = (node_id, int(eoj), p.epc)
+            series = self._series.get(key)
+            if series is None:
+                if len(self._series) >= self.max_series:
+                    self.dropped += 1
+                    continue
+                series = self.track(node_id, eoj, p.epc)
+            if series.kind == KIND_NUMERIC:
+                codec = edtcodec.registry.get(eoj, p.epc)
+                try:
+                    value = codec.decode(p.edt)
+                except struct.error:
+                    value = None
+            else:
+                value = p.edt
+            series.append(timestamp, value)
+
+    def flush(self):
+        for series in self._series.values():
+            series.flush()
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
+        self._series = {}
@@ -1,57 +1,183 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from twisted.internet import reactor
-from twisted.internet import task
-from twisted.internet.protocol import Factory
+import collections
+import importlib
+import time
 
-from echonetlite import shellservice
-from echonetlite import ipv4adapter
+from echonetlite import coalescer
+from echonetlite import history
+from echonetlite import metrics
 from echonetlite import middleware
+from echonetlite import poller
 from echonetlite import protocol
+from echonetlite import sendqueue
+from echonetlite import topology
+
+# the adapter used unless Monitor.set_adapter() is called.  It is
+# imported when the runtime is first needed, so that the Twisted
+# reactor is not installed when another adapter is selected.
+DEFAULT_ADAPTER = 'echonetlite.ipv4adapter'
+
+def _esv_label(esv):
+    if esv in protocol.ESV_DESC:
+        return protocol.ESV_DESC[esv]
+    return '{0:#04x}'.format(esv)
+
 
 class MessageListener(object):
     def __init__(self, monitor):
         self._monitor = monitor
 
     def on_did_receive(self, msg, from_node):
-        # find devices registered in this node
+        # find devices registered in this node that the message is
+        # destined to.  A DEOJ with instance code 0 is delivered to all
+        # the instances of the class.
         self_node = self._monitor.get_self_node()
-        device = None
-        # deliver the message to self devices
-        # (XXX need to handel instance_id == 0)
-        for d in self_node.devices.values():
-            if msg.deoj == d.eoj:
-                device = d
-                break
-            if (msg.deoj.is_clsgrp(d.eoj.clsgrp)
-                and msg.deoj.is_cls(d.eoj.cls)
-                and msg.deoj.is_all_instance):
-                device = d
-                break
-        if device is None:
-            print('not ours: ', msg)
+        devices = self_node.get_destination_devices(msg.deoj)
+        stats = self._monitor.metrics
+        if not devices:
+            stats.not_ours.inc()
             return
 
         # call device default message receivers
-        if msg.esv in protocol.ESV_REQUEST_CODES:
-            device.on_did_receive_request(msg, from_node)
-        if msg.esv in protocol.ESV_RESPONSE_CODES:
-            device.on_did_receive_response(msg, from_node)
-        if msg.esv in protocol.ESV_ERROR_CODES:
-            device.on_did_receive_error(msg, from_node)
+        started = time.perf_counter()
+        esv = msg.esv
+        for device in devices:
+            if esv in protocol.ESV_REQUEST_CODES:
+                device.on_did_receive_request(msg, from_node)
+            if esv in protocol.ESV_RESPONSE_CODES:
+                device.on_did_receive_response(msg, from_node)
+            if esv in protocol.ESV_ERROR_CODES:
+                device.on_did_receive_error(msg, from_node)
+        stats.stage_seconds.observe(time.perf_counter() - started,
+                                    ('dispatch',))
 
         # call user defined listeners
-        for device in self._monitor.nodes[from_node.node_id].devices.values():
-            key_grpcls = msg.seoj.clsgrp << 16 | msg.seoj.cls << 8
-            for prop in msg.properties:
-                key = key_grpcls | prop.epc
-                if key in device.listeners:
-                    device.listeners[key](from_node.node_id,
-                                          msg.seoj,
-                                          device,
-                                          msg.esv,
-                                          prop)
+        from_node_id = from_node.node_id
+        seoj = msg.seoj
+        from_device = from_node.get_device(seoj)
+        device_listeners = None
+        if from_device is not None and from_device.listeners:
+            device_listeners = from_device.listeners
+        tables = self._monitor.listener_index.match(from_node_id, seoj)
+        if device_listeners is None and not tables:
+            return
+        started = time.perf_counter()
+        key_grpcls = int(seoj) & 0xffff00
+        for prop in msg.properties:
+            if device_listeners is not None:
+                listener = device_listeners.get(key_grpcls | prop.epc)
+                if listener is not None:
+                    listener(from_node_id, seoj, from_device, esv, prop)
+            for table in tables:
+                for listener in table.get(prop.epc, ()):
+                    listener(from_node_id, seoj, from_device, esv, prop)
+                for listener in table.get(None, ()):
+                    listener(from_node_id, seoj, from_device, esv, prop)
+        stats.stage_seconds.observe(time.perf_counter() - started,
+                                    ('listeners',))
+
+
+class ListenerIndex(object):
+    # An index of user listeners keyed by (node_id, SEOJ, EPC).  Each
+    # of the keys can be None to match any value, and an SEOJ with
+    # instance code 0 matches all the instances of the class.
+    def __init__(self):
+        # _tables: a dict with key as (node_id, int(eoj)), value as a
+        # dict with key as EPC, value as a list of listeners
+        self._tables = {}
+
+    def add(self, listener, node_id=None, eoj=None, epc=None):
+        if eoj is not None:
+            eoj = int(eoj)
+        table = self._tables.setdefault((node_id, eoj), {})
+        table.setdefault(epc, []).append(listener)
+
+    def remove(self, listener, node_id=None, eoj=None, epc=None):
+        if eoj is not None:
+            eoj = int(eoj)
+        table = self._tables.get((node_id, eoj))
+        if table is None or listener not in table.get(epc, ()):
+            return
+        listeners = table[epc]
+        listeners.remove(listener)
+        if not listeners:
+            del table[epc]
+        if not table:
+            del self._tables[(node_id, eoj)]
+
+    def match(self, node_id, seoj):
+        # return the listener tables applicable to messages sent by
+        # seoj on node_id.
+        tables = self._tables
+        if not tables:
+            return ()
+        eoj = int(seoj)
+        eoj_all = eoj & 0xffff00 | protocol.INSTANCE_ALL
+        if eoj == eoj_all:
+            eojs = (eoj, None)
+        else:
+            eojs = (eoj, eoj_all, None)
+        matched = []
+        for n in (node_id, None):
+            for e in eojs:
+                table = tables.get((n, e))
+                if table is not None:
+                    matched.append(table)
+        return matched
+
+
+# ESV codes of the messages whose EDTs update RemoteDevice caches
+_CACHED_ESV_CODES = (
+    protocol.ESV_CODE['GET_RES'],
+    protocol.ESV_CODE['GET_SNA'],
+    protocol.ESV_CODE['INF'],
+    protocol.ESV_CODE['INFC'],
+)
+
+# ESV codes of the messages announcing properties
+_ANNOUNCEMENT_ESV_CODES = (
+    protocol.ESV_CODE['INF'],
+    protocol.ESV_CODE['INFC'],
+)
+
+
+class RequestError(Exception):
+    # raised when a request is answered with an error (*_SNA) reply.
+    def __init__(self, msg):
+        super(RequestError, self).__init__(str(msg))
+        self.msg = msg
+
+
+class RequestTimeoutError(Exception):
+    pass
+
+
+class _Request(object):
+    # an in-flight request waiting for the reply with the same TID.
+    __slots__ = ('msg', 'to_node_id', 'reply_esvs', 'deferred',
+                 'timeout', 'retries', 'timer', 'sent_at')
+
+    def __init__(self, msg, to_node_id, timeout, retries):
+        self.msg = msg
+        self.to_node_id = to_node_id
+        self.reply_esvs = protocol.ESV_REPLY_CODES.get(msg.esv, ())
+        self.deferred = None
+        self.timeout = timeout
+        self.retries = retries
+        self.timer = None
+        self.sent_at = None
+
+    def matches(self, msg, from_node_id):
+        if msg.esv not in self.reply_esvs:
+            return False
+        if self.to_node_id is not None and self.to_node_id != from_node_id:
+            return False
+        deoj = int(self.msg.deoj)
+        if deoj & 0xff == protocol.INSTANCE_ALL:
+            return int(msg.seoj) & 0xffff00 == deoj
+        return int(msg.seoj) == deoj
 
 
 class Monitor(object):
@@ -60,19 +186,88 @@ class Monitor(object):
         self._node_id = None
         # _nodes: a dict with key as _node_id, value as middleware.Node()
         self._nodes = {}
-        # _loopingcalls: a list of twisted.internet.task.LoopingCall()
+        # _last_seen: an OrderedDict with key as node_id of a remote
+        # node, value as the time when a message was last received
+        # from it, least recently seen first
+        self._last_seen = collections.OrderedDict()
+        # the limits of the remote nodes kept in _nodes.  See
+        # set_node_limits().
+        self.max_nodes = None
+        self.node_max_idle = None
+        self.node_min_idle = 0
+        self._aging_timer = None
+        # _eviction_listeners: functions called with (node_id, Node())
+        # when a remote node is forgotten
+        self._eviction_listeners = []
+        # _adapter: an adapter module (ipv4adapter, asyncioadapter),
+        # DEFAULT_ADAPTER if None when the runtime is first used
+        self._adapter = None
+        # _runtime: the event loop of the adapter, adapter.Runtime()
+        self._runtime = None
+        # _loopingcalls: a list of looping calls created by _runtime
         self._loopingcalls = []
         # _lister: a MessageLister()
         self._listener = MessageListener(self)
-        # sender: adapter.Sender()
+        # _listener_index: a ListenerIndex() of user listeners
+        self._listener_index = ListenerIndex()
+        # metrics: a metrics.Metrics() of runtime statistics
+        self.metrics = metrics.Metrics()
+        # sender: adapter.Sender() created by _runtime.new_sender()
         self.sender = None
+        # _send_queue: a sendqueue.SendQueue() of outgoing datagrams
+        self._send_queue = sendqueue.SendQueue(self)
         # _tid: transaction id
         self._tid = 0
+        # _requests: a dict with key as TID, value as _Request()
+        self._requests = {}
+        # default timeout in seconds and retry count of request()
+        self.request_timeout = 5
+        self.request_retries = 2
+        # coalescer: a coalescer.GetCoalescer() if enabled
+        self.coalescer = None
+        # _poller: a poller.Poller() created when first used
+        self._poller = None
+        # history: a history.HistoryStore() of received values if
+        # enabled
+        self.history = None
+        # the path and the save interval in seconds of the topology
+        # snapshot if enabled
+        self._snapshot_path = None
+        self._snapshot_interval = None
+        # discovery_enabled: False to stop the node profile from
+        # multicasting discovery requests
+        self.discovery_enabled = True
+        # node_filter: a function returning True for the remote nodes
+        # handled by this monitor, when the nodes are shared with other
+        # processes (see sharding), or None for all the nodes.  Only
+        # those nodes are restored from a snapshot.
+        self.node_filter = None
+        # _topology_listeners: functions called with (node_id, instance
+        # list EDT) when the objects of a remote node change, and with
+        # (node_id, None) when the node is forgotten.  The EDT is in the
+        # form of 0xd6 but lists all the known objects.
+        self._topology_listeners = []
+
+    @property
+    def node_id(self):
+        return self._node_id
 
     @property
     def nodes(self):
         return self._nodes
 
+    @property
+    def listener_index(self):
+        return self._listener_index
+
+    def add_listener(self, listener, node_id=None, eoj=None, epc=None):
+        # listener(from_node_id, from_eoj, from_device, esv, prop) is
+        # called for each property received from the matching source.
+        self._listener_index.add(listener, node_id, eoj, epc)
+
+    def remove_listener(self, listener, node_id=None, eoj=None, epc=None):
+        self._listener_index.remove(listener, node_id, eoj, epc)
+
     def get_self_node(self):
         assert(self._node_id in self._nodes)
         return self._nodes[self._node_id]
@@ -82,50 +277,408 @@ class Monitor(object):
             return self._nodes[node_id]
         return None
 
-    def start(self, node_id, devices, adapter=ipv4adapter):
+    def last_seen(self, node_id):
+        # returns the time when a message was last received from the
+        # remote node, or None.
+        return self._last_seen.get(node_id)
+
+    def set_node_limits(self, max_nodes=None, max_idle=None, min_idle=0):
+        # bound the table of remote nodes.  A node not heard from for
+        # max_idle seconds is forgotten.  When max_nodes remote nodes
+        # are known, a new node replaces the least recently seen one
+        # if that has been idle for min_idle seconds, and is ignored
+        # otherwise.  None means no limit.
+        self.max_nodes = max_nodes
+        self.node_max_idle = max_idle
+        self.node_min_idle = min_idle
+        if self._aging_timer is not None:
+            self._aging_timer.cancel()
+            self._aging_timer = None
+        if max_idle is not None:
+            self._aging_timer = self.schedule_call(max_idle, self._age_nodes)
+        if max_nodes is not None:
+            while len(self._last_seen) > max_nodes:
+                self._evict(next(iter(self._last_seen)), 'full')
+
+    def add_eviction_listener(self, listener):
+        # listener(node_id, node) is called when a remote node is
+        # forgotten, to release the state kept for it.
+        self._eviction_listeners.append(listener)
+
+    def remove_eviction_listener(self, listener):
+        self._eviction_listeners.remove(listener)
+
+    def add_node(self, node_id):
+        # returns the Node() of node_id, added if it is not known, or
+        # None if the node table is full of recently seen nodes.
+        node = self._nodes.get(node_id)
+        if node is not None:
+            return node
+        if node_id != self._node_id:
+            last_seen = self._last_seen
+            now = self.runtime.now()
+            if self.max_nodes is not None and len(last_seen) >= self.max_nodes:
+                (oldest, seen) = next(iter(last_seen.items()))
+                if now - seen < self.node_min_idle:
+                    self.metrics.nodes_rejected.inc()
+                    return None
+                self._evict(oldest, 'full')
+            last_seen[node_id] = now
+        node = middleware.Node(node_id, {})
+        self._nodes[node_id] = node
+        return node
+
+    def forget_node(self, node_id):
+        # remove a remote node with the state kept for it, and tell the
+        # eviction and topology listeners.
+        if node_id == self._node_id:
+            return
+        node = self._nodes.pop(node_id, None)
+        self._last_seen.pop(node_id, None)
+        if node is None:
+            return
+        self_node = self._nodes.get(self._node_id)
+        if self_node is not None:
+            profile = self_node.get_profile()
+            if isinstance(profile, middleware.NodeProfile):
+                profile.forget_node(node_id)
+        if self._poller is not None:
+            self._poller.remove_node(node_id)
+        # in-flight requests to the node are not retried any more.
+        for req in [req for req in self._requests.values()
+                    if req.to_node_id == node_id]:
+            self._cancel_request(req)
+            self.runtime.reject(req.deferred, RequestTimeoutError(
+                'node {0} forgotten.'.format(node_id)))
+        self.metrics.node_request_latency.remove((node_id,))
+        for listener in self._eviction_listeners:
+            listener(node_id, node)
+        self.notify_topology(node_id, None)
+
+    def _evict(self, node_id, reason):
+        self.metrics.nodes_evicted.inc((reason,))
+        self.forget_node(node_id)
+
+    def _age_nodes(self):
+        self._aging_timer = None
+        max_idle = self.node_max_idle
+        if max_idle is None:
+            return
+        now = self.runtime.now()
+        last_seen = self._last_seen
+        while last_seen:
+            (node_id, seen) = next(iter(last_seen.items()))
+            if now - seen < max_idle:
+                break
+            self._evict(node_id, 'idle')
+        # check again when the least recently seen node expires.
+        delay = max_idle
+        if last_seen:
+            delay = next(iter(last_seen.values())) + max_idle - now
+        self._aging_timer = self.schedule_call(max(delay, 1),
+                                               self._age_nodes)
+
+    @property
+    def runtime(self):
+        if self._runtime is None:
+            self.set_adapter(importlib.import_module(DEFAULT_ADAPTER))
+        return self._runtime
+
+    @property
+    def poller(self):
+        if self._poller is None:
+            self._poller = poller.Poller(self)
+        return self._poller
+
+    @property
+    def send_queue(self):
+        return self._send_queue
+
+    def set_send_pacing(self, rate=None, burst=1,
+                        destination_rate=None, destination_burst=1):
+        # limit the packets per second sent in total and to each
+        # destination node.  None means no limit.
+        self._send_queue.set_pacing(rate, burst,
+                                    destination_rate, destination_burst)
+
+    def set_adapter(self, adapter, **kwargs):
+        # switch the network adapter and its event loop.  This must be
+        # called before creating any devices, since they schedule
+        # calls on the event loop when created.
+        # e.g. monitor.set_adapter(asyncioadapter, loop=loop)
+        self._adapter = adapter
+        self._runtime = adapter.Runtime(**kwargs)
+
+    def start(self, node_id, devices, adapter=None, shell_port=3611):
+        if adapter is not None and adapter is not self._adapter:
+            self.set_adapter(adapter)
+        adapter = self._adapter
         self._node_id = node_id
-        self.sender = adapter.Sender(local_addr=node_id)
+        self.sender = self.runtime.new_sender(node_id)
         self_node = middleware.Node(node_id, devices)
-        self_node.get_profile().update_device_numbers(devices)
         self._nodes[node_id] = self_node
-        reactor.listenMulticast(adapter.echonet_lite_port,
-                                adapter.Receiver(
-                                    local_addr=node_id,
-                                    on_did_receive=self.on_did_receive),
-                                listenMultiple=True)
-        f = Factory()
-        f.protocol = shellservice.ShellServer
-        reactor.listenTCP(3611, f)
-        reactor.run()
+        if self._snapshot_path is not None:
+            self._restore_snapshot()
+        self.runtime.listen(node_id, self.on_did_receive,
+                             self.on_did_receive_batch)
+        if shell_port is not None:
+            self.runtime.listen_shell(shell_port)
+        # blocks while the event loop runs, unless an already running
+        # asyncio loop is used.
+        self.runtime.run()
+
+    def stop(self):
+        for l in self._loopingcalls:
+            if l.running:
+                l.stop()
+        self._loopingcalls = []
+        if self.history is not None:
+            self.history.flush()
+        self.save_snapshot()
+        self.runtime.stop()
 
     def on_did_receive(self, data, from_node_id):
-        msg = protocol.decode(data)
-        if msg is None:
+        stats = self.metrics
+        stats.packets_in.inc()
+        stats.bytes_in.inc(value=len(data))
+        try:
+            msg = protocol.decode(data)
+        except protocol.DecodeError:
+            stats.decode_failures.inc()
             return
+        self._process(msg, from_node_id)
+
+    def on_did_receive_batch(self, batch):
+        # process a list of (data, from_node_id) received together.
+        # All the datagrams are decoded first, and the counters are
+        # updated once for the batch.
+        stats = self.metrics
+        stats.packets_in.inc(value=len(batch))
+        stats.bytes_in.inc(value=sum(len(data) for (data, _) in batch))
+        decode = protocol.decode
+        decoded = []
+        failures = 0
+        for (data, from_node_id) in batch:
+            try:
+                decoded.append((decode(data), from_node_id))
+            except protocol.DecodeError:
+                failures += 1
+        if failures:
+            stats.decode_failures.inc(value=failures)
+        for (msg, from_node_id) in decoded:
+            self._process(msg, from_node_id)
+
+    def _process(self, msg, from_node_id):
+        self.metrics.messages_in.inc((_esv_label(msg.esv),))
+        now = self.runtime.now()
         # add a Node instance if from_node_id is not in the _nodes dict.
-        if from_node_id not in self._nodes:
-            n = middleware.Node(from_node_id, {})
-            self._nodes[from_node_id] = n
+        node = self._nodes.get(from_node_id)
+        if node is None:
+            node = self.add_node(from_node_id)
+            if node is None:
+                return
+        if from_node_id != self._node_id:
+            self._last_seen[from_node_id] = now
+            self._last_seen.move_to_end(from_node_id)
+        # update the property cache of the sending device.
+        from_device = node.get_device(msg.seoj)
+        if isinstance(from_device, middleware.RemoteDevice):
+            if msg.esv in _CACHED_ESV_CODES:
+                from_device.update_properties(msg.properties, now)
+            elif msg.esv == protocol.ESV_CODE['SET_RES']:
+                # the values have been changed by us.
+                from_device.invalidate_properties(
+                    [p.epc for p in msg.properties])
+        if (self.history is not None and msg.esv in _CACHED_ESV_CODES
+            and from_node_id != self._node_id):
+            self.history.record(from_node_id, msg.seoj, msg.properties)
+        # let the node profile discover objects from announcements.
+        if (msg.esv in _ANNOUNCEMENT_ESV_CODES
+            and from_node_id != self._node_id):
+            profile = self.get_self_node().get_profile()
+            if profile is not None:
+                profile.on_did_receive_announcement(msg, node)
+        # complete the request waiting for this reply, if any.
+        if self._requests:
+            req = self._requests.get(msg.tid)
+            if req is not None and req.matches(msg, from_node_id):
+                self._complete_request(req, msg, from_node_id)
         # deliver the received message to listeners.
-        self._listener.on_did_receive(msg, self._nodes[from_node_id])
+        self._listener.on_did_receive(msg, node)
+
+    def _next_tid(self):
+        tid = self._tid
+        # skip TIDs still used by in-flight requests.
+        while tid in self._requests:
+            tid = (tid + 1) % 0xffff
+        self._tid = (tid + 1) % 0xffff
+        return tid
+
+    def enable_coalescing(self, window=0.05):
+        # merge GET requests to the same object sent within window
+        # seconds into one frame.
+        self.coalescer = coalescer.GetCoalescer(self, window)
+
+    def enable_history(self, **kwargs):
+        # keep the recent values received from other nodes.  kwargs
+        # are passed to history.HistoryStore().
+        if self.history is not None:
+            self.history.close()
+        self.history = history.HistoryStore(**kwargs)
+        return self.history
+
+    def disable_history(self):
+        if self.history is not None:
+            self.history.close()
+        self.history = None
+
+    def add_topology_listener(self, listener):
+        self._topology_listeners.append(listener)
+
+    def remove_topology_listener(self, listener):
+        self._topology_listeners.remove(listener)
+
+    def notify_topology(self, node_id, instance_list):
+        for listener in self._topology_listeners:
+            listener(node_id, instance_list)
 
-    def send(self, msg, to_node_id=None):
+    def enable_snapshot(self, path, interval=300):
+        # restore the known nodes from the snapshot at path on start,
+        # and save them there every interval seconds and on stop.
+        self._snapshot_path = path
+        self._snapshot_interval = interval
+
+    @property
+    def snapshot_path(self):
+        return self._snapshot_path
+
+    @property
+    def snapshot_interval(self):
+        return self._snapshot_interval
+
+    def save_snapshot(self):
+        if self._snapshot_path is None or self._node_id is None:
+            return
+        try:
+            topology.save(self, self._snapshot_path)
+        except OSError as e:
+            print('failed to save the snapshot: {0}'.format(e))
+
+    def _save_snapshot_periodically(self):
+        self.save_snapshot()
+        if self._snapshot_interval:
+            self.schedule_call(self._snapshot_interval,
+                               self._save_snapshot_periodically)
+
+    def _restore_snapshot(self):
+        profile = self.get_self_node().get_profile()
+        if profile is not None:
+            nodes = topology.load(self._snapshot_path)
+            if self.node_filter is not None:
+                nodes = [n for n in nodes if self.node_filter(n[0])]
+            profile.restore_nodes(nodes)
+        if self._snapshot_interval:
+            self.schedule_call(self._snapshot_interval,
+                               self._save_snapshot_periodically)
+
+    def disable_coalescing(self):
+        if self.coalescer is not None:
+            self.coalescer.flush()
+        self.coalescer = None
+
+    def send(self, msg, to_node_id=None, coalesce=True):
+        if (coalesce and self.coalescer is not None
+            and self.coalescer.add_send(msg, to_node_id)):
+            return
         if msg.tid is None:
-            msg.tid = self._tid
-            self._tid = (self._tid + 1) % 0xffff
-        data = protocol.encode(msg)
+            msg.tid = self._next_tid()
+        self.send_datagram(protocol.encode(msg), to_node_id)
+
+    def send_datagram(self, datagram, to_node_id=None):
+        # send an encoded frame.
         if self.sender is not None:
-            reactor.callWhenRunning(self.sender.sendDatagram, data, to_node_id)
+            self._send_queue.put(datagram, to_node_id)
+
+    def request(self, msg, to_node_id=None, timeout=None, retries=None,
+                coalesce=True):
+        # send a request and return a Deferred fired with the reply
+        # message carrying the same TID.  An error reply fails the
+        # Deferred with RequestError, and no reply after all the
+        # retries with RequestTimeoutError.  When to_node_id is None,
+        # the first reply from any node is used.
+        # An ESV answered only on error, such as SETI which has no reply
+        # on success, raises ValueError since the Deferred could only
+        # time out; send it with send() and listen to SETI_SNA instead.
+        # An ESV which is not a request raises ValueError as well.
+        reply_esvs = protocol.ESV_REPLY_CODES.get(msg.esv)
+        if reply_esvs is None:
+            raise ValueError(
+                'ESV {0:#04x} is not a request.'.format(msg.esv))
+        if all(esv in protocol.ESV_ERROR_CODES for esv in reply_esvs):
+            raise ValueError(
+                'ESV {0:#04x} has no response; use send().'.format(msg.esv))
+        if coalesce and self.coalescer is not None:
+            d = self.coalescer.add_request(msg, to_node_id, timeout, retries)
+            if d is not None:
+                return d
+        if timeout is None:
+            timeout = self.request_timeout
+        if retries is None:
+            retries = self.request_retries
+        if len(self._requests) >= 0xffff:
+            return self.runtime.failed(
+                RuntimeError('too many in-flight requests.'))
+        msg.tid = self._next_tid()
+        req = _Request(msg, to_node_id, timeout, retries)
+        req.deferred = self.runtime.new_deferred(
+            lambda: self._cancel_request(req))
+        self._requests[msg.tid] = req
+        self._send_request(req)
+        return req.deferred
+
+    def _send_request(self, req):
+        req.sent_at = self.runtime.now()
+        self.send(req.msg, req.to_node_id)
+        req.timer = self.runtime.call_later(req.timeout,
+                                             self._on_request_timeout, req)
+
+    def _on_request_timeout(self, req):
+        req.timer = None
+        if req.retries > 0:
+            req.retries -= 1
+            self._send_request(req)
+            return
+        del self._requests[req.msg.tid]
+        self.metrics.request_timeouts.inc((_esv_label(req.msg.esv),))
+        self.runtime.reject(req.deferred, RequestTimeoutError(
+            'no reply to TID {0:#06x}.'.format(req.msg.tid)))
+
+    def _cancel_request(self, req):
+        if req.timer is not None:
+            req.timer.cancel()
+            req.timer = None
+        self._requests.pop(req.msg.tid, None)
+
+    def _complete_request(self, req, msg, from_node_id):
+        self._cancel_request(req)
+        # the latency from the last (re)transmission.
+        latency = self.runtime.now() - req.sent_at
+        self.metrics.request_latency.observe(latency,
+                                             (_esv_label(req.msg.esv),))
+        self.metrics.node_request_latency.observe(latency, (from_node_id,))
+        if msg.esv in protocol.ESV_ERROR_CODES:
+            self.runtime.reject(req.deferred, RequestError(msg))
+        else:
+            self.runtime.resolve(req.deferred, msg)
 
     def schedule_call(self, timeout, callback, **kwargs):
         if timeout == 0:
-            reactor.callWhenRunning(callback, **kwargs)
+            return self.runtime.call_soon(callback, **kwargs)
         else:
-            reactor.callLater(timeout, callback, **kwargs)
+            return self.runtime.call_later(timeout, callback, **kwargs)
 
     def schedule_loopingcall(self, timeout, callback, **kwargs):
-        l = task.LoopingCall(callback, **kwargs)
-        l.start(timeout)
+        l = self.runtime.looping_call(timeout, callback, **kwargs)
         self._loopingcalls.append(l)
         return l
 
@@ -1,13 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import socket
 
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet.error import ReactorNotRunning
 from twisted.internet.protocol import DatagramProtocol
+from twisted.internet.protocol import Factory
 
-echonet_lite_group = '224.0.23.0'
-# echonet_lite_group_IPv6 = 'ff02::1'
-echonet_lite_port = 3610
+from echonetlite import udp
+from echonetlite.udp import Sender
+from echonetlite.udp import echonet_lite_group, echonet_lite_port
 
 class Receiver(DatagramProtocol):
     def __init__(self, **kwargs):
@@ -24,19 +28,120 @@ class Receiver(DatagramProtocol):
         node_id = address[0]
         self._on_did_receive(datagram, node_id)
 
-class Sender(object):
-    def __init__(self, local_addr):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.setsockopt(socket.IPPROTO_IP,
-                               socket.IP_MULTICAST_IF,
-                               socket.inet_aton(local_addr))
-
-    def sendDatagram(self, datagram, node_id=None):
-        if node_id is None:
-            address = (echonet_lite_group, echonet_lite_port)
-        else:
-            address = (node_id, echonet_lite_port)
-        self.socket.sendto(datagram, address)
+class _Reader(object):
+    # a reader of the reactor calling callback when sock is readable.
+    def __init__(self, sock, callback):
+        self._sock = sock
+        self._callback = callback
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def doRead(self):
+        self._callback()
+
+    def connectionLost(self, reason):
+        pass
+
+    def logPrefix(self):
+        return 'echonetlite'
+
+class Runtime(object):
+    # The Twisted event loop used by interfaces.Monitor.  With
+    # batch_size, up to batch_size datagrams are received and
+    # processed in one go, see udp.BatchReceiver.
+    # e.g. monitor.set_adapter(ipv4adapter, batch_size=64)
+    def __init__(self, batch_size=None):
+        self._batch_size = batch_size
+        # _readers: the _Reader()s added to the reactor
+        self._readers = []
+        self._batch_receiver = None
+        self._port = None
+
+    def now(self):
+        return reactor.seconds()
+
+    def call_soon(self, callback, *args, **kwargs):
+        # run in a later turn of the reactor, as in asyncioadapter.
+        # reactor.callWhenRunning() would run the callback at once
+        # while the reactor is running, and return no call to cancel.
+        return reactor.callLater(0, callback, *args, **kwargs)
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        return reactor.callLater(delay, callback, *args, **kwargs)
+
+    def looping_call(self, interval, callback, **kwargs):
+        l = task.LoopingCall(callback, **kwargs)
+        l.start(interval)
+        return l
+
+    def new_deferred(self, canceller):
+        return defer.Deferred(lambda d: canceller())
+
+    def resolve(self, d, result):
+        if not d.called:
+            d.callback(result)
+
+    def reject(self, d, error):
+        if not d.called:
+            d.errback(error)
+
+    def add_callbacks(self, d, callback, errback):
+        d.addCallbacks(callback, lambda f: errback(f.value))
+
+    def succeeded(self, result):
+        return defer.succeed(result)
+
+    def failed(self, error):
+        return defer.fail(error)
+
+    def new_sender(self, local_addr):
+        return Sender(local_addr)
+
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        if self._batch_size and on_did_receive_batch is not None:
+            self._batch_receiver = udp.BatchReceiver(
+                local_addr, on_did_receive_batch, self._batch_size)
+            self.add_reader(self._batch_receiver.socket,
+                            self._batch_receiver.on_readable)
+            return
+        receiver = Receiver(local_addr=local_addr,
+                            on_did_receive=on_did_receive)
+        self._port = reactor.listenMulticast(echonet_lite_port, receiver,
+                                             listenMultiple=True)
+
+    def add_reader(self, sock, callback):
+        # call callback whenever sock becomes readable, until stop().
+        reader = _Reader(sock, callback)
+        reactor.addReader(reader)
+        self._readers.append(reader)
+
+    def listen_shell(self, port):
+        from echonetlite import shellservice
+        f = Factory()
+        f.protocol = shellservice.ShellServer
+        reactor.listenTCP(port, f)
+
+    def run(self):
+        reactor.run()
+
+    def stop(self):
+        for reader in self._readers:
+            reactor.removeReader(reader)
+        self._readers = []
+        if self._batch_receiver is not None:
+            self._batch_receiver.close()
+            self._batch_receiver = None
+        if self._port is not None:
+            self._port.stopListening()
+            self._port = None
+        # the reactor may be stopping already, or not started when the
+        # monitor is stopped before run().  reactor.running stays True
+        # while it is stopping, so the error is caught instead.
+        try:
+            reactor.stop()
+        except ReactorNotRunning:
+            pass
 
 if __name__ == '__main__':
     from twisted.internet import reactor
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import bisect
+
+# upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# the largest number of nodes with their own series in the per node
+# latency histogram.  The other nodes are counted in the series of
+# node="other", so that the number of series stays bounded however
+# many nodes reply.
+NODE_LATENCY_SERIES = 64
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\')
+            .replace('"', '\\"').replace('\n', '\\n'))
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = ['{0}="{1}"'.format(n, _escape(v))
+             for (n, v) in zip(labelnames, labelvalues)]
+    if extra is not None:
+        pairs.append('{0}="{1}"'.format(*extra))
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter(object):
+    # a monotonically increasing value for each combination of label
+    # values.
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # values: a dict with key as a tuple of label values
+        self.values = {}
+
+    def inc(self, labels=(), value=1):
+        values = self.values
+        values[labels] = values.get(labels, 0) + value
+
+    def get(self, labels=()):
+        return self.values.get(labels, 0)
+
+    def remove(self, labels):
+        # drops the value of labels, if any.
+        self.values.pop(labels, None)
+
+    def snapshot(self):
+        return {_format_labels(self.labelnames, k): v
+                for (k, v) in self.values.items()}
+
+    def prometheus_lines(self):
+        if not self.labelnames and not self.values:
+            yield '{0} 0'.format(self.name)
+        for (labels, value) in sorted(self.values.items()):
+            yield '{0}{1} {2}'.format(
+                self.name, _format_labels(self.labelnames, labels), value)
+
+
+class Histogram(object):
+    # counts of observed values in cumulative buckets, with their sum
+    # and count, for each combination of label values.  If max_series
+    # is given, values of new label values are observed under
+    # overflow_labels once max_series other combinations exist.
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS, max_series=None,
+                 overflow_labels=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.max_series = max_series
+        self.overflow_labels = overflow_labels
+        # values: a dict with key as a tuple of label values, value as
+        # [bucket counts (the last one for +Inf), sum, count]
+        self.values = {}
+
+    def observe(self, value, labels=()):
+        v = self.values.get(labels)
+        if v is None and self.max_series is not None:
+            series = len(self.values)
+            if self.overflow_labels in self.values:
+                series -= 1
+            if series >= self.max_series:
+                labels = self.overflow_labels
+                v = self.values.get(labels)
+        if v is None:
+            v = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self.values[labels] = v
+        v[0][bisect.bisect_left(self.buckets, value)] += 1
+        v[1] += value
+        v[2] += 1
+
+    def remove(self, labels):
+        # drops the series of labels, if any, making room for another
+        # one under max_series.
+        self.values.pop(labels, None)
+
+    def _cumulative(self, counts):
+        total = 0
+        for count in counts:
+            total += count
+            yield total
+
+    def snapshot(self):
+        snapshot = {}
+        for (labels, (counts, total, count)) in self.values.items():
+            snapshot[_format_labels(self.labelnames, labels)] = {
+                'buckets': dict(zip([str(b) for b in self.buckets]
+                                    + ['+Inf'],
+                                    self._cumulative(counts))),
+                'sum': total,
+                'count': count,
+            }
+        return snapshot
+
+    def prometheus_lines(self):
+        for (labels, (counts, total, count)) in sorted(self.values.items()):
+            bounds = [repr(b) for b in self.buckets] + ['+Inf']
+            for (bound, cumulative) in zip(bounds, self._cumulative(counts)):
+                yield '{0}_bucket{1} {2}'.format(
+                    self.name,
+                    _format_labels(self.labelnames, labels, ('le', bound)),
+                    cumulative)
+            label_str = _format_labels(self.labelnames, labels)
+            yield '{0}_sum{1} {2}'.format(self.name, label_str, total)
+            yield '{0}_count{1} {2}'.format(self.name, label_str, count)
+
+
+class Metrics(object):
+    # The runtime counters and histograms of a Monitor.
+    def __init__(self):
+        self._families = []
+        self.packets_in = self.counter(
+            'echonetlite_packets_received_total',
+            'Datagrams received.')
+        self.bytes_in = self.counter(
+            'echonetlite_bytes_received_total',
+            'Bytes of datagrams received.')
+        self.packets_out = self.counter(
+            'echonetlite_packets_sent_total',
+            'Datagrams sent.')
+        self.bytes_out = self.counter(
+            'echonetlite_bytes_sent_total',
+            'Bytes of datagrams sent.')
+        self.send_errors = self.counter(
+            'echonetlite_send_errors_total',
+            'Datagrams dropped by send errors.')
+        self.decode_failures = self.counter(
+            'echonetlite_decode_failures_total',
+            'Datagrams which are not valid Echonet Lite frames.')
+        self.not_ours = self.counter(
+            'echonetlite_not_ours_total',
+            'Messages destined to no object of this node.')
+        self.messages_in = self.counter(
+            'echonetlite_messages_received_total',
+            'Messages received.', ('esv',))
+        self.stage_seconds = self.histogram(
+            'echonetlite_stage_seconds',
+            'Processing time of received messages.', ('stage',))
+        self.request_timeouts = self.counter(
+            'echonetlite_request_timeouts_total',
+            'Requests which got no reply.', ('esv',))
+        self.request_latency = self.histogram(
+            'echonetlite_request_latency_seconds',
+            'Time from a request to its reply.', ('esv',))
+        self.node_request_latency = self.histogram(
+            'echonetlite_node_request_latency_seconds',
+            'Time from a request to its reply by node.', ('node',),
+            max_series=NODE_LATENCY_SERIES, overflow_labels=('other',))
+        self.nodes_evicted = self.counter(
+            'echonetlite_nodes_evicted_total',
+            'Remote nodes forgotten by the node table limits.', ('reason',))
+        self.nodes_rejected = self.counter(
+            'echonetlite_nodes_rejected_total',
+            'Messages ignored since the node table was full.')
+
+    def counter(self, name, documentation, labelnames=()):
+        c = Counter(name, documentation, labelnames)
+        self._families.append(c)
+        return c
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=LATENCY_BUCKETS, max_series=None,
+                  overflow_labels=None):
+        h = Histogram(name, documentation, labelnames, buckets, max_series,
+                      overflow_labels)
+        self._families.append(h)
+        return h
+
+    def snapshot(self):
+        return {f.name: f.snapshot() for f in self._families}
+
+    def to_prometheus(self):
+        # returns the metrics in the Prometheus text exposition format.
+        lines = []
+        for f in self._families:
+            lines.append('# HELP {0} {1}'.format(f.name, f.documentation))
+            lines.append('# TYPE {0} {1}'.format(f.name, f.kind))
+            lines.extend(f.prometheus_lines())
+        return '\n'.join(lines) + '\n'
@@ -1,15 +1,74 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+from collections.abc import Mapping
+import itertools
+
 import echonetlite
+from echonetlite import edtcodec
 from echonetlite.protocol import *
 
+class _DeviceNameView(Mapping):
+    # A read-only view of the devices of a Node keyed by str(eoj), for
+    # code written against the older string keyed device dict.  The
+    # name index is rebuilt only when the device set has changed.
+    def __init__(self, node):
+        self._node = node
+        self._names = {}
+        self._generation = None
+
+    def _get_names(self):
+        node = self._node
+        if self._generation != node._generation:
+            self._names = {str(d.eoj): d for d in node._devices.values()}
+            self._generation = node._generation
+        return self._names
+
+    def __getitem__(self, name):
+        return self._get_names()[name]
+
+    def __iter__(self):
+        return iter(self._get_names())
+
+    def __len__(self):
+        return len(self._node._devices)
+
+
+def _decode_instance_list(edt):
+    # returns a list of int(eoj) listed in an instance list EDT (0xd5
+    # or 0xd6).
+    count = min(edt[0], (len(edt) - 1) // 3)
+    return [edt[i] << 16 | edt[i + 1] << 8 | edt[i + 2]
+            for i in range(1, count * 3 + 1, 3)]
+
+def _encode_instance_list(eojs):
+    # an EDT in the form of 0xd6 listing all of eojs (int(eoj)s),
+    # without the limit of 84.
+    eojs = sorted(eojs)
+    return bytes([min(len(eojs), 0xff)]) + b''.join(
+        eoj.to_bytes(3, 'big') for eoj in eojs)
+
+
 class Node(object):
     def __init__(self, node_id, devices):
         # _node_id: a layer 3 address string
         self._node_id = node_id
-        # _devices: a dict with key as str(eoj), value as Device()
-        self._devices = devices
+        # _devices: a dict with key as int(eoj), value as Device()
+        self._devices = {}
+        # _devices_by_grpcls: a dict with key as (clsgrp << 8 | cls),
+        # value as a dict with key as int(eoj), value as Device()
+        self._devices_by_grpcls = {}
+        # _dispatch: a dict with key as int(eoj) of a destination, value
+        # as a tuple of Device() which receive messages sent to it.  An
+        # EOJ with INSTANCE_ALL maps to all the instances of its class.
+        self._dispatch = {}
+        # _generation: incremented when the device set changes
+        self._generation = 0
+        self._devices_by_name = _DeviceNameView(self)
+        if isinstance(devices, dict):
+            devices = devices.values()
+        for d in devices:
+            self.add_device(d)
 
     @property
     def node_id(self):
@@ -19,6 +78,10 @@ class Node(object):
     def devices(self):
         return self._devices
 
+    @property
+    def devices_by_name(self):
+        return self._devices_by_name
+
     def __str__(self):
         s = 'Node ID: {0}'.format(self._node_id)
         for d in self._devices.values():
@@ -26,25 +89,74 @@ class Node(object):
         return s
 
     def get_profile(self):
-        profile = None
-        for (_, d) in self._devices.items():
-            if (d.eoj.clsgrp == CLSGRP_CODE['PROFILE']
-                and d.eoj.cls == CLS_CODE['PROFILE']['PROFILE']):
-                profile = d
-                break
-        return profile
+        profiles = self._devices_by_grpcls.get(
+            CLSGRP_CODE['PROFILE'] << 8 | CLS_PR_CODE['PROFILE'])
+        if not profiles:
+            return None
+        return next(iter(profiles.values()))
 
     def add_device(self, device):
-        self._devices[str(device.eoj)] = device
+        eoj = int(device.eoj)
+        grpcls = eoj >> 8
+        old = self._devices.get(eoj)
+        if old is device:
+            return
+        self._devices[eoj] = device
+        self._devices_by_grpcls.setdefault(grpcls, {})[eoj] = device
+        self._update_dispatch(eoj)
+        self._generation += 1
+        # keep the self node properties of a local node profile.
+        profile = self.get_profile()
+        if isinstance(profile, NodeProfile):
+            if profile is device:
+                profile.update_device_numbers(self._devices)
+            elif old is None:
+                profile.on_did_add_device(device)
 
     def get_device(self, eoj):
-        if str(eoj) in self._devices:
-            return self._devices[str(eoj)]
-        return None
+        return self._devices.get(int(eoj))
+
+    def get_devices_by_class(self, clsgrp, cls):
+        devices = self._devices_by_grpcls.get(clsgrp << 8 | cls)
+        if devices is None:
+            return ()
+        return devices.values()
 
     def remove_device(self, eoj):
-        if str(eoj) in self._devices:
-            del self._devices[str(eoj)]
+        eoj = int(eoj)
+        device = self._devices.pop(eoj, None)
+        if device is None:
+            return
+        grpcls = eoj >> 8
+        devices = self._devices_by_grpcls[grpcls]
+        del devices[eoj]
+        if not devices:
+            del self._devices_by_grpcls[grpcls]
+        self._update_dispatch(eoj)
+        self._generation += 1
+        profile = self.get_profile()
+        if isinstance(profile, NodeProfile):
+            profile.on_did_remove_device(device)
+
+    def _update_dispatch(self, eoj):
+        # refresh the entries for eoj and for all the instances of its
+        # class.
+        grpcls = eoj >> 8
+        all_instance = grpcls << 8 | INSTANCE_ALL
+        if eoj != all_instance:
+            device = self._devices.get(eoj)
+            if device is None:
+                self._dispatch.pop(eoj, None)
+            else:
+                self._dispatch[eoj] = (device,)
+        devices = self._devices_by_grpcls.get(grpcls)
+        if devices:
+            self._dispatch[all_instance] = tuple(devices.values())
+        else:
+            self._dispatch.pop(all_instance, None)
+
+    def get_destination_devices(self, deoj):
+        return self._dispatch.get(int(deoj), ())
 
 
 class Device(object):
@@ -74,6 +186,8 @@ class Device(object):
         return s
 
     def add_listener(self, epc, func):
+        # func is called for the properties received from this device.
+        # Use Monitor.add_listener() to listen to a group of devices.
         key = self._eoj.clsgrp << 16 | self._eoj.cls << 8 | epc
         self._listeners[key] = func
 
@@ -83,15 +197,180 @@ class Device(object):
 
 
 class RemoteDevice(Device):
-    pass
+    # A device on another node.  _properties caches the latest EDT
+    # received from the device by GET_RES, INF or INFC, and a cached
+    # value is used by read() until its TTL expires.
+
+    # ttl in seconds of cached values unless set by set_ttl()
+    default_ttl = 60
+
+    def __init__(self, eoj=None, node_id=None):
+        super(RemoteDevice, self).__init__(eoj)
+        self._node_id = node_id
+        # _received: a dict with key as EPC, value as the time when
+        # the EDT was received
+        self._received = {}
+        # _ttls: a dict with key as EPC, value as ttl in seconds
+        self._ttls = {}
+        # _property_maps: a dict with key as EPC, value as (EDT,
+        # PropertyMap()) of the last decoded property map
+        self._property_maps = {}
+
+    @property
+    def node_id(self):
+        return self._node_id
+
+    @node_id.setter
+    def node_id(self, node_id):
+        self._node_id = node_id
+
+    def set_ttl(self, epc, ttl):
+        self._ttls[epc] = ttl
+
+    def update_properties(self, props, now):
+        for p in props:
+            if p.pdc == 0:
+                continue
+            self._properties[p.epc] = p.edt
+            self._received[p.epc] = now
+
+    def invalidate_properties(self, epcs=None):
+        if epcs is None:
+            self._properties.clear()
+            self._received.clear()
+            return
+        for epc in epcs:
+            self._properties.pop(epc, None)
+            self._received.pop(epc, None)
+
+    def get_property(self, epc, max_age=None):
+        # returns the cached EDT of epc, or None if it is not cached or
+        # older than max_age (the TTL of epc by default).
+        received = self._received.get(epc)
+        if received is None:
+            return None
+        if max_age is None:
+            max_age = self._ttls.get(epc, self.default_ttl)
+        now = echonetlite.interfaces.monitor.runtime.now()
+        if now - received > max_age:
+            return None
+        return self._properties[epc]
+
+    def property_map(self, epc):
+        # returns the PropertyMap() of the cached map property epc
+        # (EPC_GET_PROPERTY_MAP etc.) regardless of its age, or None.
+        edt = self._properties.get(epc)
+        if edt is None:
+            return None
+        cached = self._property_maps.get(epc)
+        if cached is not None and cached[0] == edt:
+            return cached[1]
+        try:
+            prop_map = PropertyMap.decode(edt)
+        except DecodeError as e:
+            print('ignored the property map {0:#04x} of {1}: {2}'.format(
+                epc, self._eoj, e))
+            return None
+        self._property_maps[epc] = (edt, prop_map)
+        return prop_map
+
+    def get_value(self, epc, max_age=None):
+        # returns the cached value of the property decoded by the
+        # codec registered in edtcodec.registry, or None.
+        edt = self.get_property(epc, max_age)
+        if edt is None:
+            return None
+        return edtcodec.registry.decode(self._eoj, epc, edt)
+
+    def read(self, epcs, from_device, max_age=None,
+             timeout=None, retries=None):
+        # returns a Deferred fired with a dict with key as EPC, value as
+        # EDT.  Fresh cached values are used, and the others are
+        # requested from the device by from_device (a LocalDevice).
+        runtime = echonetlite.interfaces.monitor.runtime
+        values = {}
+        missing = []
+        for epc in epcs:
+            edt = self.get_property(epc, max_age)
+            if edt is None:
+                missing.append(epc)
+            else:
+                values[epc] = edt
+        if not missing:
+            return runtime.succeeded(values)
+
+        d = runtime.new_deferred(lambda: None)
+        def on_reply(msg):
+            for p in msg.properties:
+                if p.pdc != 0:
+                    values[p.epc] = p.edt
+            runtime.resolve(d, values)
+        req = from_device.request(ESV_CODE['GET'],
+                                  [Property(epc) for epc in missing],
+                                  self._eoj, self._node_id,
+                                  timeout, retries)
+        runtime.add_callbacks(req, on_reply,
+                              lambda error: runtime.reject(d, error))
+        return d
+
+
+# the reply ESV to each read request ESV
+_GET_REPLY_ESV_CODES = {
+    ESV_CODE['GET']:     ESV_CODE['GET_RES'],
+    ESV_CODE['INF_REQ']: ESV_CODE['INF'],
+}
+
+class _PropertyDict(dict):
+    # the properties of a LocalDevice, dropping the encoded segment of
+    # a property whenever it is written.  EDTs are stored as bytes so
+    # that they cannot be modified in place behind a cached segment.
+    def __init__(self, segments):
+        super(_PropertyDict, self).__init__()
+        self._segments = segments
+
+    def __setitem__(self, epc, edt):
+        self._segments.pop(epc, None)
+        super(_PropertyDict, self).__setitem__(epc, as_edt(edt))
+
+    def __delitem__(self, epc):
+        self._segments.pop(epc, None)
+        super(_PropertyDict, self).__delitem__(epc)
+
+    def pop(self, epc, *args):
+        self._segments.pop(epc, None)
+        return super(_PropertyDict, self).pop(epc, *args)
+
+    def popitem(self):
+        (epc, edt) = super(_PropertyDict, self).popitem()
+        self._segments.pop(epc, None)
+        return (epc, edt)
+
+    def update(self, *args, **kwargs):
+        for (epc, edt) in dict(*args, **kwargs).items():
+            self[epc] = edt
+
+    def setdefault(self, epc, edt=None):
+        if epc not in self:
+            self[epc] = edt
+        return self[epc]
+
+    def clear(self):
+        self._segments.clear()
+        super(_PropertyDict, self).clear()
 
 
 class LocalDevice(Device):
     def __init__(self, eoj=None):
         super(LocalDevice, self).__init__(eoj)
-        self._status_change_property_map = []
-        self._set_property_map = []
-        self._get_property_map = []
+        # _segments: a dict with key as EPC, value as the encoded EPC,
+        # PDC and EDT of the property, used to build GET replies
+        self._segments = {}
+        self._properties = _PropertyDict(self._segments)
+        # the property maps, as PropertyMap()s; assign any iterable of
+        # EPCs to the properties below to update their EDT as well
+        self._status_change_property_map = PropertyMap()
+        self._set_property_map = PropertyMap()
+        self._get_property_map = PropertyMap()
 
     def _add_property(self, epc, edt):
         self._properties[epc] = edt
@@ -110,9 +389,9 @@ class LocalDevice(Device):
 
     @status_change_property_map.setter
     def status_change_property_map(self, prop_map):
-        self._status_change_property_map = prop_map
-        self._properties[EPC_STATUS_CHANGE_PROPERTY_MAP] = [
-            len(self._status_change_property_map)] + self._status_change_property_map
+        self._status_change_property_map = PropertyMap(prop_map)
+        self._properties[EPC_STATUS_CHANGE_PROPERTY_MAP] = (
+            self._status_change_property_map.encode())
 
     @property
     def set_property_map(self):
@@ -120,9 +399,9 @@ class LocalDevice(Device):
 
     @set_property_map.setter
     def set_property_map(self, prop_map):
-        self._set_property_map = prop_map
-        self._properties[EPC_SET_PROPERTY_MAP] = [
-            len(self._set_property_map)] + self._set_property_map
+        self._set_property_map = PropertyMap(prop_map)
+        self._properties[EPC_SET_PROPERTY_MAP] = (
+            self._set_property_map.encode())
 
     @property
     def get_property_map(self):
@@ -130,31 +409,53 @@ class LocalDevice(Device):
 
     @get_property_map.setter
     def get_property_map(self, prop_map):
-        self._get_property_map = prop_map
-        self._properties[EPC_GET_PROPERTY_MAP] = [
-            len(self._get_property_map)] + self._get_property_map
+        self._get_property_map = PropertyMap(prop_map)
+        self._properties[EPC_GET_PROPERTY_MAP] = (
+            self._get_property_map.encode())
 
-    def send(self, esv, props, to_eoj, to_node_id=None):
+    def _build_message(self, esv, props, to_eoj, tid=None):
         msg = Message()
+        msg.tid = tid
         msg.seoj = self._eoj
         msg.deoj = to_eoj
         msg.esv = esv
         msg.properties = props
         msg.opc = len(props)
+        return msg
+
+    def send(self, esv, props, to_eoj, to_node_id=None, tid=None):
+        msg = self._build_message(esv, props, to_eoj, tid)
         echonetlite.interfaces.monitor.send(msg, to_node_id)
 
+    def request(self, esv, props, to_eoj, to_node_id=None,
+                timeout=None, retries=None):
+        # returns a Deferred fired with the reply message.  See
+        # Monitor.request().
+        msg = self._build_message(esv, props, to_eoj)
+        return echonetlite.interfaces.monitor.request(msg, to_node_id,
+                                                      timeout, retries)
+
+    def _get_segment(self, epc):
+        segment = self._segments.get(epc)
+        if segment is None:
+            segment = encode_segment(epc, self._properties[epc])
+            self._segments[epc] = segment
+        return segment
+
+    def _build_response_segments(self, msg, from_node):
+        # the encoded properties readable by a GET or INF_REQ.
+        segments = []
+        for p in msg.properties:
+            if (p.epc not in self._get_property_map
+                or p.epc not in self._properties):
+                # XXX error
+                #print('EPC {0:#x} does not exist'.format(p.epc))
+                continue
+            segments.append(self._get_segment(p.epc))
+        return segments
+
     def _build_response_props(self, msg, from_node):
         res_props = []
-        if (msg.esv == ESV_CODE['GET']
-            or msg.esv == ESV_CODE['INF_REQ']
-            or msg.esv == ESV_CODE['INFC']):
-            for p in msg.properties:
-                if p.epc not in self._get_property_map:
-                    # XXX error
-                    #print('EPC {0:#x} does not exist'.format(p.epc))
-                    continue
-                res_props.append(Property(epc=p.epc,
-                                          edt=self._properties[p.epc]))
         if (msg.esv == ESV_CODE['SETI']
             or msg.esv == ESV_CODE['SETC']):
             for p in msg.properties:
@@ -170,16 +471,22 @@ class LocalDevice(Device):
         return res_props
 
     def on_did_receive_request(self, msg, from_node):
+        if msg.esv in _GET_REPLY_ESV_CODES:
+            # a reply to a read is built from the encoded properties.
+            segments = self._build_response_segments(msg, from_node)
+            if len(segments) == 0:
+                # XXX
+                return
+            echonetlite.interfaces.monitor.send_datagram(
+                encode_segments(msg.tid, self._eoj, msg.seoj,
+                                _GET_REPLY_ESV_CODES[msg.esv], segments),
+                from_node.node_id)
+            return
+
         props = self._build_response_props(msg, from_node)
         esv = None
         if msg.esv == ESV_CODE['SETC']:
             esv = ESV_CODE['SET_RES']
-        elif msg.esv == ESV_CODE['GET']:
-            esv = ESV_CODE['GET_RES']
-        elif msg.esv == ESV_CODE['INF_REQ']:
-            esv = ESV_CODE['INF']
-        elif msg.esv == ESV_CODE['INFC']:
-            esv = ESV_CODE['INFC_RES']
         elif msg.esv == ESV_CODE['SETGET']:
             esv = ESV_CODE['SETGET_RES']
 
@@ -188,7 +495,8 @@ class LocalDevice(Device):
             return
 
         if esv is not None:
-            self.send(esv, props, msg.seoj, from_node.node_id)
+            # a reply carries the TID of the request.
+            self.send(esv, props, msg.seoj, from_node.node_id, msg.tid)
 
     def _process_response(self, msg, from_node):
         pass
@@ -222,6 +530,16 @@ class ProfileSuperObject(LocalDevice):
 
 
 class NodeProfile(ProfileSuperObject):
+    # the range of the interval in seconds of discovery requests
+    discovery_min_interval = 60
+    discovery_max_interval = 3600
+    # the minimum interval in seconds of instance list requests to
+    # one node
+    instance_list_query_interval = 10
+    # the number of nodes restored from a snapshot confirmed per
+    # second
+    restore_validation_rate = 20
+
     def __init__(self, eoj=None):
         super(NodeProfile, self).__init__(eoj)
         if eoj is None:
@@ -234,7 +552,7 @@ class NodeProfile(ProfileSuperObject):
         # Echonet Lite protocol version
         self._properties[EPC_VERSION_INFORMATION] = PROTOCOL_VERSION
         # Identification number
-        self._properties[EPC_IDENTIFICATION_NUMBER] = [0xfe] + self._properties[EPC_MANUFACTURE_CODE] + [0] * 13
+        self._properties[EPC_IDENTIFICATION_NUMBER] = bytes([0xfe]) + self._properties[EPC_MANUFACTURE_CODE] + bytes(13)
         # Get property map
         self.get_property_map += [
             EPC_OPERATING_STATUS,
@@ -246,95 +564,350 @@ class NodeProfile(ProfileSuperObject):
             EPC_SELF_NODE_INSTANCE_LIST_S,
             EPC_SELF_NODE_CLASS_LIST_S]
 
-        # Discover nodes just after booting,
+        # _instance_lists: a dict with key as node_id, value as the last
+        # self node instance list S (0xd6) EDT received from the node
+        self._instance_lists = {}
+        # _instances: a dict with key as node_id, value as a set of
+        # int(eoj) of the objects of the node, merged from the instance
+        # lists and the instance list notifications (0xd5)
+        self._instances = {}
+        # _queries: a dict with key as node_id, value as the time when
+        # the instance list was last requested
+        self._queries = {}
+        # _topology_changed: set when a node or an instance list has
+        # changed since the last discovery request.  It is set before
+        # the first one, whose results are not known until the next.
+        self._topology_changed = True
+        # _self_instances: a dict with key as int(eoj) of the objects
+        # of the self node other than node profiles, in the order they
+        # were added, value as None
+        self._self_instances = {}
+        # _self_classes: a dict with key as (clsgrp << 8 | cls) of the
+        # classes of _self_instances, value as the number of instances
+        self._self_classes = {}
+        self._update_self_node_properties()
+        self._announcement_scheduled = False
+        self._discovery_interval = self.discovery_min_interval
+
+        # Discover nodes just after booting.  The discovery request is
+        # repeated with an interval doubled each time no change was
+        # found, between discovery_min_interval and
+        # discovery_max_interval seconds.
         echonetlite.interfaces.monitor.schedule_call(
             0, self._request_operating_status)
-        # and discover any new devices on the link every 60 seconds.
-        echonetlite.interfaces.monitor.schedule_loopingcall(
-            60, self._request_operating_status)
 
     def update_device_numbers(self, devices):
-        grpcls_set = set()
-        instance_set = set()
-        instance_set_wo_profile = set()
-        for (_, d) in devices.items():
-            grpcls = (d.eoj.clsgrp << 8 | d.eoj.cls)
-            grpcls_set.add(grpcls)
-            if (d.eoj.clsgrp == CLSGRP_CODE['PROFILE']
-                and d.eoj.cls == CLS_PR_CODE['PROFILE']):
-                instance_set.add(d.eoj.eoj)
-            else:
-                instance_set.add(d.eoj.eoj)
-                instance_set_wo_profile.add(d.eoj.eoj)
-        self._properties[EPC_NUM_SELF_NODE_INSTANCES] = [
-            (len(instance_set_wo_profile) >> 16) & 0xff,
-            (len(instance_set_wo_profile) >> 8) & 0xff,
-            len(instance_set_wo_profile) & 0xff
-        ]
-        self._properties[EPC_NUM_SELF_NODE_CLASSES] = [
-            (len(grpcls_set) >> 8) & 0xff,
-            len(grpcls_set) & 0xff
-        ]
-        instances_data_wo_profile = []
-        for i in instance_set_wo_profile:
-            instances_data_wo_profile += [(i >> 16) & 0xff,
-                                          (i >> 8) & 0xff,
-                                          i & 0xff]
-        instances_data = []
-        for i in instance_set:
-            instances_data += [(i >> 16) & 0xff,
-                               (i >> 8) & 0xff,
-                               i & 0xff]
-        grpclses_data = []
-        for gc in grpcls_set:
-            grpclses_data += [(gc >> 8) & 0xff, gc & 0xff]
-        self._properties[EPC_INSTANCE_LIST_NOTIFICATION] = (
-            [len(instance_set_wo_profile) & 0xff]
-            + instances_data_wo_profile)
-        self._properties[EPC_SELF_NODE_INSTANCE_LIST_S] = (
-            [len(instance_set) & 0xff]
-            + instances_data)
-        self._properties[EPC_SELF_NODE_CLASS_LIST_S] = (
-            [len(grpcls_set) ] + grpclses_data)
+        # rebuild the self node properties (0xd3 to 0xd7) from devices,
+        # a dict with value as Device().  Node.add_device() and
+        # Node.remove_device() keep them up to date afterwards.
+        self._self_instances = {}
+        self._self_classes = {}
+        for d in devices.values():
+            self._add_self_instance(int(d.eoj))
+        self._update_self_node_properties()
+        self._schedule_announcement()
+
+    def on_did_add_device(self, device):
+        # called by the self node when a device is added.
+        listed = self._add_self_instance(int(device.eoj))
+        if listed is None:
+            return
+        self._update_self_node_properties(listed)
+        self._schedule_announcement()
+
+    def on_did_remove_device(self, device):
+        # called by the self node when a device is removed.
+        eoj = int(device.eoj)
+        if eoj not in self._self_instances:
+            return
+        del self._self_instances[eoj]
+        grpcls = eoj >> 8
+        self._self_classes[grpcls] -= 1
+        if self._self_classes[grpcls] == 0:
+            del self._self_classes[grpcls]
+        self._update_self_node_properties()
+        self._schedule_announcement()
+
+    def _add_self_instance(self, eoj):
+        # returns None if eoj is not counted, otherwise whether the
+        # listed part of the instance or class lists has changed.
+        grpcls = eoj >> 8
+        if (grpcls == CLSGRP_CODE['PROFILE'] << 8 | CLS_PR_CODE['PROFILE']
+            or eoj in self._self_instances):
+            return None
+        self._self_instances[eoj] = None
+        listed = len(self._self_instances) <= MAX_LISTED_INSTANCES
+        count = self._self_classes.get(grpcls, 0)
+        self._self_classes[grpcls] = count + 1
+        if count == 0 and len(self._self_classes) <= MAX_LISTED_CLASSES:
+            listed = True
+        return listed
+
+    def _update_self_node_properties(self, listed=True):
+        # the counts are updated on every change, the lists only if
+        # listed, since they hold the first MAX_LISTED_INSTANCES
+        # instances and MAX_LISTED_CLASSES classes only.  The counts
+        # in the lists are 0xff for 255 or more.
+        ninstances = len(self._self_instances)
+        nclasses = len(self._self_classes)
+        self._properties[EPC_NUM_SELF_NODE_INSTANCES] = (
+            ninstances.to_bytes(3, 'big'))
+        # the node profile class is counted in 0xd4, but not listed in
+        # 0xd7.
+        self._properties[EPC_NUM_SELF_NODE_CLASSES] = (
+            (nclasses + 1).to_bytes(2, 'big'))
+        if listed:
+            instances = b''.join(
+                eoj.to_bytes(3, 'big') for eoj in itertools.islice(
+                    self._self_instances, MAX_LISTED_INSTANCES))
+            classes = b''.join(
+                gc.to_bytes(2, 'big') for gc in itertools.islice(
+                    self._self_classes, MAX_LISTED_CLASSES))
+            self._properties[EPC_INSTANCE_LIST_NOTIFICATION] = (
+                bytes([len(instances) // 3]) + instances)
+            self._properties[EPC_SELF_NODE_INSTANCE_LIST_S] = (
+                bytes([min(ninstances, 0xff)]) + instances)
+            self._properties[EPC_SELF_NODE_CLASS_LIST_S] = (
+                bytes([min(nclasses, 0xff)]) + classes)
+        else:
+            # only the counts at the head of the lists may change.
+            self._update_list_count(EPC_SELF_NODE_INSTANCE_LIST_S, ninstances)
+            self._update_list_count(EPC_SELF_NODE_CLASS_LIST_S, nclasses)
+
+    def _update_list_count(self, epc, count):
+        edt = self._properties[epc]
+        count = min(count, 0xff)
+        if edt[0] != count:
+            self._properties[epc] = bytes([count]) + edt[1:]
+
+    def _schedule_announcement(self):
+        # changes made in one turn of the event loop are announced
+        # together, in a later turn.
+        if self._announcement_scheduled:
+            return
+        self._announcement_scheduled = True
+        echonetlite.interfaces.monitor.runtime.call_later(
+            0, self.announce_instance_list)
+
+    def announce_instance_list(self):
+        # multicast the instance list of the self node, in as many
+        # notifications (0xd5) as needed to list all the instances.
+        self._announcement_scheduled = False
+        if not echonetlite.interfaces.monitor.discovery_enabled:
+            return
+        instances = list(self._self_instances)
+        for i in range(0, len(instances), MAX_LISTED_INSTANCES):
+            listed = instances[i:i + MAX_LISTED_INSTANCES]
+            edt = bytes([len(listed)]) + b''.join(
+                eoj.to_bytes(3, 'big') for eoj in listed)
+            self.send(esv=ESV_CODE['INF'],
+                      props=[Property(EPC_INSTANCE_LIST_NOTIFICATION, edt)],
+                      to_eoj=EOJ(CLSGRP_CODE['PROFILE'],
+                                 CLS_PR_CODE['PROFILE'],
+                                 INSTANCE_PR_NORMAL))
 
     def _request_operating_status(self):
-        self.send(esv=ESV_CODE['INF_REQ'],
-                  props=[Property(epc=EPC_OPERATING_STATUS),],
-                  to_eoj=EOJ(CLSGRP_CODE['PROFILE'],
-                             CLS_PR_CODE['PROFILE'],
-                             INSTANCE_PR_NORMAL))
+        if echonetlite.interfaces.monitor.discovery_enabled:
+            self.send(esv=ESV_CODE['INF_REQ'],
+                      props=[Property(epc=EPC_OPERATING_STATUS),],
+                      to_eoj=EOJ(CLSGRP_CODE['PROFILE'],
+                                 CLS_PR_CODE['PROFILE'],
+                                 INSTANCE_PR_NORMAL))
+        # back off while the previous discovery found nothing new.
+        if self._topology_changed:
+            self._discovery_interval = self.discovery_min_interval
+        else:
+            self._discovery_interval = min(self._discovery_interval * 2,
+                                           self.discovery_max_interval)
+        self._topology_changed = False
+        echonetlite.interfaces.monitor.schedule_call(
+            self._discovery_interval, self._request_operating_status)
+
+    def _request_instance_list(self, from_node_id):
+        # request the instance list of a node, unless it has been
+        # requested recently.
+        monitor = echonetlite.interfaces.monitor
+        now = monitor.runtime.now()
+        queried = self._queries.get(from_node_id)
+        if (queried is not None
+            and now - queried < self.instance_list_query_interval):
+            return
+        self._queries[from_node_id] = now
+        d = self.request(esv=ESV_CODE['GET'],
+                         props=[Property(epc=EPC_SELF_NODE_INSTANCE_LIST_S),],
+                         to_eoj=EOJ(CLSGRP_CODE['PROFILE'],
+                                    CLS_PR_CODE['PROFILE'],
+                                    INSTANCE_PR_NORMAL),
+                         to_node_id=from_node_id)
+        # the reply is processed by _process_response().
+        monitor.runtime.add_callbacks(d, lambda msg: None,
+                                      lambda error: None)
+
+    def get_instance_list(self, node_id):
+        # returns the last instance list (0xd6) EDT received from the
+        # node, or None.
+        return self._instance_lists.get(node_id)
+
+    def get_instances(self, node_id):
+        # returns a frozenset of int(eoj) of the objects known on the
+        # node, or None if the node is not known.
+        instances = self._instances.get(node_id)
+        if instances is None:
+            return None
+        return frozenset(instances)
+
+    def restore_nodes(self, nodes):
+        # re-create nodes and their devices from a snapshot, a list of
+        # (node_id, instance list EDT, {EOJ: [Property]}).  The nodes
+        # are asked for their instance lists in the background, and
+        # the ones which do not answer are forgotten.
+        monitor = echonetlite.interfaces.monitor
+        now = monitor.runtime.now()
+        for (idx, (node_id, instance_list, devices)) in enumerate(nodes):
+            if monitor.add_node(node_id) is None:
+                continue
+            # a node with more than 84 objects lists only some of them
+            # in 0xd6, the others are known from their properties.
+            self._instance_lists[node_id] = instance_list
+            eojs = _decode_instance_list(instance_list)
+            eojs += [int(eoj) for eoj in devices if int(eoj) not in eojs]
+            self._update_instances(node_id, eojs, complete=False)
+            node = monitor.nodes[node_id]
+            for (eoj, props) in devices.items():
+                device = node.get_device(eoj)
+                if isinstance(device, RemoteDevice):
+                    device.update_properties(props, now)
+            monitor.schedule_call(idx / self.restore_validation_rate,
+                                  self._validate_node, node_id=node_id)
+
+    def _validate_node(self, node_id):
+        monitor = echonetlite.interfaces.monitor
+        if node_id not in self._instances:
+            return
+        self._queries[node_id] = monitor.runtime.now()
+        d = self.request(esv=ESV_CODE['GET'],
+                         props=[Property(epc=EPC_SELF_NODE_INSTANCE_LIST_S),],
+                         to_eoj=EOJ(CLSGRP_CODE['PROFILE'],
+                                    CLS_PR_CODE['PROFILE'],
+                                    INSTANCE_PR_NORMAL),
+                         to_node_id=node_id)
+        # a changed list is applied by _process_response().
+        monitor.runtime.add_callbacks(
+            d, lambda msg: None,
+            lambda error: self._on_validation_error(node_id, error))
+
+    def _on_validation_error(self, node_id, error):
+        if not isinstance(error, echonetlite.interfaces.RequestTimeoutError):
+            return
+        # the node has gone.
+        echonetlite.interfaces.monitor.forget_node(node_id)
+
+    def forget_node(self, node_id):
+        # called by the monitor when a remote node is forgotten.
+        self._instance_lists.pop(node_id, None)
+        self._instances.pop(node_id, None)
+        self._queries.pop(node_id, None)
+
+    def on_did_receive_announcement(self, msg, from_node):
+        # called by the monitor for every INF and INFC message from
+        # other nodes, whichever object it is destined to.
+        from_node_id = from_node.node_id
+        for prop in msg.properties:
+            if prop.epc == EPC_INSTANCE_LIST_NOTIFICATION:
+                self._on_did_receive_instance_list_notification(
+                    from_node_id, prop)
+                return
+        if from_node_id not in self._instances:
+            self._request_instance_list(from_node_id)
+        elif (not msg.seoj.is_clsgrp(CLSGRP_CODE['PROFILE'])
+              and from_node.get_device(msg.seoj) is None):
+            # an object not listed by the node.
+            self._request_instance_list(from_node_id)
 
     def _on_did_receive_operating_status_response(self, from_node_id,
                                                   from_eoj, esv, prop):
+        if from_node_id in self._instances:
+            # already known, changes are announced by the node.
+            return
         if (prop.pdc == 1
             and prop.edt[0] == EDT_OPERATING_STATUS_BOOTING):
-            self.send(esv=ESV_CODE['GET'],
-                         props=[Property(epc=EPC_SELF_NODE_INSTANCE_LIST_S),],
-                         to_eoj=from_eoj,
-                         to_node_id=from_node_id)
+            self._request_instance_list(from_node_id)
 
-    def _on_did_receive_instance_list_s_response(self, from_node_id,
-                                                 from_eoj, esv, prop):
+    def _on_did_receive_instance_list(self, from_node_id, prop):
+        # the self node instance list S (0xd6) of a node.  It lists at
+        # most 84 objects, and is complete if its count (the number of
+        # the objects of the node) is not larger.
+        if prop.pdc == 0:
+            return
+        edt = prop.edt
+        self._instance_lists[from_node_id] = edt
+        eojs = _decode_instance_list(edt)
+        self._update_instances(from_node_id, eojs,
+                               complete=(edt[0] <= len(eojs)))
+
+    def _on_did_receive_instance_list_notification(self, from_node_id, prop):
+        # an instance list notification (0xd5) is a part of the objects
+        # of a node with more than 84 objects, so the objects are only
+        # added.  If it changed anything, the instance list is
+        # requested to find the removed ones.
         if prop.pdc == 0:
             return
-        (ndevices,) = struct.unpack('!B', bytearray(prop.edt[0:1]))
-        for idx in range(ndevices):
-            (g,c,i) = struct.unpack('!BBB', bytearray(prop.edt[
-                idx * 3 + 1:idx * 3 + 4]))
-            eoj = EOJ(g, c, i)
-            if str(eoj) in echonetlite.interfaces.monitor.nodes[from_node_id].devices:
+        if self._update_instances(from_node_id,
+                                  _decode_instance_list(prop.edt),
+                                  complete=False):
+            self._request_instance_list(from_node_id)
+
+    def _update_instances(self, node_id, eojs, complete):
+        # add the objects of eojs (a list of int(eoj)) to the node, and
+        # remove the others if complete.  Returns True if the node was
+        # new or any object was added or removed.
+        monitor = echonetlite.interfaces.monitor
+        node = monitor.nodes.get(node_id)
+        if node is None or node_id == monitor.node_id:
+            return False
+        known = self._instances.get(node_id)
+        is_new = known is None
+        if is_new:
+            known = set()
+            self._instances[node_id] = known
+        added = [eoj for eoj in dict.fromkeys(eojs) if eoj not in known]
+        removed = []
+        if complete:
+            removed = sorted(known.difference(eojs))
+        if not (is_new or added or removed):
+            return False
+        for eoj in removed:
+            known.discard(eoj)
+            device = node.get_device(eoj)
+            if device is not None:
+                node.remove_device(eoj)
+                self.on_did_lose_device(device, node_id)
+        for eoj in added:
+            known.add(eoj)
+            eoj = EOJ(eoj=eoj)
+            if node.get_device(eoj) is not None:
                 # already listed
                 continue
-            device = self.on_did_find_device(eoj, from_node_id)
+            device = self.on_did_find_device(eoj, node_id)
             if device is None:
-                device = self._on_did_find_device_default(eoj, from_node_id)
-            echonetlite.interfaces.monitor.nodes[from_node_id].add_device(device)
+                device = self._on_did_find_device_default(eoj, node_id)
+            if isinstance(device, RemoteDevice) and device.node_id is None:
+                device.node_id = node_id
+            node.add_device(device)
+        self._topology_changed = True
+        monitor.notify_topology(node_id, _encode_instance_list(known))
+        return True
 
     def on_did_find_device(self, eoj, from_node_id):
         return None
 
     def _on_did_find_device_default(self, eoj, from_node_id):
-        return Device(eoj=eoj)
+        return RemoteDevice(eoj=eoj, node_id=from_node_id)
+
+    def on_did_lose_device(self, device, from_node_id):
+        # called with a device removed from the instance list of its
+        # node.
+        pass
 
     def _process_response(self, msg, from_node):
         super(NodeProfile, self)._process_response(msg, from_node)
@@ -347,8 +920,7 @@ class NodeProfile(ProfileSuperObject):
                 self._on_did_receive_operating_status_response(
                     from_node_id, from_eoj, esv, prop)
             elif prop.epc == EPC_SELF_NODE_INSTANCE_LIST_S:
-                self._on_did_receive_instance_list_s_response(
-                    from_node_id, from_eoj, esv, prop)
+                self._on_did_receive_instance_list(from_node_id, prop)
 
 
 class NodeSuperObject(LocalDevice):
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import heapq
+import random
+
+from echonetlite import protocol
+
+class _Entry(object):
+    # a set of EPCs of a remote device polled every interval seconds.
+    __slots__ = ('device', 'epcs', 'interval', 'from_device', 'due',
+                 'busy', 'cancelled', 'node_id')
+
+    def __init__(self, device, epcs, interval, from_device):
+        self.device = device
+        self.epcs = epcs
+        self.interval = interval
+        self.from_device = from_device
+        self.due = None
+        # busy: True while waiting to be sent or for the reply
+        self.busy = False
+        self.cancelled = False
+        # node_id: the key of Poller._by_node this entry is kept under
+        self.node_id = None
+
+
+class Poller(object):
+    # Polls the properties of many remote devices from one timer.
+    # Entries are kept in a heap ordered by the next poll time.  The
+    # first poll of an entry is placed randomly within its interval,
+    # and each poll is shifted by up to jitter * interval, so that
+    # polls do not fire in phase.  At most max_in_flight requests are
+    # outstanding; the other due polls wait in a queue, and an entry
+    # still busy from its last poll skips its turn.
+    def __init__(self, monitor, max_in_flight=64, jitter=0.1):
+        self._monitor = monitor
+        self.max_in_flight = max_in_flight
+        self.jitter = jitter
+        # _heap: a heap of (due, seq, _Entry())
+        self._heap = []
+        self._seq = 0
+        # _waiting: due entries waiting for a free request slot
+        self._waiting = collections.deque()
+        self._in_flight = 0
+        # _count: the number of entries not removed
+        self._count = 0
+        # _by_node: a dict with key as node_id, value as a set of the
+        # _Entry()s of its devices.  Entries of devices whose node_id
+        # is not known yet are kept under None, and moved to their
+        # node when it becomes known.
+        self._by_node = {}
+        self._timer = None
+        self._timer_due = None
+        self._pump_call = None
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def __len__(self):
+        return self._count
+
+    def add(self, device, epcs, interval, from_device):
+        # poll epcs of device (a RemoteDevice) every interval seconds
+        # by GET requests sent by from_device (a LocalDevice).  Returns
+        # an entry to be passed to remove().
+        entry = _Entry(device, tuple(epcs), interval, from_device)
+        self._index(entry)
+        self._count += 1
+        now = self._monitor.runtime.now()
+        self._push(entry, now + random.uniform(0, interval))
+        return entry
+
+    def remove(self, entry):
+        # the entry is dropped from the heap when it becomes due.
+        if entry.cancelled:
+            return
+        entry.cancelled = True
+        self._count -= 1
+        self._unindex(entry)
+
+    def remove_node(self, node_id):
+        # remove the entries of the devices of node_id.
+        self._reindex_unknown()
+        for entry in self._by_node.pop(node_id, ()):
+            if not entry.cancelled:
+                entry.cancelled = True
+                self._count -= 1
+
+    def _index(self, entry):
+        entry.node_id = entry.device.node_id
+        self._by_node.setdefault(entry.node_id, set()).add(entry)
+
+    def _unindex(self, entry):
+        entries = self._by_node.get(entry.node_id)
+        if entries is not None:
+            entries.discard(entry)
+            if not entries:
+                del self._by_node[entry.node_id]
+
+    def _reindex(self, entry):
+        if entry.node_id != entry.device.node_id:
+            self._unindex(entry)
+            self._index(entry)
+
+    def _reindex_unknown(self):
+        # move the entries whose device got its node_id since added.
+        for entry in list(self._by_node.get(None, ())):
+            self._reindex(entry)
+
+    def _push(self, entry, due):
+        entry.due = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, entry))
+        self._schedule()
+
+    def _schedule(self):
+        if not self._heap:
+            return
+        due = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        runtime = self._monitor.runtime
+        self._timer_due = due
+        self._timer = runtime.call_later(max(0, due - runtime.now()),
+                                         self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        now = self._monitor.runtime.now()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            (due, _, entry) = heapq.heappop(heap)
+            if entry.cancelled:
+                continue
+            if not entry.busy:
+                entry.busy = True
+                self._waiting.append(entry)
+            shift = random.uniform(-self.jitter, self.jitter) * entry.interval
+            self._push(entry, max(due + entry.interval + shift, now))
+        self._pump()
+        self._schedule()
+
+    def _pump(self):
+        while self._waiting and self._in_flight < self.max_in_flight:
+            entry = self._waiting.popleft()
+            if entry.cancelled:
+                entry.busy = False
+                continue
+            self._poll(entry)
+
+    def _poll(self, entry):
+        device = entry.device
+        self._reindex(entry)
+        self._in_flight += 1
+        d = entry.from_device.request(
+            protocol.ESV_CODE['GET'],
+            [protocol.Property(epc) for epc in entry.epcs],
+            device.eoj, device.node_id)
+        # replies are delivered to listeners and the device cache.
+        self._monitor.runtime.add_callbacks(
+            d,
+            lambda msg: self._on_done(entry),
+            lambda error: self._on_done(entry))
+
+    def _on_done(self, entry):
+        # the next polls are sent in a later turn, since a request
+        # failing at once calls back here from _poll().
+        entry.busy = False
+        self._in_flight -= 1
+        if self._waiting and self._pump_call is None:
+            self._pump_call = self._monitor.runtime.call_later(
+                0, self._on_pump)
+
+    def _on_pump(self):
+        self._pump_call = None
+        self._pump()
@@ -57,6 +57,15 @@ ESV_ERROR_CODES = (
     ESV_CODE['INF_SNA'],
     ESV_CODE['SETGET_SNA'],
 )
+# ESV codes of the response and error replies to each request ESV
+ESV_REPLY_CODES = {
+    ESV_CODE['SETI']:    (ESV_CODE['SETI_SNA'],),
+    ESV_CODE['SETC']:    (ESV_CODE['SET_RES'], ESV_CODE['SETC_SNA']),
+    ESV_CODE['GET']:     (ESV_CODE['GET_RES'], ESV_CODE['GET_SNA']),
+    ESV_CODE['INF_REQ']: (ESV_CODE['INF'], ESV_CODE['INF_SNA']),
+    ESV_CODE['SETGET']:  (ESV_CODE['SETGET_RES'], ESV_CODE['SETGET_SNA']),
+    ESV_CODE['INFC']:    (ESV_CODE['INFC_RES'],),
+}
 
 CLSGRP_CODE = {
     'SENSOR':               0x00,
@@ -129,24 +138,54 @@ EPC_NUM_SELF_NODE_CLASSES      = 0xd4
 EPC_INSTANCE_LIST_NOTIFICATION = 0xd5
 EPC_SELF_NODE_INSTANCE_LIST_S  = 0xd6
 EPC_SELF_NODE_CLASS_LIST_S     = 0xd7
+# the maximum number of instances listed in the instance list
+# properties (0xd5 and 0xd6) and of classes in the class list (0xd7).
+# More instances are notified by several 0xd5 notifications.
+MAX_LISTED_INSTANCES = 84
+MAX_LISTED_CLASSES = 8
 
 # EPC code for temperature sensor class
 EPC_TEMPERATURE = 0xe0
 
 # EPC code for Low-voltage smart electric enerty meter class
+EPC_CUMULATIVE_NORMAL            = 0xe0
 EPC_ELECTRIC_UNIT                = 0xe1
 EPC_HISTORICAL_CUMULATIVE_NORMAL = 0xe2
 EPC_INSTANTENEOUS_ELECTRIC       = 0xe7
 
 
+# EOJ instances are interned, so that the same 24-bit EOJ value is
+# always represented by one object.  The table is bounded; EOJs
+# created after it is full are still valid, just not shared.
+_EOJ_CACHE = {}
+_EOJ_CACHE_MAX = 65536
+
 class EOJ(object):
-    def __init__(self, clsgrp=0, cls=0, instance_id=0, eoj=None):
+    __slots__ = ('_eoj',)
+
+    def __new__(cls_, clsgrp=0, cls=0, instance_id=0, eoj=None):
         if eoj is None:
-            self._eoj = ((clsgrp << 16)
-                         | (cls << 8)
-                         | instance_id)
-        else:
-            self._eoj = eoj
+            eoj = ((clsgrp << 16)
+                   | (cls << 8)
+                   | instance_id)
+        self = _EOJ_CACHE.get(eoj)
+        if self is None:
+            self = super(EOJ, cls_).__new__(cls_)
+            object.__setattr__(self, '_eoj', eoj)
+            if len(_EOJ_CACHE) < _EOJ_CACHE_MAX:
+                _EOJ_CACHE[eoj] = self
+        return self
+
+    def __reduce__(self):
+        return (EOJ, (0, 0, 0, self._eoj))
+
+    # an EOJ is shared by the users of the same value, so it cannot be
+    # changed.
+    def __setattr__(self, name, value):
+        raise AttributeError('EOJ is immutable.')
+
+    def __delattr__(self, name):
+        raise AttributeError('EOJ is immutable.')
 
     @property
     def eoj(self):
@@ -165,7 +204,15 @@ class EOJ(object):
         return self._eoj & 0xff
 
     def __eq__(self, eoj):
-        return self._eoj == int(eoj)
+        if self is eoj:
+            return True
+        try:
+            return self._eoj == int(eoj)
+        except (TypeError, ValueError):
+            return NotImplemented
+
+    def __hash__(self):
+        return self._eoj
 
     def __int__(self):
         return self._eoj
@@ -189,9 +236,11 @@ class EOJ(object):
         return self.cls == cls
 
     def is_all_instance(self):
-        return self.instance_id == INS_ALL
+        return self.instance_id == INSTANCE_ALL
 
 class Message(object):
+    __slots__ = ('tid', 'seoj', 'deoj', 'esv', 'opc', 'properties')
+
     def __init__(self, tid=None, seoj=None, deoj=None,
                  esv=None, opc=None, properties=None):
         self.tid = tid
@@ -224,13 +273,27 @@ class Message(object):
             return ESV_DESC[esv]
         return '{0:#04x}'.format(esv)
 
+_EDT_TYPES = (bytearray, memoryview, list, tuple)
+
+def as_edt(edt):
+    # returns edt (bytes, bytearray, memoryview, or a list or tuple of
+    # ints) as bytes, or None if edt is None.
+    if edt is None or type(edt) is bytes:
+        return edt
+    if not isinstance(edt, _EDT_TYPES):
+        raise TypeError('EDT must be bytes or a sequence of ints, not '
+                        '{0}.'.format(type(edt).__name__))
+    return bytes(edt)
+
 class Property(object):
+    # a Property is immutable.  EDT is always held as bytes (or None
+    # if PDC is 0); lists or tuples of ints are converted on creation.
+    __slots__ = ('_epc', '_pdc', '_edt')
+
     def __init__(self, epc=None, edt=None):
         self._epc = epc
-        if edt is None:
-            self._pdc = 0
-        else:
-            self._pdc = len(edt)
+        edt = as_edt(edt)
+        self._pdc = 0 if edt is None else len(edt)
         self._edt = edt
 
     @property
@@ -256,72 +319,261 @@ class Property(object):
         return s
 
 COMMON_HDR_LEN = 12 # EHD1, EHD2, TID, SEOJ, DEOJ, ESV, and OPC
+_COMMON_HDR = struct.Struct('!2BH8B')
+_EPC_PDC = struct.Struct('!2B')
+
+class PropertyMap(object):
+    # A set of EPCs held as a 256 bit integer, for the status change,
+    # set and get property maps (0x9d, 0x9e and 0x9f).  Membership is
+    # a bit test, and iteration is in ascending order of EPC.  The EDT
+    # of a map is a count followed by the EPCs if there are less than
+    # 16 of them, otherwise a count followed by a 16 byte bitmap, in
+    # which bit (b - 8) of byte a is EPC (b << 4 | a), for b in 8..15.
+    __slots__ = ('_bits',)
+
+    BITMAP_THRESHOLD = 16
+
+    def __init__(self, epcs=()):
+        if isinstance(epcs, PropertyMap):
+            self._bits = epcs._bits
+            return
+        self._bits = 0
+        for epc in epcs:
+            self.add(epc)
+
+    def __contains__(self, epc):
+        return (self._bits >> epc) & 1 == 1
+
+    def __iter__(self):
+        bits = self._bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __len__(self):
+        return bin(self._bits).count('1')
+
+    def __eq__(self, other):
+        if isinstance(other, PropertyMap):
+            return self._bits == other._bits
+        try:
+            return self._bits == PropertyMap(other)._bits
+        except TypeError:
+            return NotImplemented
+
+    def __add__(self, epcs):
+        result = PropertyMap(self)
+        result += epcs
+        return result
+
+    def __iadd__(self, epcs):
+        for epc in epcs:
+            self.add(epc)
+        return self
+
+    def __str__(self):
+        return '[' + ', '.join('{0:#04x}'.format(epc) for epc in self) + ']'
+
+    def __repr__(self):
+        return 'PropertyMap({0})'.format(str(self))
+
+    def add(self, epc):
+        if not 0 <= epc <= 0xff:
+            raise ValueError('EPC {0!r} is out of range.'.format(epc))
+        self._bits |= 1 << epc
+
+    # list style names, for code written against the list maps
+    append = add
+    extend = __iadd__
+
+    def discard(self, epc):
+        self._bits &= ~(1 << epc)
+
+    def remove(self, epc):
+        if epc not in self:
+            raise KeyError(epc)
+        self.discard(epc)
+
+    def encode(self):
+        count = len(self)
+        if count < self.BITMAP_THRESHOLD:
+            return bytes([count] + list(self))
+        if self._bits & 0xffffffffffffffffffffffffffffffff:
+            raise EncodeError('EPCs below 0x80 cannot be in a bitmap.')
+        bitmap = bytearray(16)
+        for epc in self:
+            bitmap[epc & 0x0f] |= 1 << ((epc >> 4) - 8)
+        return bytes([count]) + bytes(bitmap)
+
+    @classmethod
+    def decode(cls, edt):
+        if not edt:
+            raise DecodeError('empty property map.')
+        count = edt[0]
+        if count < cls.BITMAP_THRESHOLD:
+            if len(edt) != count + 1:
+                raise DecodeError('property map of {0} EPCs in {1} '
+                                  'bytes.'.format(count, len(edt)))
+            return cls(edt[1:])
+        if len(edt) != 17:
+            raise DecodeError('bitmap property map of {0} bytes.'.format(
+                len(edt)))
+        result = cls()
+        bits = 0
+        for a in range(16):
+            byte = edt[a + 1]
+            for b in range(8):
+                if byte >> b & 1:
+                    bits |= 1 << ((b + 8) << 4 | a)
+        result._bits = bits
+        return result
+
+class DecodeError(ValueError):
+    pass
+
 def decode(data):
+    # walk the frame once over a memoryview, so that no intermediate
+    # slices of the datagram are created.  EDTs are copied out as
+    # bytes so that the resulting message does not pin the datagram.
+    # Malformed frames raise DecodeError.
+    view = memoryview(data)
+    data_len = len(view)
+
     # decode Echonet Lite header and SEOJ, DEOJ.
-    if len(data) < COMMON_HDR_LEN:
-        # not an Echonet Lite frame
-        print('not an Echonet Lite frame, missing common headers.')
-        return None
-    (ehd1, ehd1, tid,
+    if data_len < COMMON_HDR_LEN:
+        raise DecodeError('not an Echonet Lite frame, missing common headers.')
+    (ehd1, ehd2, tid,
      seoj0, seoj1, seoj2,
      deoj0, deoj1, deoj2,
-     esv, opc) = struct.unpack('!2BH8B',
-                               data[0:COMMON_HDR_LEN])
-    seoj = EOJ(seoj0, seoj1, seoj2)
-    deoj = EOJ(deoj0, deoj1, deoj2)
-
-    # decode EPCs
-    def decode_epc():
-        (epc, pdc) = struct.unpack('!2B', data[ptr:ptr+2])
-        edt = None
-        if pdc != 0:
-            edt = struct.unpack('!{0}B'.format(pdc), data[ptr+2:ptr+2+pdc])
-        pl = Property(epc, edt)
-        return (pl, 2 + pdc)
+     esv, opc) = _COMMON_HDR.unpack_from(view, 0)
+    if ehd1 != EHD1 or ehd2 != EHD2_FMT1:
+        raise DecodeError(
+            'unsupported Echonet Lite header ({0:#04x}, {1:#04x}).'.format(
+                ehd1, ehd2))
 
     msg = Message()
     msg.tid = tid
-    msg.seoj = seoj
-    msg.deoj = deoj
+    msg.seoj = EOJ(seoj0, seoj1, seoj2)
+    msg.deoj = EOJ(deoj0, deoj1, deoj2)
     msg.esv = esv
     msg.opc = opc
+
+    # decode EPCs
+    properties = msg.properties
+    unpack_epc_pdc = _EPC_PDC.unpack_from
     ptr = COMMON_HDR_LEN
-    nproperties = opc
-    while len(data[ptr:]) > 1:
-        (pl, pl_len) = decode_epc()
-        msg.properties.append(pl)
-        ptr += pl_len
-        nproperties -= 1
-    if nproperties != 0:
-        print('OPC count ({0}) and # of properties ({1}) doesn\'t match.'.format(
-            opc, opc - nproperties))
-        return None
+    for _ in range(opc):
+        if ptr + 2 > data_len:
+            raise DecodeError(
+                'OPC count ({0}) and # of properties ({1}) doesn\'t match.'.format(
+                    opc, len(properties)))
+        (epc, pdc) = unpack_epc_pdc(view, ptr)
+        ptr += 2
+        edt = None
+        if pdc != 0:
+            if ptr + pdc > data_len:
+                raise DecodeError(
+                    'PDC ({0}) of EPC {1:#04x} exceeds the frame.'.format(
+                        pdc, epc))
+            edt = view[ptr:ptr + pdc].tobytes()
+            ptr += pdc
+        properties.append(Property(epc, edt))
+    if ptr != data_len:
+        raise DecodeError(
+            '{0} trailing bytes after {1} properties.'.format(
+                data_len - ptr, opc))
 
     return msg
 
 
-def encode(message):
-    data = bytearray()
+class EncodeError(ValueError):
+    pass
+
+# pre-packed common headers keyed by (SEOJ, DEOJ, ESV).  Only TID and
+# OPC differ between messages sharing the same key, so they are
+# patched in place after copying the template.
+_HDR_TEMPLATES = {}
+_HDR_TEMPLATES_MAX = 4096
+_TID = struct.Struct('!H')
+_TID_OFFSET = 2
+_OPC_OFFSET = COMMON_HDR_LEN - 1
+_BYTES_TYPES = (bytes, bytearray, memoryview)
+
+def _get_header_template(seoj, deoj, esv):
+    key = (int(seoj), int(deoj), esv)
+    template = _HDR_TEMPLATES.get(key)
+    if template is None:
+        if len(_HDR_TEMPLATES) >= _HDR_TEMPLATES_MAX:
+            _HDR_TEMPLATES.clear()
+        (seoj, deoj, esv) = key
+        template = _COMMON_HDR.pack(EHD1,
+                                    EHD2_FMT1,
+                                    0,
+                                    (seoj >> 16) & 0xff,
+                                    (seoj >> 8) & 0xff,
+                                    seoj & 0xff,
+                                    (deoj >> 16) & 0xff,
+                                    (deoj >> 8) & 0xff,
+                                    deoj & 0xff,
+                                    esv,
+                                    0)
+        _HDR_TEMPLATES[key] = template
+    return template
+
+def encode_segment(epc, edt):
+    # returns the EPC, PDC and EDT of a property as bytes.
+    if edt is None:
+        return bytes((epc, 0))
+    return bytes((epc, len(edt))) + bytes(edt)
+
+def encode_segments(tid, seoj, deoj, esv, segments):
+    # encode a frame whose properties are already encoded by
+    # encode_segment().
+    header = bytearray(_get_header_template(seoj, deoj, esv))
+    _TID.pack_into(header, _TID_OFFSET, tid & 0xffff)
+    header[_OPC_OFFSET] = len(segments)
+    return b''.join([header] + segments)
+
+def encoded_len(message):
+    length = COMMON_HDR_LEN
+    for p in message.properties:
+        length += 2 + p.pdc
+    return length
+
+def encode_into(message, buffer, offset=0):
+    # encode the message into a writable buffer (a bytearray or a
+    # memoryview) starting at offset, and return the offset just
+    # after the encoded frame.
     if message.opc == None:
         message.opc = len(message.properties)
-
-    data += struct.pack('!2BH6B',
-                        EHD1,
-                        EHD2_FMT1,
-                        message.tid & 0xffff,
-                        message.seoj.clsgrp,
-                        message.seoj.cls,
-                        message.seoj.instance_id,
-                        message.deoj.clsgrp,
-                        message.deoj.cls,
-                        message.deoj.instance_id)
-    data += struct.pack('!B', message.esv)
-    data += struct.pack('!B', message.opc)
+    end = offset + encoded_len(message)
+    if end > len(buffer):
+        raise EncodeError('buffer too small, {0} bytes required.'.format(
+            end - offset))
+
+    buffer[offset:offset + COMMON_HDR_LEN] = _get_header_template(
+        message.seoj, message.deoj, message.esv)
+    _TID.pack_into(buffer, offset + _TID_OFFSET, message.tid & 0xffff)
+    buffer[offset + _OPC_OFFSET] = message.opc
+    ptr = offset + COMMON_HDR_LEN
     for p in message.properties:
-        data += struct.pack('!BB', p.epc, p.pdc)
-        if p.pdc > 0:
-            data += struct.pack('!{0}B'.format(p.pdc), *p.edt)
+        pdc = p.pdc
+        buffer[ptr] = p.epc
+        buffer[ptr + 1] = pdc
+        ptr += 2
+        if pdc > 0:
+            edt = p.edt
+            if not isinstance(edt, _BYTES_TYPES):
+                edt = bytes(edt)
+            buffer[ptr:ptr + pdc] = edt
+            ptr += pdc
+
+    return ptr
 
+def encode(message):
+    data = bytearray(encoded_len(message))
+    encode_into(message, data)
     return data
 
 
@@ -332,16 +584,8 @@ if __name__ == '__main__':
     m.deoj = EOJ(20,20,20)
     m.esv = 0x60
     m.opc = 2
-    req1 = Property()
-    req1.epc = 0x80
-    req1.pdc = 0x02
-    req1.edt = [0x01, 0x02]
-    m.properties.append(req1)
-    req2 = Property()
-    req2.epc = 0x81
-    req2.pdc = 0x03
-    req2.edt = [0x03, 0x04, 0x05]
-    m.properties.append(req2)
+    m.properties.append(Property(epc=0x80, edt=[0x01, 0x02]))
+    m.properties.append(Property(epc=0x81, edt=[0x03, 0x04, 0x05]))
     print(m)
     em = encode(m)
     m2 = decode(em)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import heapq
+import itertools
+
+# the number of datagrams sent in one wakeup of the event loop
+BATCH_SIZE = 64
+# the delay in seconds before retrying when the socket buffer is full
+RETRY_DELAY = 0.01
+
+class _Bucket(object):
+    # a token bucket of rate tokens per second, holding up to burst.
+    __slots__ = ('tokens', 'stamp')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.stamp = now
+
+    def wait(self, now, rate, burst):
+        # returns 0 if a token is available, otherwise the seconds to
+        # wait for one.
+        self.tokens = min(burst, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / rate
+
+
+class SendQueue(object):
+    # Queues encoded datagrams and sends them in batches from the event
+    # loop, without blocking it.  Datagrams to each destination are
+    # sent in order, destinations are served round robin, and sending
+    # can be paced by a global and a per-destination packet rate.
+    def __init__(self, monitor):
+        self._monitor = monitor
+        # packets per second and burst size; None means no limit
+        self.rate = None
+        self.burst = 1
+        self.destination_rate = None
+        self.destination_burst = 1
+        self._bucket = None
+        # _destination_buckets: a dict with key as node_id, value as
+        # _Bucket()
+        self._destination_buckets = {}
+        # _queues: a dict with key as node_id (None for multicast),
+        # value as a deque of datagrams
+        self._queues = {}
+        # _ready: destinations that can be sent to now
+        self._ready = collections.deque()
+        # _throttled: a heap of (time, seq, node_id) paced
+        # destinations.  seq breaks ties, since node_id may be None.
+        self._throttled = []
+        self._seq = itertools.count()
+        self._timer = None
+        self._timer_due = None
+
+    def set_pacing(self, rate=None, burst=1,
+                   destination_rate=None, destination_burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self._bucket = None
+        self._destination_buckets = {}
+
+    def __len__(self):
+        return sum(len(q) for q in self._queues.values())
+
+    def put(self, datagram, node_id=None):
+        queue = self._queues.get(node_id)
+        if queue is None:
+            queue = collections.deque()
+            self._queues[node_id] = queue
+            self._ready.append(node_id)
+        queue.append(datagram)
+        self._schedule(0)
+
+    def _schedule(self, delay):
+        runtime = self._monitor.runtime
+        due = runtime.now() + delay
+        if self._timer is not None:
+            if self._timer_due <= due:
+                return
+            self._timer.cancel()
+        self._timer_due = due
+        self._timer = runtime.call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self.flush()
+
+    def _wait_global(self, now):
+        if self.rate is None:
+            return 0
+        if self._bucket is None:
+            self._bucket = _Bucket(self.burst, now)
+        return self._bucket.wait(now, self.rate, self.burst)
+
+    def _wait_destination(self, node_id, now):
+        if self.destination_rate is None:
+            return 0
+        bucket = self._destination_buckets.get(node_id)
+        if bucket is None:
+            if len(self._destination_buckets) > 4096:
+                self._expire_buckets(now)
+            bucket = _Bucket(self.destination_burst, now)
+            self._destination_buckets[node_id] = bucket
+        return bucket.wait(now, self.destination_rate,
+                           self.destination_burst)
+
+    def _expire_buckets(self, now):
+        # forget the buckets which have been refilled completely.
+        refill = self.destination_burst / self.destination_rate
+        for node_id, bucket in list(self._destination_buckets.items()):
+            if now - bucket.stamp >= refill:
+                del self._destination_buckets[node_id]
+
+    def flush(self):
+        sender = self._monitor.sender
+        if sender is None:
+            return
+        now = self._monitor.runtime.now()
+        while self._throttled and self._throttled[0][0] <= now:
+            (_, _, node_id) = heapq.heappop(self._throttled)
+            self._ready.append(node_id)
+
+        stats = self._monitor.metrics
+        sent = 0
+        ready = self._ready
+        while ready and sent < BATCH_SIZE:
+            wait = self._wait_global(now)
+            if wait > 0:
+                self._schedule(wait)
+                return
+            node_id = ready[0]
+            wait = self._wait_destination(node_id, now)
+            if wait > 0:
+                ready.popleft()
+                heapq.heappush(self._throttled,
+                               (now + wait, next(self._seq), node_id))
+                continue
+            queue = self._queues[node_id]
+            datagram = queue[0]
+            try:
+                sender.sendDatagram(datagram, node_id)
+                stats.packets_out.inc()
+                stats.bytes_out.inc(value=len(datagram))
+            except BlockingIOError:
+                # the socket buffer is full, retry later.
+                self._schedule(RETRY_DELAY)
+                return
+            except OSError as e:
+                print('failed to send to {0}: {1}'.format(node_id, e))
+                stats.send_errors.inc()
+            if self._bucket is not None:
+                self._bucket.tokens -= 1
+            bucket = self._destination_buckets.get(node_id)
+            if bucket is not None:
+                bucket.tokens -= 1
+            queue.popleft()
+            ready.popleft()
+            if queue:
+                ready.append(node_id)
+            else:
+                del self._queues[node_id]
+            sent += 1
+
+        if ready:
+            # yield to the event loop before the next batch.
+            self._schedule(0)
+        elif self._throttled:
+            self._schedule(self._throttled[0][0] - now)
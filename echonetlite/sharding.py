@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Receive sharding over worker processes, to use more than one core.
+# A coordinator process receives all the datagrams of the Echonet Lite
+# port and hands each one to the worker owning its source node, chosen
+# by a hash of the address.  Each worker runs its own monitor with the
+# same self node devices, and decodes, dispatches and runs listeners
+# for the nodes of its shard only.  Only worker 0 multicasts discovery
+# requests; the replies are handed to their owners.  Workers report the
+# instance lists they learn to the coordinator, which shares them with
+# all the workers in Shard.nodes.
+#
+# A snapshot enabled by setup() is saved by each worker to its own
+# file, the path followed by '.' and the worker index, and each worker
+# restores only the nodes of its shard from it, since the replies to
+# its validation requests are handed to the owner.
+#
+# The coordinator hands datagrams off instead of letting the workers
+# bind the port with SO_REUSEPORT: the kernel spreads unicast
+# datagrams by its own hash but delivers multicast ones to every
+# socket, so the two would not agree on the owner of a node.
+#
+# The workers are started by the multiprocessing spawn method, since a
+# forked child would share the event loop of its parent.  setup must
+# be a module level function, and the main module guarded by
+# `if __name__ == '__main__'`.
+#
+#   def setup(shard):
+#       # called in each worker, returns the self node devices
+#       return [MyProfile(), middleware.Controller(instance_id=1)]
+#
+#   if __name__ == '__main__':
+#       sharding.run('192.168.1.2', setup, workers=4)
+
+import importlib
+import json
+import multiprocessing
+import os
+import selectors
+import socket
+import types
+import zlib
+
+from echonetlite.interfaces import monitor
+from echonetlite import interfaces
+from echonetlite import udp
+
+# the number of datagrams handled in one wakeup
+BATCH_SIZE = 64
+# the size of the receive buffers of the channels to the workers
+CHANNEL_BUFFER_SIZE = 4 * 1024 * 1024
+
+# types of the messages on the channels
+_DATAGRAM = b'D'
+_TOPOLOGY = b'T'
+
+def owner(node_id, workers):
+    # returns the index of the worker owning the node.  The hash does
+    # not depend on the process, unlike hash().
+    return zlib.crc32(node_id.encode()) % workers
+
+def _encode_datagram(node_id, datagram):
+    addr = node_id.encode()
+    return _DATAGRAM + bytes([len(addr)]) + addr + datagram
+
+def _decode_datagram(message):
+    n = message[1]
+    return (message[2:2 + n].decode(), message[2 + n:])
+
+def _encode_topology(node_id, instance_list):
+    if instance_list is not None:
+        instance_list = bytes(instance_list).hex()
+    return _TOPOLOGY + json.dumps([node_id, instance_list]).encode()
+
+def _decode_topology(message):
+    (node_id, instance_list) = json.loads(message[1:].decode())
+    if instance_list is not None:
+        instance_list = bytes.fromhex(instance_list)
+    return (node_id, instance_list)
+
+
+class Shard(object):
+    # The shard of a worker process, passed to setup().
+    def __init__(self, index, count, channel):
+        self.index = index
+        self.count = count
+        self._channel = channel
+        # nodes: a dict with key as node_id, value as the instance
+        # list EDT, of the nodes known by all the workers
+        self.nodes = {}
+
+    def owns(self, node_id):
+        return owner(node_id, self.count) == self.index
+
+    def _on_topology(self, node_id, instance_list):
+        # a change found by this worker.
+        self._update(node_id, instance_list)
+        try:
+            self._channel.send(_encode_topology(node_id, instance_list))
+        except OSError as e:
+            print('failed to report the topology: {0}'.format(e))
+
+    def _update(self, node_id, instance_list):
+        if instance_list is None:
+            self.nodes.pop(node_id, None)
+        else:
+            self.nodes[node_id] = instance_list
+
+    def _on_readable(self, on_did_receive_batch):
+        batch = []
+        for _ in range(BATCH_SIZE):
+            try:
+                message = self._channel.recv(65536)
+            except BlockingIOError:
+                break
+            if not message:
+                break
+            if message[:1] == _DATAGRAM:
+                (node_id, datagram) = _decode_datagram(message)
+                batch.append((datagram, node_id))
+            elif message[:1] == _TOPOLOGY:
+                self._update(*_decode_topology(message))
+        if batch:
+            on_did_receive_batch(batch)
+
+
+def _worker_adapter(adapter, shard):
+    # the adapter of a worker, receiving from the coordinator instead
+    # of the Echonet Lite port.
+    class Runtime(adapter.Runtime):
+        def listen(self, local_addr, on_did_receive,
+                   on_did_receive_batch=None):
+            if on_did_receive_batch is None:
+                on_did_receive_batch = lambda batch: [
+                    on_did_receive(*d) for d in batch]
+            self.add_reader(shard._channel,
+                            lambda: shard._on_readable(on_did_receive_batch))
+
+    return types.SimpleNamespace(Runtime=Runtime)
+
+def _worker_main(index, count, channel, node_id, setup, adapter_name,
+                 shell_port):
+    # modules cannot be passed to a spawned process, but their names.
+    adapter = importlib.import_module(adapter_name)
+    channel.setblocking(False)
+    shard = Shard(index, count, channel)
+    monitor.set_adapter(_worker_adapter(adapter, shard))
+    monitor.discovery_enabled = (index == 0)
+    monitor.add_topology_listener(shard._on_topology)
+    monitor.node_filter = shard.owns
+    devices = setup(shard)
+    if monitor.snapshot_path is not None:
+        monitor.enable_snapshot('{0}.{1}'.format(monitor.snapshot_path, index),
+                                monitor.snapshot_interval)
+    if shell_port is not None:
+        shell_port += index
+    monitor.start(node_id, devices, shell_port=shell_port)
+
+
+class Coordinator(object):
+    # Receives the datagrams of the Echonet Lite port and hands them to
+    # the workers, and relays the topology changes between them.
+    def __init__(self, node_id, setup, workers=None, adapter=None,
+                 shell_port=None):
+        self.node_id = node_id
+        self.count = workers or os.cpu_count() or 1
+        # nodes: a dict with key as node_id, value as the instance
+        # list EDT reported by the workers
+        self.nodes = {}
+        # handed: the number of datagrams handed to each worker
+        self.handed = [0] * self.count
+        self.dropped = 0
+        self._processes = []
+        self._channels = []
+        # the adapter of the workers, interfaces.DEFAULT_ADAPTER if None
+        if adapter is None:
+            adapter_name = interfaces.DEFAULT_ADAPTER
+        else:
+            adapter_name = adapter.__name__
+        context = multiprocessing.get_context('spawn')
+        for index in range(self.count):
+            (parent, child) = socket.socketpair(socket.AF_UNIX,
+                                                socket.SOCK_DGRAM)
+            for s in (parent, child):
+                s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                             CHANNEL_BUFFER_SIZE)
+            p = context.Process(target=_worker_main,
+                                args=(index, self.count, child, node_id,
+                                      setup, adapter_name, shell_port),
+                                daemon=True)
+            self._processes.append(p)
+            self._channels.append((parent, child))
+
+    def start(self):
+        for p in self._processes:
+            p.start()
+        channels = []
+        for (parent, child) in self._channels:
+            child.close()
+            parent.setblocking(False)
+            channels.append(parent)
+        self._channels = channels
+
+    def _hand(self, node_id, datagram):
+        index = owner(node_id, self.count)
+        try:
+            self._channels[index].send(_encode_datagram(node_id, datagram))
+            self.handed[index] += 1
+        except BlockingIOError:
+            # the worker is behind, drop as the kernel would.
+            self.dropped += 1
+
+    def _relay(self, index, message):
+        (node_id, instance_list) = _decode_topology(message)
+        if instance_list is None:
+            self.nodes.pop(node_id, None)
+        else:
+            self.nodes[node_id] = instance_list
+        for (i, channel) in enumerate(self._channels):
+            if i == index:
+                continue
+            try:
+                channel.send(message)
+            except BlockingIOError:
+                self.dropped += 1
+
+    def run(self):
+        # blocks until a worker exits or KeyboardInterrupt.
+        self.start()
+        sock = udp.multicast_socket(self.node_id)
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ, None)
+        for (index, channel) in enumerate(self._channels):
+            selector.register(channel, selectors.EVENT_READ, index)
+        try:
+            while all(p.is_alive() for p in self._processes):
+                for (key, _) in selector.select(timeout=1):
+                    if key.data is None:
+                        self._on_datagrams(sock)
+                    else:
+                        self._on_channel(key.fileobj, key.data)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            selector.close()
+            sock.close()
+            self.stop()
+
+    def _on_datagrams(self, sock):
+        for (datagram, node_id) in udp.drain(sock, BATCH_SIZE):
+            self._hand(node_id, datagram)
+
+    def _on_channel(self, channel, index):
+        for _ in range(BATCH_SIZE):
+            try:
+                message = channel.recv(65536)
+            except BlockingIOError:
+                return
+            if message[:1] == _TOPOLOGY:
+                self._relay(index, message)
+
+    def stop(self):
+        for p in self._processes:
+            if p.is_alive():
+                p.terminate()
+        for p in self._processes:
+            p.join()
+        for channel in self._channels:
+            channel.close()
+
+def run(node_id, setup, workers=None, adapter=None, shell_port=None):
+    # run setup(shard) and a monitor in each of workers processes.
+    # The worker i listens to the shell on shell_port + i.
+    Coordinator(node_id, setup, workers, adapter, shell_port).run()
@@ -1,25 +1,35 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from twisted.internet import reactor
+import asyncio
+import json
+
 from twisted.internet.protocol import Protocol
 
 import echonetlite
 from echonetlite import protocol
 
-class ShellServer(Protocol):
-    def dataReceived(self, data):
-        command = data.decode('utf-8').rstrip()
+class ShellCommands(object):
+    # Shell commands shared by the Twisted and asyncio servers.  A
+    # subclass provides write() and close().
+    def execute(self, command):
+        monitor = echonetlite.interfaces.monitor
         if command == 'search':
-            reactor.callWhenRunning(self.do_search)
+            monitor.schedule_call(0, self.do_search)
         elif command == 'list_nodes':
-            for node_id in echonetlite.interfaces.monitor.nodes:
-                self.transport.write(str(echonetlite.interfaces.monitor.nodes[node_id]).encode('utf-8'))
-                self.transport.write('\n'.encode('utf-8'))
+            for node_id in monitor.nodes:
+                self.write(str(monitor.nodes[node_id]).encode('utf-8'))
+                self.write('\n'.encode('utf-8'))
+        elif command == 'metrics':
+            self.write(monitor.metrics.to_prometheus().encode('utf-8'))
+        elif command == 'metrics json':
+            self.write(json.dumps(monitor.metrics.snapshot(),
+                                  sort_keys=True).encode('utf-8'))
+            self.write('\n'.encode('utf-8'))
         elif command == 'shutdown':
-            reactor.stop()
+            monitor.stop()
         elif command == 'quit':
-            self.transport.loseConnection()
+            self.close()
         else:
             print('unknown command {0}.'.format(command))
 
@@ -29,4 +39,27 @@ class ShellServer(Protocol):
                      props=[protocol.Property(epc=0xd6),],
                      to_eoj=protocol.EOJ(protocol.CLSGRP_CODE['PROFILE'],
                                          protocol.CLS_PR_CODE['PROFILE'],
-                                         protocol.INS_PR_NORMAL))
+                                         protocol.INSTANCE_PR_NORMAL))
+
+class ShellServer(ShellCommands, Protocol):
+    def dataReceived(self, data):
+        self.execute(data.decode('utf-8').rstrip())
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def close(self):
+        self.transport.loseConnection()
+
+class AsyncioShellServer(ShellCommands, asyncio.Protocol):
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.execute(data.decode('utf-8').rstrip())
+
+    def write(self, data):
+        self.transport.write(data)
+
+    def close(self):
+        self.transport.close()
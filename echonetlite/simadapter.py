@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# A simulated network adapter.  Instead of sockets, the monitor is
+# attached to an in-memory Network of virtual nodes which answer
+# Echonet Lite requests by themselves.  Discovery, polling and
+# dispatch can be load tested with thousands of nodes in one process.
+#
+#   network = simadapter.Network(latency=0.002, loss=0.01)
+#   for i in range(1000):
+#       network.add_node('10.1.{0}.{1}'.format(i >> 8, i & 0xff),
+#                        [simadapter.VirtualDevice(eoj, {0xe0: b'\x00\xf0'})])
+#   monitor.set_adapter(simadapter, network=network)
+#   monitor.start(node_id='10.0.0.1', devices=[...])
+
+import ipaddress
+import random
+
+from echonetlite import asyncioadapter
+from echonetlite.protocol import *
+
+_NODE_PROFILE_EOJ = EOJ(CLSGRP_CODE['PROFILE'],
+                        CLS_PR_CODE['PROFILE'],
+                        INSTANCE_PR_NORMAL)
+
+def _eoj_bytes(eoj):
+    return bytes([eoj.clsgrp, eoj.cls, eoj.instance_id])
+
+
+class VirtualDevice(object):
+    # an object of a virtual node.  properties is a dict with key as
+    # EPC, value as EDT.  All the properties can be read; set_epcs
+    # lists the properties that can be written.
+    def __init__(self, eoj, properties=None, set_epcs=()):
+        self.eoj = eoj
+        self.properties = {}
+        self.properties[EPC_OPERATING_STATUS] = bytes(
+            [EDT_OPERATING_STATUS_BOOTING])
+        self.properties[EPC_VERSION_INFORMATION] = bytes([0x00, 0x00,
+                                                          0x52, 0x01])
+        self.properties[EPC_FAULT_STATUS] = bytes([EDT_FAULT_NOT_OCCURRED])
+        self.properties[EPC_MANUFACTURE_CODE] = bytes([0xff, 0xff, 0xff])
+        if properties is not None:
+            for (epc, edt) in properties.items():
+                self.properties[epc] = bytes(edt)
+        self.set_epcs = set(set_epcs)
+        self.update_property_maps()
+
+    def update_property_maps(self):
+        get_epcs = set(self.properties) | {EPC_STATUS_CHANGE_PROPERTY_MAP,
+                                           EPC_SET_PROPERTY_MAP,
+                                           EPC_GET_PROPERTY_MAP}
+        self.properties[EPC_STATUS_CHANGE_PROPERTY_MAP] = PropertyMap(
+            [EPC_OPERATING_STATUS]).encode()
+        self.properties[EPC_SET_PROPERTY_MAP] = PropertyMap(
+            self.set_epcs).encode()
+        self.properties[EPC_GET_PROPERTY_MAP] = PropertyMap(get_epcs).encode()
+
+    def get(self, epc):
+        # returns EDT, or None if the property cannot be read.
+        return self.properties.get(epc)
+
+    def set(self, epc, edt):
+        # returns True if the property was written.
+        if epc not in self.set_epcs:
+            return False
+        self.properties[epc] = bytes(edt)
+        return True
+
+
+class VirtualNode(object):
+    # A simulated Echonet Lite node with a node profile and devices.
+    # latency, jitter (seconds) and loss (probability) of the link to
+    # this node override the defaults of the network.  Override
+    # handle() to change how the node responds.
+    # esv_codes: the ESVs of the messages delivered to the node
+    esv_codes = frozenset((ESV_CODE['GET'], ESV_CODE['INF_REQ'],
+                           ESV_CODE['SETI'], ESV_CODE['SETC']))
+
+    def __init__(self, network, node_id, devices=(), latency=None,
+                 jitter=None, loss=None):
+        self.network = network
+        self.node_id = node_id
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.profile = VirtualDevice(_NODE_PROFILE_EOJ)
+        self.profile.properties[EPC_IDENTIFICATION_NUMBER] = (
+            bytes([0xfe, 0xff, 0xff, 0xff])
+            + ipaddress.ip_address(node_id).packed.rjust(13, b'\0'))
+        # devices: a dict with key as int(EOJ), value as VirtualDevice()
+        self.devices = {}
+        for device in devices:
+            self.devices[int(device.eoj)] = device
+        self.update_profile()
+
+    def add_device(self, device, announce=True):
+        self.devices[int(device.eoj)] = device
+        self.update_profile()
+        if announce:
+            self.announce()
+
+    def remove_device(self, eoj, announce=True):
+        del self.devices[int(eoj)]
+        self.update_profile()
+        if announce:
+            self.announce()
+
+    def update_profile(self):
+        eojs = sorted(self.devices)
+        grpclses = sorted({eoj >> 8 for eoj in eojs})
+        instances = b''.join(_eoj_bytes(self.devices[eoj].eoj)
+                             for eoj in eojs[:MAX_LISTED_INSTANCES])
+        instance_list = bytes([min(len(eojs), 0xff)]) + instances
+        props = self.profile.properties
+        props[EPC_NUM_SELF_NODE_INSTANCES] = len(eojs).to_bytes(3, 'big')
+        # the node profile class is counted too.
+        props[EPC_NUM_SELF_NODE_CLASSES] = (len(grpclses) + 1).to_bytes(
+            2, 'big')
+        props[EPC_INSTANCE_LIST_NOTIFICATION] = instance_list
+        props[EPC_SELF_NODE_INSTANCE_LIST_S] = instance_list
+        props[EPC_SELF_NODE_CLASS_LIST_S] = bytes(
+            [min(len(grpclses), 0xff)]
+            + [b for gc in grpclses[:MAX_LISTED_CLASSES]
+               for b in ((gc >> 8) & 0xff, gc & 0xff)])
+        self.profile.update_property_maps()
+
+    def find_devices(self, deoj):
+        # returns the objects a message to deoj is destined to.
+        if deoj.is_clsgrp(CLSGRP_CODE['PROFILE']):
+            if (deoj.cls == CLS_PR_CODE['PROFILE']
+                and deoj.instance_id in (INSTANCE_ALL,
+                                         INSTANCE_PR_NORMAL,
+                                         INSTANCE_PR_SENDONLY)):
+                return [self.profile]
+            return []
+        if deoj.is_all_instance():
+            grpcls = int(deoj) >> 8
+            return [d for (eoj, d) in self.devices.items()
+                    if eoj >> 8 == grpcls]
+        device = self.devices.get(int(deoj))
+        if device is None:
+            return []
+        return [device]
+
+    def announce(self):
+        # multicast the instance list, as a node does when it boots.
+        self.send(Message(tid=0,
+                          seoj=self.profile.eoj,
+                          deoj=_NODE_PROFILE_EOJ,
+                          esv=ESV_CODE['INF'],
+                          properties=[Property(
+                              EPC_INSTANCE_LIST_NOTIFICATION,
+                              self.profile.get(
+                                  EPC_INSTANCE_LIST_NOTIFICATION))]))
+
+    def notify(self, device, epcs):
+        # multicast the current values of the properties of a device.
+        self.send(Message(tid=0,
+                          seoj=device.eoj,
+                          deoj=_NODE_PROFILE_EOJ,
+                          esv=ESV_CODE['INF'],
+                          properties=[Property(epc, device.get(epc))
+                                      for epc in epcs]))
+
+    def send(self, msg, to_node_id=None):
+        self.network.transmit(bytes(encode(msg)), self.node_id, to_node_id)
+
+    def on_did_receive(self, msg, from_node_id):
+        for device in self.find_devices(msg.deoj):
+            reply = self.handle(device, msg)
+            if reply is None:
+                continue
+            if reply.esv == ESV_CODE['INF']:
+                # INF is a reply to INF_REQ, and is multicast.
+                self.send(reply)
+            else:
+                self.send(reply, from_node_id)
+
+    def handle(self, device, msg):
+        # returns the reply of device to msg, or None.
+        esv = msg.esv
+        props = []
+        failed = False
+        if esv in (ESV_CODE['GET'], ESV_CODE['INF_REQ']):
+            for p in msg.properties:
+                edt = device.get(p.epc)
+                if edt is None:
+                    failed = True
+                props.append(Property(p.epc, edt))
+            if esv == ESV_CODE['GET']:
+                reply_esv = ESV_CODE['GET_SNA' if failed else 'GET_RES']
+            else:
+                reply_esv = ESV_CODE['INF_SNA' if failed else 'INF']
+        elif esv in (ESV_CODE['SETI'], ESV_CODE['SETC']):
+            for p in msg.properties:
+                if p.pdc > 0 and device.set(p.epc, p.edt):
+                    props.append(Property(p.epc))
+                else:
+                    failed = True
+                    props.append(Property(p.epc, p.edt))
+            if esv == ESV_CODE['SETI']:
+                if not failed:
+                    return None
+                reply_esv = ESV_CODE['SETI_SNA']
+            else:
+                reply_esv = ESV_CODE['SETC_SNA' if failed else 'SET_RES']
+        else:
+            return None
+        return Message(tid=msg.tid,
+                       seoj=device.eoj,
+                       deoj=msg.seoj,
+                       esv=reply_esv,
+                       properties=props)
+
+
+class Network(object):
+    # An in-memory LAN.  Datagrams are delivered to their destination
+    # after latency plus a random jitter up to jitter seconds, and
+    # are dropped with the probability loss.  A multicast datagram is
+    # delivered to every node but its sender.  The parameters of a
+    # virtual node apply to the datagrams it sends and receives.
+    # node_class: the class of the nodes created by add_node()
+    node_class = VirtualNode
+
+    def __init__(self, latency=0.001, jitter=0.0, loss=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self._random = random.Random(seed)
+        self._runtime = None
+        # nodes: a dict with key as node_id, value as VirtualNode()
+        self.nodes = {}
+        # _hosts: a dict with key as node_id, value as on_did_receive()
+        # of an attached monitor
+        self._hosts = {}
+        self.sent = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def add_node(self, node_id, devices=(), **kwargs):
+        node = self.node_class(self, node_id, devices, **kwargs)
+        self.nodes[node_id] = node
+        return node
+
+    def remove_node(self, node_id):
+        del self.nodes[node_id]
+
+    def announce_all(self):
+        for node in list(self.nodes.values()):
+            node.announce()
+
+    def attach(self, runtime, node_id, on_did_receive):
+        self._runtime = runtime
+        self._hosts[node_id] = on_did_receive
+
+    def detach(self, node_id):
+        self._hosts.pop(node_id, None)
+
+    def _link(self, node, name):
+        if node is not None:
+            value = getattr(node, name)
+            if value is not None:
+                return value
+        return getattr(self, name)
+
+    def transmit(self, datagram, from_node_id, to_node_id=None):
+        self.sent += 1
+        if to_node_id is None:
+            to_node_ids = [n for n in self.nodes if n != from_node_id]
+            to_node_ids += [n for n in self._hosts if n != from_node_id]
+        else:
+            to_node_ids = [to_node_id]
+        sender = self.nodes.get(from_node_id)
+        msg = None
+        for node_id in to_node_ids:
+            node = self.nodes.get(node_id)
+            on_did_receive = self._hosts.get(node_id)
+            if node is None and on_did_receive is None:
+                self.dropped += 1
+                continue
+            if node is not None:
+                # virtual nodes share the decoded message, and only
+                # get the messages they respond to.
+                if msg is None:
+                    try:
+                        msg = decode(datagram)
+                    except DecodeError:
+                        self.dropped += 1
+                        continue
+                if msg.esv not in node.esv_codes:
+                    continue
+            link = node or sender
+            if self._random.random() < self._link(link, 'loss'):
+                self.dropped += 1
+                continue
+            delay = (self._link(link, 'latency')
+                     + self._random.uniform(0, self._link(link, 'jitter')))
+            if node is not None:
+                self._runtime.call_later(delay, self._deliver_to_node,
+                                         node, msg, from_node_id)
+            else:
+                self._runtime.call_later(delay, self._deliver_to_host,
+                                         on_did_receive, datagram,
+                                         from_node_id)
+
+    def _deliver_to_node(self, node, msg, from_node_id):
+        if self.nodes.get(node.node_id) is not node:
+            # removed while the datagram was in flight.
+            self.dropped += 1
+            return
+        self.delivered += 1
+        node.on_did_receive(msg, from_node_id)
+
+    def _deliver_to_host(self, on_did_receive, datagram, from_node_id):
+        self.delivered += 1
+        on_did_receive(datagram, from_node_id)
+
+
+class Sender(object):
+    # sends the datagrams of local_addr to network, a Network().
+    def __init__(self, local_addr, network):
+        self._local_addr = local_addr
+        self._network = network
+
+    def sendDatagram(self, datagram, node_id=None):
+        self._network.transmit(bytes(datagram), self._local_addr, node_id)
+
+
+class Runtime(asyncioadapter.Runtime):
+    # The asyncio event loop with the monitor attached to a simulated
+    # network instead of a socket.
+    # e.g. monitor.set_adapter(simadapter, network=Network())
+    def __init__(self, network=None, loop=None):
+        super(Runtime, self).__init__(loop=loop)
+        if network is None:
+            network = Network()
+        self.network = network
+        self._node_ids = []
+
+    def new_sender(self, local_addr):
+        return Sender(local_addr, self.network)
+
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        self.network.attach(self, local_addr, on_did_receive)
+        self._node_ids.append(local_addr)
+
+    def stop(self):
+        for node_id in self._node_ids:
+            self.network.detach(node_id)
+        self._node_ids = []
+        super(Runtime, self).stop()
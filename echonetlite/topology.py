@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Snapshots of the known nodes, for a warm start.  A snapshot lists,
+# for each remote node, the last instance list (0xd6) received from
+# it and the property maps of its devices, and is saved as JSON.  On
+# start, the node profile re-creates the devices from the snapshot
+# through on_did_find_device(), and then confirms the instance list of
+# each node in the background.  See Monitor.enable_snapshot().
+
+import json
+import os
+import time
+
+from echonetlite import middleware
+from echonetlite.protocol import *
+
+VERSION = 1
+
+# the properties of remote devices kept in a snapshot
+SNAPSHOT_EPCS = (
+    EPC_STATUS_CHANGE_PROPERTY_MAP,
+    EPC_SET_PROPERTY_MAP,
+    EPC_GET_PROPERTY_MAP,
+)
+
+def take(monitor):
+    # returns a snapshot of the nodes known by the monitor.
+    profile = monitor.get_self_node().get_profile()
+    nodes = []
+    for (node_id, node) in monitor.nodes.items():
+        if node_id == monitor.node_id:
+            continue
+        instance_list = profile.get_instance_list(node_id)
+        if instance_list is None:
+            continue
+        devices = {}
+        for device in node.devices.values():
+            if not isinstance(device, middleware.RemoteDevice):
+                continue
+            props = {}
+            for epc in SNAPSHOT_EPCS:
+                edt = device.properties.get(epc)
+                if edt is not None:
+                    props['{0:02x}'.format(epc)] = bytes(edt).hex()
+            if props:
+                devices['{0:06x}'.format(int(device.eoj))] = props
+        nodes.append({
+            'node_id': node_id,
+            'instance_list': bytes(instance_list).hex(),
+            'devices': devices,
+        })
+    return {'version': VERSION, 'time': time.time(), 'nodes': nodes}
+
+def save(monitor, path):
+    # written to a temporary file first, so that a crash does not
+    # leave a broken snapshot.
+    data = json.dumps(take(monitor), separators=(',', ':'))
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def load(path):
+    # returns a list of (node_id, instance list EDT, {EOJ: [Property]})
+    # of the nodes in the snapshot, or an empty list if there is no
+    # usable snapshot.
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return []
+    except ValueError as e:
+        print('ignored the broken snapshot {0}: {1}'.format(path, e))
+        return []
+    if snapshot.get('version') != VERSION:
+        return []
+    nodes = []
+    for n in snapshot.get('nodes', ()):
+        devices = {}
+        for (eoj, props) in n.get('devices', {}).items():
+            devices[EOJ(eoj=int(eoj, 16))] = [
+                Property(int(epc, 16), bytes.fromhex(edt))
+                for (epc, edt) in props.items()]
+        nodes.append((n['node_id'], bytes.fromhex(n['instance_list']),
+                      devices))
+    return nodes
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Receiving from the Echonet Lite multicast port in batches.  When a
+# socket becomes readable, up to batch_size datagrams are read in one
+# go and passed together to the batch callback, instead of one event
+# loop callback per datagram.  The standard library has no
+# recvmmsg(), so the batch is read by a bounded loop of recvfrom()
+# on a non-blocking socket.
+#
+# The multicast group and port, and the Sender of datagrams, are
+# defined here for all the socket adapters.
+
+import errno
+import socket
+
+echonet_lite_group = '224.0.23.0'
+# echonet_lite_group_IPv6 = 'ff02::1'
+echonet_lite_port = 3610
+
+# the default number of datagrams read in one batch
+BATCH_SIZE = 64
+MAX_DATAGRAM_SIZE = 65536
+# the receive buffer size requested for bursts of replies, limited by
+# the kernel (net.core.rmem_max on Linux)
+RECEIVE_BUFFER_SIZE = 4 * 1024 * 1024
+# errors of recvfrom() caused by earlier sends (ICMP errors), after
+# which the socket can still be read
+_TRANSIENT_ERRNOS = frozenset((
+    errno.ECONNREFUSED,
+    errno.EHOSTUNREACH,
+    errno.ENETUNREACH,
+    errno.EHOSTDOWN,
+    errno.ENETDOWN,
+))
+
+def multicast_socket(local_addr):
+    # a non-blocking socket bound to the Echonet Lite port, joined to
+    # the multicast group on the interface of local_addr.
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+    sock.bind(('', echonet_lite_port))
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    sock.setsockopt(socket.IPPROTO_IP,
+                    socket.IP_ADD_MEMBERSHIP,
+                    socket.inet_aton(echonet_lite_group)
+                    + socket.inet_aton(local_addr or '0.0.0.0'))
+    sock.setblocking(False)
+    return sock
+
+class Sender(object):
+    def __init__(self, local_addr):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.IPPROTO_IP,
+                               socket.IP_MULTICAST_IF,
+                               socket.inet_aton(local_addr))
+        self.socket.setblocking(False)
+
+    def sendDatagram(self, datagram, node_id=None):
+        # raises BlockingIOError when the socket buffer is full.
+        if node_id is None:
+            address = (echonet_lite_group, echonet_lite_port)
+        else:
+            address = (node_id, echonet_lite_port)
+        self.socket.sendto(datagram, address)
+
+def drain(sock, batch_size=BATCH_SIZE):
+    # returns a list of (datagram, node_id) read from sock, at most
+    # batch_size of them.  At most batch_size reads are tried, and
+    # reading stops at the first error which is not transient, such
+    # as a closed socket.
+    batch = []
+    recvfrom = sock.recvfrom
+    for _ in range(batch_size):
+        try:
+            (datagram, address) = recvfrom(MAX_DATAGRAM_SIZE)
+        except (BlockingIOError, InterruptedError):
+            break
+        except OSError as e:
+            if e.errno in _TRANSIENT_ERRNOS:
+                continue
+            print('receive error: {0}'.format(e))
+            break
+        batch.append((datagram, address[0]))
+    return batch
+
+
+class BatchReceiver(object):
+    # reads batches from the multicast socket of local_addr when the
+    # event loop reports it readable, and passes each batch to
+    # on_did_receive_batch(batch).
+    def __init__(self, local_addr, on_did_receive_batch,
+                 batch_size=BATCH_SIZE):
+        self.socket = multicast_socket(local_addr)
+        self._on_did_receive_batch = on_did_receive_batch
+        self._batch_size = batch_size
+
+    def on_readable(self):
+        batch = drain(self.socket, self._batch_size)
+        if batch:
+            self._on_did_receive_batch(batch)
+
+    def close(self):
+        self.socket.close()
@@ -1,36 +1,27 @@
 import argparse
-import struct
 
 from echonetlite.interfaces import monitor
+from echonetlite import edtcodec
 from echonetlite import middleware
 from echonetlite.protocol import *
 
 class Temperature(middleware.RemoteDevice):
     def __init__(self, eoj, node_id):
-        super(Temperature, self).__init__(eoj=eoj)
-        self._node_id = node_id
-        monitor.schedule_loopingcall(
-            10,
-            self._request_temperature,
-            from_device=controller,
-            to_eoj=self.eoj,
-            to_node_id=self._node_id)
+        super(Temperature, self).__init__(eoj=eoj, node_id=node_id)
+        monitor.poller.add(self,
+                           [EPC_TEMPERATURE,],
+                           10,
+                           from_device=controller)
 
         self.add_listener(EPC_TEMPERATURE,
                           self._on_did_receive_temperature)
 
-    def _request_temperature(self, from_device, to_eoj, to_node_id):
-        from_device.send(esv=ESV_CODE['GET'],
-                         props=[Property(epc=EPC_TEMPERATURE),],
-                         to_eoj=to_eoj,
-                         to_node_id=to_node_id)
-
     def _on_did_receive_temperature(self, from_node_id, from_eoj,
                                     to_device, esv, prop):
         if esv not in ESV_RESPONSE_CODES:
             return
-        (val,) = struct.unpack('!h', bytearray(prop.edt))
-        print('Temperature is', val / 10)
+        print('Temperature is',
+              edtcodec.registry.decode_property(from_eoj, prop))
 
 class MyProfile(middleware.NodeProfile):
     def __init__(self, eoj=None):
@@ -18,6 +18,7 @@ setup(name='echonetlite',
       url='https://github.com/keiichishima/echonetlite',
       packages=['echonetlite'],
       install_requires=['Twisted>=16.3.0'],
+      extras_require={'numpy': ['numpy']},
       classifiers=[
           'Development Status :: 4 - Beta',
           'Environment :: Console',
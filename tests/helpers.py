@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Fakes of the monitor, its runtime and sender for tests which drive
+# the time by hand.
+
+import heapq
+import itertools
+import os
+import subprocess
+import sys
+import types
+import unittest
+
+import echonetlite.interfaces
+from echonetlite import metrics
+from echonetlite import middleware
+from echonetlite import protocol
+
+
+class FakeCall(object):
+    def __init__(self, runtime, due, callback, args, kwargs):
+        self._runtime = runtime
+        self.due = due
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeDeferred(object):
+    # a Deferred fired at most once, with callbacks run when it fires.
+    def __init__(self, canceller=None):
+        self._canceller = canceller
+        self.called = False
+        self.result = None
+        self.error = None
+        self._callbacks = []
+
+    def fire(self, result=None, error=None):
+        if self.called:
+            return
+        self.called = True
+        self.result = result
+        self.error = error
+        for (callback, errback) in self._callbacks:
+            self._run(callback, errback)
+        self._callbacks = []
+
+    def _run(self, callback, errback):
+        if self.error is not None:
+            errback(self.error)
+        else:
+            callback(self.result)
+
+    def add_callbacks(self, callback, errback):
+        if self.called:
+            self._run(callback, errback)
+        else:
+            self._callbacks.append((callback, errback))
+
+    def cancel(self):
+        if not self.called and self._canceller is not None:
+            self._canceller()
+
+
+class FakeRuntime(object):
+    # runs the scheduled calls when the time is advanced by advance().
+    def __init__(self, **kwargs):
+        self._now = 1000.0
+        self._calls = []
+        self._seq = itertools.count()
+
+    def now(self):
+        return self._now
+
+    def call_soon(self, callback, *args, **kwargs):
+        return self.call_later(0, callback, *args, **kwargs)
+
+    def call_later(self, delay, callback, *args, **kwargs):
+        call = FakeCall(self, self._now + delay, callback, args, kwargs)
+        heapq.heappush(self._calls, (call.due, next(self._seq), call))
+        return call
+
+    def advance(self, seconds=0):
+        # run the calls due within seconds from now, in order.
+        end = self._now + seconds
+        while self._calls and self._calls[0][0] <= end:
+            (due, _, call) = heapq.heappop(self._calls)
+            self._now = max(self._now, due)
+            if not call.cancelled:
+                call.callback(*call.args, **call.kwargs)
+        self._now = end
+
+    def looping_call(self, interval, callback, **kwargs):
+        return None
+
+    def new_deferred(self, canceller):
+        return FakeDeferred(canceller)
+
+    def resolve(self, d, result):
+        d.fire(result=result)
+
+    def reject(self, d, error):
+        d.fire(error=error)
+
+    def add_callbacks(self, d, callback, errback):
+        d.add_callbacks(callback, errback)
+
+    def succeeded(self, result):
+        d = FakeDeferred()
+        d.fire(result=result)
+        return d
+
+    def failed(self, error):
+        d = FakeDeferred()
+        d.fire(error=error)
+        return d
+
+    def new_sender(self, local_addr):
+        return FakeSender(local_addr)
+
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        pass
+
+    def listen_shell(self, port):
+        pass
+
+    def run(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class FakeSender(object):
+    def __init__(self, local_addr=None):
+        # sent: a list of (datagram, node_id)
+        self.sent = []
+
+    def sendDatagram(self, datagram, node_id=None):
+        self.sent.append((bytes(datagram), node_id))
+
+
+class FakeMonitor(object):
+    def __init__(self):
+        self.runtime = FakeRuntime()
+        self.sender = FakeSender()
+        self.metrics = metrics.Metrics()
+
+
+fake_adapter = types.SimpleNamespace(Runtime=FakeRuntime)
+
+def new_monitor():
+    # replaces the global monitor with a new one on the fake adapter.
+    # Devices must be created after this, since they schedule calls on
+    # the monitor.
+    monitor = echonetlite.interfaces.Monitor()
+    monitor.set_adapter(fake_adapter)
+    echonetlite.interfaces.monitor = monitor
+    return monitor
+
+SELF_NODE_ID = '192.0.2.1'
+
+class MonitorTestCase(unittest.TestCase):
+    # starts a node of a NodeProfile on a new fake monitor for each
+    # test, and restores the global monitor after it.  The messages
+    # sent in the start are dropped unless settle is False.
+    settle = True
+
+    def setUp(self):
+        self._saved_monitor = echonetlite.interfaces.monitor
+        self.addCleanup(setattr, echonetlite.interfaces, 'monitor',
+                        self._saved_monitor)
+        self.monitor = new_monitor()
+        self.profile = middleware.NodeProfile()
+        self.monitor.start(SELF_NODE_ID, [self.profile], shell_port=None)
+        if self.settle:
+            self.monitor.runtime.advance(1)
+            sent_messages(self.monitor)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def run_python(source):
+    # runs source in a new interpreter and returns its output, for the
+    # tests of the Twisted reactor, which can run only once and whose
+    # import cannot be undone.
+    output = subprocess.check_output([sys.executable, '-c', source],
+                                     cwd=ROOT, timeout=30)
+    return output.decode().strip()
+
+def sent_messages(monitor):
+    # returns a list of (Message(), node_id) sent so far, and clears it.
+    sent = monitor.sender.sent
+    monitor.sender.sent = []
+    return [(protocol.decode(datagram), node_id)
+            for (datagram, node_id) in sent]
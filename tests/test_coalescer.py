@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import coalescer
+from echonetlite.interfaces import RequestError, RequestTimeoutError
+from echonetlite.protocol import *
+from tests import helpers
+
+NODE_ID = '192.0.2.2'
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EPC_TEMPERATURE = 0xe0
+
+
+class GetCoalescerTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(GetCoalescerTest, self).setUp()
+        self.monitor.enable_coalescing(window=0.05)
+
+    def _deferred(self, epcs, eoj=EOJ_SENSOR, timeout=None, retries=None):
+        # returns the Deferred of the request, and a list of its result.
+        results = []
+        d = self.profile.request(ESV_CODE['GET'],
+                                 [Property(epc) for epc in epcs],
+                                 eoj, NODE_ID, timeout, retries)
+        self.monitor.runtime.add_callbacks(
+            d, results.append, lambda error: results.append(error))
+        return (d, results)
+
+    def _request(self, epcs, eoj=EOJ_SENSOR, timeout=None, retries=None):
+        return self._deferred(epcs, eoj, timeout, retries)[1]
+
+    def _flush(self):
+        self.monitor.runtime.advance(0.05)
+        return helpers.sent_messages(self.monitor)
+
+    def _reply(self, request, esv, props):
+        msg = Message(tid=request.tid, seoj=request.deoj,
+                      deoj=request.seoj, esv=esv, opc=len(props),
+                      properties=props)
+        self.monitor.on_did_receive(encode(msg), NODE_ID)
+
+    def test_merged_and_split(self):
+        first = self._request([EPC_TEMPERATURE, 0x80])
+        second = self._request([0x80, 0x81])
+        [(msg, node_id)] = self._flush()
+        self.assertEqual(node_id, NODE_ID)
+        self.assertEqual([p.epc for p in msg.properties],
+                         [EPC_TEMPERATURE, 0x80, 0x81])
+        self._reply(msg, ESV_CODE['GET_RES'],
+                    [Property(EPC_TEMPERATURE, b'\x00\xfa'),
+                     Property(0x80, b'\x30'),
+                     Property(0x81, b'\x01')])
+        self.assertEqual([p.epc for p in first[0].properties],
+                         [EPC_TEMPERATURE, 0x80])
+        self.assertEqual([p.epc for p in second[0].properties],
+                         [0x80, 0x81])
+
+    def test_partial_failure(self):
+        first = self._request([EPC_TEMPERATURE])
+        second = self._request([0x80])
+        [(msg, _)] = self._flush()
+        self._reply(msg, ESV_CODE['GET_SNA'],
+                    [Property(EPC_TEMPERATURE),
+                     Property(0x80, b'\x30')])
+        [error] = first
+        self.assertIsInstance(error, RequestError)
+        self.assertEqual([p.epc for p in error.msg.properties],
+                         [EPC_TEMPERATURE])
+        [reply] = second
+        self.assertEqual(reply.esv, ESV_CODE['GET_RES'])
+        self.assertEqual([(p.epc, p.edt) for p in reply.properties],
+                         [(0x80, b'\x30')])
+
+    def test_default_timeout_is_longest(self):
+        # a request without timeout and retries waits as long as the
+        # defaults of the monitor, even merged with a shorter one.
+        first = self._request([EPC_TEMPERATURE], timeout=1, retries=0)
+        second = self._request([0x80])
+        runtime = self.monitor.runtime
+        self.assertEqual(len(self._flush()), 1)
+        runtime.advance(self.monitor.request_timeout
+                        * (self.monitor.request_retries + 1) - 0.1)
+        self.assertEqual(len(helpers.sent_messages(self.monitor)),
+                         self.monitor.request_retries)
+        self.assertEqual((first, second), ([], []))
+        runtime.advance(0.1)
+        self.assertIsInstance(first[0], RequestTimeoutError)
+        self.assertIsInstance(second[0], RequestTimeoutError)
+
+    def test_cancelled_requests_are_not_sent(self):
+        (first, _) = self._deferred([EPC_TEMPERATURE])
+        (second, _) = self._deferred([0x80])
+        first.cancel()
+        second.cancel()
+        self.assertEqual(self._flush(), [])
+
+    def test_cancelled_requests_are_not_retried(self):
+        (first, _) = self._deferred([EPC_TEMPERATURE])
+        (second, _) = self._deferred([0x80])
+        self.assertEqual(len(self._flush()), 1)
+        first.cancel()
+        self.monitor.runtime.advance(self.monitor.request_timeout)
+        self.assertEqual(len(helpers.sent_messages(self.monitor)), 1)
+        second.cancel()
+        self.monitor.runtime.advance(self.monitor.request_timeout * 3)
+        self.assertEqual(helpers.sent_messages(self.monitor), [])
+
+    def _epcs_per_frame(self, eoj, epcs):
+        for epc in epcs:
+            self._request([epc], eoj)
+        return [len(msg.properties) for (msg, _) in self._flush()]
+
+    def test_budget_on_unknown_reply_size(self):
+        # properties without a codec are counted as UNKNOWN_EDT_LEN.
+        epcs = list(range(0xa0, 0xe0))
+        per_frame = (coalescer.MAX_FRAME_LEN - COMMON_HDR_LEN) // (
+            2 + coalescer.UNKNOWN_EDT_LEN)
+        self.assertEqual(self._epcs_per_frame(EOJ_SENSOR, epcs),
+                         [per_frame, len(epcs) - per_frame])
+
+    def test_budget_on_known_reply_size(self):
+        # the temperature (0xe0) of 2 octets still fits in the frame
+        # full of properties of unknown size, another one does not.
+        per_frame = (coalescer.MAX_FRAME_LEN - COMMON_HDR_LEN) // (
+            2 + coalescer.UNKNOWN_EDT_LEN)
+        epcs = list(range(0xa0, 0xa0 + per_frame))
+        self.assertEqual(
+            self._epcs_per_frame(EOJ_SENSOR, epcs + [EPC_TEMPERATURE]),
+            [per_frame + 1])
+        self.assertEqual(
+            self._epcs_per_frame(EOJ_SENSOR, epcs + [0xf0]),
+            [per_frame, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
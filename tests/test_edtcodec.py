@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+
+from echonetlite import edtcodec
+from echonetlite.protocol import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EOJ_METER = EOJ(CLSGRP_CODE['HOUSING_FACILITIES'],
+                CLS_HF_CODE['LV_ELECTRIC_ENERGY_METER'], 0x01)
+
+
+def _temperature(value):
+    return struct.pack('!h', value)
+
+
+class TemperatureTest(unittest.TestCase):
+    def _decode(self, edt):
+        return edtcodec.registry.decode(EOJ_SENSOR, EPC_TEMPERATURE, edt)
+
+    def test_boundaries(self):
+        self.assertEqual(self._decode(_temperature(0x7ffe)), 3276.6)
+        self.assertEqual(self._decode(_temperature(-2732)), -273.2)
+        self.assertEqual(self._decode(_temperature(-0x7fff)), -3276.7)
+        self.assertEqual(self._decode(_temperature(0)), 0.0)
+
+    def test_overflow_and_underflow(self):
+        self.assertIsNone(self._decode(_temperature(0x7fff)))
+        self.assertIsNone(self._decode(_temperature(-0x8000)))
+
+    def test_encode(self):
+        self.assertEqual(
+            edtcodec.registry.encode(EOJ_SENSOR, EPC_TEMPERATURE, 24.5),
+            _temperature(245))
+
+    @unittest.skipIf(numpy is None, 'NumPy is not installed.')
+    def test_decode_batch(self):
+        edts = [_temperature(v) for v in (0x7ffe, 0x7fff, -0x8000, 245)]
+        values = edtcodec.registry.decode_batch(EOJ_SENSOR, EPC_TEMPERATURE,
+                                                edts)
+        self.assertEqual(values[0], 3276.6)
+        self.assertTrue(numpy.isnan(values[1]))
+        self.assertTrue(numpy.isnan(values[2]))
+        self.assertEqual(values[3], 24.5)
+
+
+class InstantaneousPowerTest(unittest.TestCase):
+    def _decode(self, value):
+        return edtcodec.registry.decode(EOJ_METER, EPC_INSTANTENEOUS_ELECTRIC,
+                                        struct.pack('!i', value))
+
+    def test_boundaries(self):
+        self.assertEqual(self._decode(0x7ffffffd), 0x7ffffffd)
+        self.assertEqual(self._decode(-0x7fffffff), -0x7fffffff)
+        self.assertEqual(self._decode(-500), -500)
+
+    def test_no_data_overflow_and_underflow(self):
+        for value in (0x7ffffffe, 0x7fffffff, -0x80000000):
+            self.assertIsNone(self._decode(value))
+
+
+class MapTest(unittest.TestCase):
+    def test_round_trip(self):
+        codec = edtcodec.registry.get(EOJ_SENSOR, EPC_GET_PROPERTY_MAP)
+        epcs = [0x80, 0x9f, EPC_TEMPERATURE]
+        self.assertEqual(list(codec.decode(codec.encode(epcs))), epcs)
+
+
+if __name__ == '__main__':
+    unittest.main()
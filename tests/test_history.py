@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from echonetlite import history
+from echonetlite.protocol import *
+
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EPC_TEMPERATURE = 0xe0
+
+
+class HistoryStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reopen(self):
+        store = history.HistoryStore(capacity=4, directory=self.directory)
+        store.record('192.0.2.2', EOJ_SENSOR,
+                     [Property(EPC_TEMPERATURE, b'\x00\xfa')], timestamp=1.0)
+        store.close()
+        store = history.HistoryStore(capacity=4, directory=self.directory)
+        series = store.get('192.0.2.2', EOJ_SENSOR, EPC_TEMPERATURE)
+        self.assertEqual(series.latest(), (1.0, 25.0))
+        store.close()
+
+    def _track_over(self, content):
+        store = history.HistoryStore(capacity=4, directory=self.directory)
+        path = store._path(('192.0.2.2', int(EOJ_SENSOR), EPC_TEMPERATURE))
+        with open(path, 'wb') as f:
+            f.write(content)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            series = store.track('192.0.2.2', EOJ_SENSOR, EPC_TEMPERATURE)
+        self.assertIn(path + '.bad', output.getvalue())
+        self.assertEqual(len(series), 0)
+        with open(path + '.bad', 'rb') as f:
+            self.assertEqual(f.read(), content)
+        store.close()
+
+    def test_incompatible_file_is_moved_aside(self):
+        self._track_over(b'XXXX' + bytes(60))
+
+    def test_truncated_file_is_moved_aside(self):
+        self._track_over(b'ELTS')
+
+    def test_empty_file_is_moved_aside(self):
+        self._track_over(b'')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import unittest
+
+from echonetlite import asyncioadapter
+
+from tests import helpers
+
+_LAZY_REACTOR = '''
+import sys
+from echonetlite.interfaces import monitor
+from echonetlite import asyncioadapter
+from echonetlite import middleware
+monitor.set_adapter(asyncioadapter)
+middleware.NodeProfile()
+monitor.runtime.now()
+print('twisted.internet.reactor' in sys.modules)
+'''
+
+_TWISTED_CALL_SOON = '''
+from twisted.internet import reactor
+from echonetlite import ipv4adapter
+runtime = ipv4adapter.Runtime()
+calls = []
+def main():
+    runtime.call_soon(calls.append, 1)
+    calls.append(0)
+    runtime.call_soon(calls.append, 2).cancel()
+    runtime.call_later(0.01, runtime.stop)
+runtime.call_soon(main)
+runtime.run()
+print(calls)
+'''
+
+
+class AdapterTest(unittest.TestCase):
+    def test_reactor_not_imported_for_asyncio(self):
+        self.assertEqual(helpers.run_python(_LAZY_REACTOR), 'False')
+
+    def test_twisted_call_soon_is_deferred(self):
+        # the callback runs in a later turn, and can be cancelled.
+        self.assertEqual(helpers.run_python(_TWISTED_CALL_SOON), '[0, 1]')
+
+    def test_asyncio_listen_error_is_handled_by_loop(self):
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        contexts = []
+        loop.set_exception_handler(
+            lambda loop, context: contexts.append(context))
+        async def serve():
+            raise OSError('address in use')
+        async def main():
+            # a server started while the loop is running.
+            asyncioadapter.Runtime(loop=loop)._start_server(serve())
+            for _ in range(3):
+                await asyncio.sleep(0)
+        loop.run_until_complete(main())
+        [context] = contexts
+        self.assertIsInstance(context['exception'], OSError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite.interfaces import ListenerIndex
+from echonetlite.protocol import *
+from tests import helpers
+
+NODE_ID = '192.0.2.2'
+OTHER_NODE_ID = '192.0.2.3'
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EOJ_OTHER_SENSOR = EOJ(0x00, 0x11, 0x02)
+EOJ_ALL_SENSORS = EOJ(0x00, 0x11, INSTANCE_ALL)
+EPC_TEMPERATURE = 0xe0
+
+
+class ListenerIndexTest(unittest.TestCase):
+    def test_no_listeners(self):
+        self.assertEqual(ListenerIndex().match(NODE_ID, EOJ_SENSOR), ())
+
+    def test_match(self):
+        index = ListenerIndex()
+        index.add('exact', NODE_ID, EOJ_SENSOR, EPC_TEMPERATURE)
+        index.add('class', None, EOJ_ALL_SENSORS, EPC_TEMPERATURE)
+        index.add('node', NODE_ID)
+        index.add('other', OTHER_NODE_ID, EOJ_OTHER_SENSOR)
+        tables = index.match(NODE_ID, EOJ_SENSOR)
+        self.assertEqual(
+            sorted(l for table in tables for ls in table.values()
+                   for l in ls),
+            ['class', 'exact', 'node'])
+
+    def test_remove(self):
+        index = ListenerIndex()
+        index.add('a', NODE_ID, EOJ_SENSOR)
+        index.remove('a', NODE_ID, EOJ_SENSOR)
+        index.remove('a', NODE_ID, EOJ_SENSOR)
+        self.assertEqual(index.match(NODE_ID, EOJ_SENSOR), ())
+
+
+class MonitorListenerTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(MonitorListenerTest, self).setUp()
+        self.calls = []
+
+    def _listener(self, name):
+        def listener(from_node_id, from_eoj, from_device, esv, prop):
+            self.calls.append((name, from_node_id, int(from_eoj), prop.epc))
+        return listener
+
+    def _receive(self, node_id, seoj, epcs):
+        msg = Message(tid=0, seoj=seoj, deoj=self.profile.eoj,
+                      esv=ESV_CODE['INF'],
+                      properties=[Property(epc, b'\x30') for epc in epcs])
+        self.monitor.on_did_receive(bytes(encode(msg)), node_id)
+
+    def test_filters(self):
+        monitor = self.monitor
+        monitor.add_listener(self._listener('any'))
+        monitor.add_listener(self._listener('node'), node_id=NODE_ID)
+        monitor.add_listener(self._listener('class'), eoj=EOJ_ALL_SENSORS,
+                             epc=EPC_TEMPERATURE)
+        monitor.add_listener(self._listener('instance'),
+                             eoj=EOJ_OTHER_SENSOR)
+        self._receive(NODE_ID, EOJ_SENSOR, [0x80, EPC_TEMPERATURE])
+        self.assertEqual(sorted(self.calls), [
+            ('any', NODE_ID, 0x001101, 0x80),
+            ('any', NODE_ID, 0x001101, EPC_TEMPERATURE),
+            ('class', NODE_ID, 0x001101, EPC_TEMPERATURE),
+            ('node', NODE_ID, 0x001101, 0x80),
+            ('node', NODE_ID, 0x001101, EPC_TEMPERATURE),
+        ])
+        del self.calls[:]
+        self._receive(OTHER_NODE_ID, EOJ_OTHER_SENSOR, [0x80])
+        self.assertEqual(sorted(self.calls), [
+            ('any', OTHER_NODE_ID, 0x001102, 0x80),
+            ('instance', OTHER_NODE_ID, 0x001102, 0x80),
+        ])
+
+    def test_remove_listener(self):
+        listener = self._listener('class')
+        self.monitor.add_listener(listener, eoj=EOJ_ALL_SENSORS)
+        self.monitor.remove_listener(listener, eoj=EOJ_ALL_SENSORS)
+        self._receive(NODE_ID, EOJ_SENSOR, [0x80])
+        self.assertEqual(self.calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite.protocol import *
+from tests import helpers
+
+REMOTE_NODE_ID = '192.0.2.2'
+REMOTE_EOJ = EOJ(0x05, 0xff, 0x01)
+EPC_USER = 0xf0
+
+
+class GetResponseTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(GetResponseTest, self).setUp()
+        self.profile.get_property_map += [EPC_USER]
+
+    def _get(self, *epcs):
+        msg = Message(tid=1, seoj=REMOTE_EOJ, deoj=self.profile.eoj,
+                      esv=ESV_CODE['GET'],
+                      properties=[Property(epc) for epc in epcs])
+        self.monitor.on_did_receive(bytes(encode(msg)), REMOTE_NODE_ID)
+        self.monitor.runtime.advance()
+        replies = helpers.sent_messages(self.monitor)
+        if not replies:
+            return None
+        (reply, node_id) = replies[0]
+        self.assertEqual(node_id, REMOTE_NODE_ID)
+        self.assertEqual(reply.esv, ESV_CODE['GET_RES'])
+        return {p.epc: bytes(p.edt) for p in reply.properties}
+
+    def test_reply_follows_writes(self):
+        self.profile.properties[EPC_USER] = b'\x01'
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x01'})
+        self.profile.properties[EPC_USER] = [0x02]
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x02'})
+        self.profile.properties.update({EPC_USER: b'\x03'})
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x03'})
+
+    def test_edt_is_copied(self):
+        edt = [0x01, 0x02]
+        self.profile._add_property(EPC_USER, edt)
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x01\x02'})
+        edt[0] = 0xff
+        self.assertEqual(self.profile.properties[EPC_USER], b'\x01\x02')
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x01\x02'})
+
+    def test_removed_property_is_skipped(self):
+        self.profile.properties[EPC_USER] = b'\x01'
+        self.assertEqual(self._get(EPC_USER), {EPC_USER: b'\x01'})
+        self.assertEqual(self.profile.properties.popitem(),
+                         (EPC_USER, b'\x01'))
+        self.assertIsNone(self._get(EPC_USER))
+        self.assertEqual(self._get(EPC_USER, EPC_MANUFACTURE_CODE),
+                         {EPC_MANUFACTURE_CODE: b'\x00\x00\x00'})
+
+
+if __name__ == '__main__':
+    unittest.main()
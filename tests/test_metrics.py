@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import metrics
+
+
+class CounterTest(unittest.TestCase):
+    def test_remove(self):
+        c = metrics.Counter('requests', 'Requests.', ('node',))
+        c.inc(('192.0.2.1',))
+        c.inc(('192.0.2.2',), 2)
+        c.remove(('192.0.2.1',))
+        c.remove(('192.0.2.3',))
+        self.assertEqual(c.get(('192.0.2.1',)), 0)
+        self.assertEqual(c.snapshot(), {'{node="192.0.2.2"}': 2})
+
+
+class HistogramTest(unittest.TestCase):
+    def test_observe(self):
+        h = metrics.Histogram('latency', 'Latency.', ('esv',),
+                              buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            h.observe(value, ('Get',))
+        self.assertEqual(h.snapshot()['{esv="Get"}'],
+                         {'buckets': {'0.1': 1, '1.0': 2, '+Inf': 3},
+                          'sum': 5.55, 'count': 3})
+
+    def test_max_series(self):
+        h = metrics.Histogram('latency', 'Latency.', ('node',),
+                              max_series=3, overflow_labels=('other',))
+        for i in range(10):
+            h.observe(0.01, ('192.0.2.{0}'.format(i),))
+        self.assertEqual(sorted(h.values),
+                         [('192.0.2.0',), ('192.0.2.1',), ('192.0.2.2',),
+                          ('other',)])
+        self.assertEqual(h.values[('other',)][2], 7)
+        # a known node keeps its own series.
+        h.observe(0.01, ('192.0.2.1',))
+        self.assertEqual(h.values[('192.0.2.1',)][2], 2)
+        # a released series makes room for a new node.
+        h.remove(('192.0.2.0',))
+        h.observe(0.01, ('192.0.2.10',))
+        self.assertIn(('192.0.2.10',), h.values)
+        self.assertEqual(h.values[('other',)][2], 7)
+
+    def test_node_latency_is_bounded(self):
+        m = metrics.Metrics()
+        for i in range(metrics.NODE_LATENCY_SERIES * 2):
+            m.node_request_latency.observe(0.01, ('node{0}'.format(i),))
+        self.assertLessEqual(len(m.node_request_latency.values),
+                             metrics.NODE_LATENCY_SERIES + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import middleware
+from echonetlite.protocol import *
+from tests import helpers
+
+NODE_ID = '192.0.2.2'
+CONTROLLER_EOJ = EOJ(0x05, 0xff, 0x01)
+
+
+def _sensor(instance_id):
+    return middleware.RemoteDevice(EOJ(0x00, 0x11, instance_id), NODE_ID)
+
+
+class NodeRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.first = _sensor(1)
+        self.second = _sensor(2)
+        self.meter = middleware.RemoteDevice(EOJ(0x02, 0x88, 0x01), NODE_ID)
+        self.node = middleware.Node(NODE_ID,
+                                    [self.first, self.second, self.meter])
+
+    def test_get_device(self):
+        self.assertIs(self.node.get_device(EOJ(0x00, 0x11, 0x02)),
+                      self.second)
+        self.assertIs(self.node.get_device(0x001102), self.second)
+        self.assertIsNone(self.node.get_device(EOJ(0x00, 0x11, 0x03)))
+        self.assertEqual(sorted(self.node.devices),
+                         [0x001101, 0x001102, 0x028801])
+
+    def test_get_devices_by_class(self):
+        self.assertEqual(list(self.node.get_devices_by_class(0x00, 0x11)),
+                         [self.first, self.second])
+        self.assertEqual(list(self.node.get_devices_by_class(0x00, 0x12)),
+                         [])
+
+    def test_remove_device(self):
+        self.node.remove_device(EOJ(0x00, 0x11, 0x01))
+        self.node.remove_device(EOJ(0x00, 0x11, 0x01))
+        self.assertIsNone(self.node.get_device(0x001101))
+        self.assertEqual(list(self.node.get_devices_by_class(0x00, 0x11)),
+                         [self.second])
+        self.node.remove_device(EOJ(0x00, 0x11, 0x02))
+        self.assertEqual(list(self.node.get_devices_by_class(0x00, 0x11)),
+                         [])
+
+    def test_devices_by_name_follows_changes(self):
+        names = self.node.devices_by_name
+        self.assertIs(names[str(EOJ(0x00, 0x11, 0x01))], self.first)
+        self.assertEqual(len(names), 3)
+        self.node.remove_device(EOJ(0x00, 0x11, 0x01))
+        self.assertNotIn(str(EOJ(0x00, 0x11, 0x01)), names)
+        third = _sensor(3)
+        self.node.add_device(third)
+        self.assertIs(names[str(EOJ(0x00, 0x11, 0x03))], third)
+        self.assertEqual(len(names), 3)
+
+
+class DispatchTableTest(unittest.TestCase):
+    def setUp(self):
+        self.first = _sensor(1)
+        self.second = _sensor(2)
+        self.node = middleware.Node(NODE_ID, [self.first, self.second])
+
+    def test_instance(self):
+        self.assertEqual(
+            self.node.get_destination_devices(EOJ(0x00, 0x11, 0x02)),
+            (self.second,))
+        self.assertEqual(
+            self.node.get_destination_devices(EOJ(0x00, 0x11, 0x03)), ())
+
+    def test_all_instances(self):
+        all_sensors = EOJ(0x00, 0x11, INSTANCE_ALL)
+        self.assertEqual(self.node.get_destination_devices(all_sensors),
+                         (self.first, self.second))
+        self.node.remove_device(EOJ(0x00, 0x11, 0x01))
+        self.assertEqual(self.node.get_destination_devices(all_sensors),
+                         (self.second,))
+        self.assertEqual(
+            self.node.get_destination_devices(EOJ(0x00, 0x11, 0x01)), ())
+        self.node.remove_device(EOJ(0x00, 0x11, 0x02))
+        self.assertEqual(self.node.get_destination_devices(all_sensors), ())
+
+
+class DispatchTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(DispatchTest, self).setUp()
+        self_node = self.monitor.get_self_node()
+        for instance_id in (1, 2):
+            self_node.add_device(
+                middleware.NodeSuperObject(EOJ(0x00, 0x11, instance_id)))
+        self.monitor.runtime.advance(1)
+        helpers.sent_messages(self.monitor)
+
+    def _get(self, deoj):
+        msg = Message(tid=1, seoj=CONTROLLER_EOJ, deoj=deoj,
+                      esv=ESV_CODE['GET'],
+                      properties=[Property(EPC_OPERATING_STATUS)])
+        self.monitor.on_did_receive(bytes(encode(msg)), NODE_ID)
+        self.monitor.runtime.advance()
+        return sorted(int(msg.seoj)
+                      for (msg, _) in helpers.sent_messages(self.monitor))
+
+    def test_request_to_instance(self):
+        self.assertEqual(self._get(EOJ(0x00, 0x11, 0x02)), [0x001102])
+
+    def test_request_to_all_instances(self):
+        self.assertEqual(self._get(EOJ(0x00, 0x11, INSTANCE_ALL)),
+                         [0x001101, 0x001102])
+
+    def test_request_to_unknown_object(self):
+        self.assertEqual(self._get(EOJ(0x00, 0x12, 0x01)), [])
+        self.assertEqual(self.monitor.metrics.not_ours.get(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import middleware
+from echonetlite.protocol import *
+from tests import helpers
+
+REMOTE_NODE_ID = '192.0.2.2'
+
+NODE_PROFILE_EOJ = EOJ(CLSGRP_CODE['PROFILE'], CLS_PR_CODE['PROFILE'],
+                       INSTANCE_PR_NORMAL)
+
+def _sensor(cls, instance_id):
+    return middleware.NodeSuperObject(
+        EOJ(CLSGRP_CODE['SENSOR'], cls, instance_id))
+
+def _instance_list(eojs, count=None):
+    if count is None:
+        count = len(eojs)
+    return bytes([count]) + b''.join(eoj.to_bytes(3, 'big') for eoj in eojs)
+
+
+# 200 devices added in one turn of a running Twisted reactor, with no
+# socket opened.  Prints the counts of the 0xd5 announcements.
+_TWISTED_ANNOUNCEMENT = '''
+from echonetlite import interfaces, ipv4adapter, middleware
+from echonetlite.protocol import *
+from tests import helpers
+
+class Runtime(ipv4adapter.Runtime):
+    def new_sender(self, local_addr):
+        return helpers.FakeSender(local_addr)
+    def listen(self, local_addr, on_did_receive, on_did_receive_batch=None):
+        pass
+
+monitor = interfaces.monitor
+monitor.set_adapter(helpers.types.SimpleNamespace(Runtime=Runtime))
+profile = middleware.NodeProfile()
+
+def add_devices():
+    monitor.sender.sent = []
+    node = monitor.get_self_node()
+    for i in range(200):
+        node.add_device(middleware.NodeSuperObject(
+            EOJ(CLSGRP_CODE['SENSOR'], 0x10 + i // 40, i % 40 + 1)))
+    monitor.runtime.call_later(0.1, report)
+
+def report():
+    print([msg.properties[0].edt[0]
+           for (msg, _) in helpers.sent_messages(monitor)
+           if msg.properties[0].epc == EPC_INSTANCE_LIST_NOTIFICATION])
+    monitor.runtime.stop()
+
+monitor.runtime.call_later(0.1, add_devices)
+monitor.start('192.0.2.1', [profile], shell_port=None)
+'''
+
+
+class SelfNodePropertiesTest(helpers.MonitorTestCase):
+    settle = False
+
+    def setUp(self):
+        super(SelfNodePropertiesTest, self).setUp()
+        self.node = self.monitor.get_self_node()
+
+    def _property(self, epc):
+        return bytes(self.profile.properties[epc])
+
+    def test_empty_node(self):
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_INSTANCES),
+                         b'\x00\x00\x00')
+        # the node profile class is counted, but not listed.
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_CLASSES),
+                         b'\x00\x01')
+        self.assertEqual(self._property(EPC_SELF_NODE_INSTANCE_LIST_S),
+                         b'\x00')
+        self.assertEqual(self._property(EPC_SELF_NODE_CLASS_LIST_S), b'\x00')
+
+    def test_add_and_remove(self):
+        a = _sensor(0x11, 1)
+        b = _sensor(0x11, 2)
+        c = _sensor(0x12, 1)
+        for d in (a, b, c):
+            self.node.add_device(d)
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_INSTANCES),
+                         b'\x00\x00\x03')
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_CLASSES),
+                         b'\x00\x03')
+        self.assertEqual(self._property(EPC_SELF_NODE_INSTANCE_LIST_S),
+                         b'\x03\x00\x11\x01\x00\x11\x02\x00\x12\x01')
+        self.assertEqual(self._property(EPC_INSTANCE_LIST_NOTIFICATION),
+                         b'\x03\x00\x11\x01\x00\x11\x02\x00\x12\x01')
+        self.assertEqual(self._property(EPC_SELF_NODE_CLASS_LIST_S),
+                         b'\x02\x00\x11\x00\x12')
+        self.node.remove_device(a.eoj)
+        self.node.remove_device(c.eoj)
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_INSTANCES),
+                         b'\x00\x00\x01')
+        self.assertEqual(self._property(EPC_SELF_NODE_INSTANCE_LIST_S),
+                         b'\x01\x00\x11\x02')
+        self.assertEqual(self._property(EPC_SELF_NODE_CLASS_LIST_S),
+                         b'\x01\x00\x11')
+
+    def test_matches_full_rebuild(self):
+        devices = [_sensor(0x10 + i // 40, i % 40 + 1) for i in range(300)]
+        for d in devices:
+            self.node.add_device(d)
+            incremental = dict(self.profile.properties)
+            self.profile.update_device_numbers(self.node.devices)
+            for epc in (EPC_NUM_SELF_NODE_INSTANCES,
+                        EPC_NUM_SELF_NODE_CLASSES,
+                        EPC_SELF_NODE_INSTANCE_LIST_S,
+                        EPC_SELF_NODE_CLASS_LIST_S):
+                self.assertEqual(bytes(incremental[epc]),
+                                 self._property(epc))
+
+    def test_more_than_84_instances(self):
+        for i in range(300):
+            self.node.add_device(_sensor(0x10 + i // 40, i % 40 + 1))
+        self.assertEqual(self._property(EPC_NUM_SELF_NODE_INSTANCES),
+                         (300).to_bytes(3, 'big'))
+        instance_list = self._property(EPC_SELF_NODE_INSTANCE_LIST_S)
+        # the count saturates, and 84 instances are listed.
+        self.assertEqual(instance_list[0], 0xff)
+        self.assertEqual(len(instance_list), 1 + 84 * 3)
+        class_list = self._property(EPC_SELF_NODE_CLASS_LIST_S)
+        self.assertEqual(class_list[0], 8)
+        self.assertEqual(len(class_list), 1 + 8 * 2)
+
+    def test_announcement_is_split(self):
+        helpers.sent_messages(self.monitor)
+        for i in range(200):
+            self.node.add_device(_sensor(0x10 + i // 40, i % 40 + 1))
+        self.monitor.runtime.advance(0)
+        counts = [msg.properties[0].edt[0]
+                  for (msg, _) in helpers.sent_messages(self.monitor)
+                  if msg.properties[0].epc == EPC_INSTANCE_LIST_NOTIFICATION]
+        self.assertEqual(counts, [84, 84, 32])
+
+    def test_announcement_on_twisted(self):
+        # the changes are announced once, after the turn of the
+        # reactor which made them.
+        self.assertEqual(helpers.run_python(_TWISTED_ANNOUNCEMENT),
+                         '[84, 84, 32]')
+
+
+class RemoteInstanceListTest(helpers.MonitorTestCase):
+    settle = False
+
+    def setUp(self):
+        super(RemoteInstanceListTest, self).setUp()
+        self.topology = []
+        self.monitor.add_topology_listener(
+            lambda node_id, edt: self.topology.append((node_id, edt)))
+
+    def _receive(self, esv, epc, edt, tid=0):
+        msg = Message(tid=tid, seoj=NODE_PROFILE_EOJ, deoj=NODE_PROFILE_EOJ,
+                      esv=ESV_CODE[esv], properties=[Property(epc, edt)])
+        self.monitor.on_did_receive(bytes(encode(msg)), REMOTE_NODE_ID)
+
+    def _remote_eojs(self):
+        return sorted(self.monitor.get_node(REMOTE_NODE_ID).devices)
+
+    def test_notification_fragments_are_merged(self):
+        eojs = [0x001101 + (i // 100) * 0x100 + i % 100 for i in range(100)]
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[:84]))
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[84:]))
+        self.assertEqual(self._remote_eojs(), sorted(eojs))
+        self.assertEqual(self.profile.get_instances(REMOTE_NODE_ID),
+                         frozenset(eojs))
+        # the same fragments again change nothing.
+        del self.topology[:]
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[:84]))
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[84:]))
+        self.assertEqual(self.topology, [])
+        # fragments are not kept as the instance list of the node.
+        self.assertIsNone(self.profile.get_instance_list(REMOTE_NODE_ID))
+
+    def test_complete_instance_list_removes_objects(self):
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list([0x001101, 0x001102]))
+        edt = _instance_list([0x001101])
+        self._receive('GET_RES', EPC_SELF_NODE_INSTANCE_LIST_S, edt)
+        self.assertEqual(self._remote_eojs(), [0x001101])
+        self.assertEqual(self.profile.get_instance_list(REMOTE_NODE_ID), edt)
+        self.assertEqual(self.topology[-1],
+                         (REMOTE_NODE_ID, _instance_list([0x001101])))
+
+    def test_partial_instance_list_keeps_objects(self):
+        eojs = [0x001101 + i for i in range(90)]
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[:84]))
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list(eojs[84:]))
+        # 0xd6 of a node with 90 objects lists 84 of them.
+        self._receive('GET_RES', EPC_SELF_NODE_INSTANCE_LIST_S,
+                      _instance_list(eojs[:84], count=90))
+        self.assertEqual(self._remote_eojs(), eojs)
+
+    def _instance_list_requests(self):
+        self.monitor.runtime.advance()
+        return [msg for (msg, node_id) in helpers.sent_messages(self.monitor)
+                if msg.esv == ESV_CODE['GET']
+                and msg.properties[0].epc == EPC_SELF_NODE_INSTANCE_LIST_S]
+
+    def test_unchanged_notification_is_not_queried(self):
+        interval = self.profile.instance_list_query_interval
+        self.monitor.request_retries = 0
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list([0x001101]))
+        self.assertEqual(len(self._instance_list_requests()), 1)
+        self.monitor.runtime.advance(interval)
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list([0x001101]))
+        self.assertEqual(self._instance_list_requests(), [])
+        self._receive('INF', EPC_INSTANCE_LIST_NOTIFICATION,
+                      _instance_list([0x001101, 0x001102]))
+        self.assertEqual(len(self._instance_list_requests()), 1)
+
+
+class DiscoveryTest(helpers.MonitorTestCase):
+    settle = False
+
+    def _discovery_times(self, seconds):
+        # returns the times of the discovery requests sent in seconds,
+        # relative to the start.
+        runtime = self.monitor.runtime
+        start = runtime.now()
+        times = []
+        for _ in range(seconds):
+            runtime.advance()
+            for (msg, node_id) in helpers.sent_messages(self.monitor):
+                if msg.esv == ESV_CODE['INF_REQ']:
+                    times.append(runtime.now() - start)
+            runtime.advance(1)
+        return times
+
+    def test_interval_doubles_while_nothing_is_found(self):
+        self.assertEqual(self._discovery_times(500), [0, 60, 180, 420])
+
+    def test_interval_is_reset_when_a_node_is_found(self):
+        self.assertEqual(self._discovery_times(61), [0, 60])
+        # a node is found before the third discovery, 120 seconds
+        # after the second.
+        msg = Message(tid=0, seoj=NODE_PROFILE_EOJ, deoj=NODE_PROFILE_EOJ,
+                      esv=ESV_CODE['INF'],
+                      properties=[Property(EPC_INSTANCE_LIST_NOTIFICATION,
+                                           _instance_list([0x001101]))])
+        self.monitor.on_did_receive(bytes(encode(msg)), REMOTE_NODE_ID)
+        self.assertEqual(self._discovery_times(250), [119, 179])
+
+
+if __name__ == '__main__':
+    unittest.main()
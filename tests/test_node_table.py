@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import middleware
+from echonetlite.protocol import *
+from tests import helpers
+
+
+class NodeTableTest(helpers.MonitorTestCase):
+    settle = False
+
+    def setUp(self):
+        super(NodeTableTest, self).setUp()
+        self.evicted = []
+        self.monitor.add_eviction_listener(
+            lambda node_id, node: self.evicted.append(node_id))
+
+    def test_full_table_evicts_least_recently_seen(self):
+        monitor = self.monitor
+        monitor.set_node_limits(max_nodes=2)
+        monitor.add_node('192.0.2.2')
+        monitor.runtime.advance(1)
+        monitor.add_node('192.0.2.3')
+        monitor.runtime.advance(1)
+        self.assertIsNotNone(monitor.add_node('192.0.2.4'))
+        self.assertEqual(self.evicted, ['192.0.2.2'])
+        self.assertIsNone(monitor.get_node('192.0.2.2'))
+        self.assertEqual(monitor.metrics.nodes_evicted.values[('full',)], 1)
+
+    def test_forgotten_node_drops_latency_series(self):
+        monitor = self.monitor
+        monitor.add_node('192.0.2.2')
+        latency = monitor.metrics.node_request_latency
+        latency.observe(0.01, ('192.0.2.2',))
+        monitor.forget_node('192.0.2.2')
+        self.assertNotIn(('192.0.2.2',), latency.values)
+
+    def test_full_table_rejects_within_min_idle(self):
+        monitor = self.monitor
+        monitor.set_node_limits(max_nodes=1, min_idle=10)
+        monitor.add_node('192.0.2.2')
+        monitor.runtime.advance(5)
+        self.assertIsNone(monitor.add_node('192.0.2.3'))
+        self.assertEqual(self.evicted, [])
+        self.assertEqual(monitor.metrics.nodes_rejected.values[()], 1)
+        monitor.runtime.advance(5)
+        self.assertIsNotNone(monitor.add_node('192.0.2.3'))
+        self.assertEqual(self.evicted, ['192.0.2.2'])
+
+    def test_idle_node_is_aged_out(self):
+        monitor = self.monitor
+        monitor.set_node_limits(max_idle=60)
+        monitor.add_node('192.0.2.2')
+        monitor.runtime.advance(30)
+        monitor.add_node('192.0.2.3')
+        monitor.runtime.advance(45)
+        self.assertEqual(self.evicted, ['192.0.2.2'])
+        self.assertIsNotNone(monitor.get_node('192.0.2.3'))
+
+    def test_eviction_stops_polling(self):
+        monitor = self.monitor
+        # the device is polled before its node_id is known.
+        device = middleware.RemoteDevice(EOJ(0x00, 0x11, 0x01))
+        monitor.poller.add(device, [0x80], 10, self.profile)
+        node = monitor.add_node('192.0.2.2')
+        device.node_id = '192.0.2.2'
+        node.add_device(device)
+        monitor.runtime.advance(10)
+        helpers.sent_messages(monitor)
+        monitor.set_node_limits(max_nodes=1)
+        monitor.add_node('192.0.2.3')
+        self.assertEqual(self.evicted, ['192.0.2.2'])
+        self.assertEqual(len(monitor.poller), 0)
+        monitor.runtime.advance(60)
+        self.assertNotIn('192.0.2.2', [node_id for (_, node_id)
+                                       in helpers.sent_messages(monitor)])
+
+    def test_eviction_stops_polling_of_unpolled_device(self):
+        monitor = self.monitor
+        device = middleware.RemoteDevice(EOJ(0x00, 0x11, 0x01))
+        monitor.poller.add(device, [0x80], 10, self.profile)
+        node = monitor.add_node('192.0.2.2')
+        device.node_id = '192.0.2.2'
+        node.add_device(device)
+        monitor.forget_node('192.0.2.2')
+        self.assertEqual(len(monitor.poller), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
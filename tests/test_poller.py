@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import types
+import unittest
+from unittest import mock
+
+from echonetlite import poller
+from echonetlite.protocol import *
+from tests.helpers import FakeMonitor
+
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+
+
+class _LocalDevice(object):
+    # records the requests, answered by the test or failed at once.
+    def __init__(self, runtime, fail=False):
+        self._runtime = runtime
+        self._fail = fail
+        # requests: a list of (node_id, Deferred)
+        self.requests = []
+
+    def request(self, esv, props, to_eoj, to_node_id=None):
+        if self._fail:
+            return self._runtime.failed(RuntimeError('no route.'))
+        d = self._runtime.new_deferred(lambda: None)
+        self.requests.append((to_node_id, d))
+        return d
+
+
+def _device(node_id):
+    return types.SimpleNamespace(node_id=node_id, eoj=EOJ_SENSOR)
+
+
+class PollerTest(unittest.TestCase):
+    def setUp(self):
+        self.monitor = FakeMonitor()
+        self.runtime = self.monitor.runtime
+        self.poller = poller.Poller(self.monitor, max_in_flight=2, jitter=0)
+        self.local = _LocalDevice(self.runtime)
+
+    def _answer_all(self):
+        requests = self.local.requests
+        self.local.requests = []
+        for (_, d) in requests:
+            self.runtime.resolve(d, None)
+        self.runtime.advance()
+        return len(requests)
+
+    def test_polled_every_interval(self):
+        self.poller.add(_device('192.0.2.2'), [0x80], 10, self.local)
+        self.runtime.advance(10)
+        self.assertEqual(self._answer_all(), 1)
+        for _ in range(3):
+            self.runtime.advance(10)
+            self.assertEqual(self._answer_all(), 1)
+
+    def test_in_flight_is_limited(self):
+        for i in range(5):
+            self.poller.add(_device('192.0.2.{0}'.format(i + 2)), [0x80],
+                            10, self.local)
+        self.runtime.advance(10)
+        self.assertEqual(len(self.local.requests), 2)
+        self.assertEqual(self.poller.in_flight, 2)
+        # a reply lets the next due poll go, in a later turn.
+        (_, d) = self.local.requests.pop(0)
+        self.runtime.resolve(d, None)
+        self.assertEqual(len(self.local.requests), 1)
+        self.runtime.advance()
+        self.assertEqual(len(self.local.requests), 2)
+
+    def test_busy_entry_skips_its_turn(self):
+        self.poller.add(_device('192.0.2.2'), [0x80], 10, self.local)
+        self.runtime.advance(10)
+        self.runtime.advance(10)
+        self.assertEqual(len(self.local.requests), 1)
+
+    def test_failing_requests_do_not_recurse(self):
+        local = _LocalDevice(self.runtime, fail=True)
+        self.poller.max_in_flight = 1
+        # all the polls are due at once.
+        with mock.patch.object(poller.random, 'uniform', lambda a, b: b):
+            for i in range(5000):
+                self.poller.add(_device('192.0.2.2'), [0x80], 10, local)
+        self.runtime.advance(10)
+        self.assertEqual(self.poller.in_flight, 0)
+
+    def test_len(self):
+        entry = self.poller.add(_device('192.0.2.2'), [0x80], 10, self.local)
+        self.poller.add(_device('192.0.2.3'), [0x80], 10, self.local)
+        self.poller.add(_device('192.0.2.3'), [0x81], 10, self.local)
+        self.assertEqual(len(self.poller), 3)
+        self.poller.remove(entry)
+        self.poller.remove(entry)
+        self.assertEqual(len(self.poller), 2)
+        self.poller.remove_node('192.0.2.3')
+        self.assertEqual(len(self.poller), 0)
+        self.runtime.advance(10)
+        self.assertEqual(self.local.requests, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
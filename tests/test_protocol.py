@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite.protocol import *
+
+SEOJ = EOJ(0x05, 0xff, 0x01)
+DEOJ = EOJ(0x00, 0x11, 0x01)
+
+
+def _message(tid=1, esv=ESV_CODE['GET_RES'], properties=()):
+    properties = list(properties)
+    return Message(tid=tid, seoj=SEOJ, deoj=DEOJ, esv=esv,
+                   opc=len(properties), properties=properties)
+
+# a GET_RES of 0x80 (0x30) and 0xe0 (0x00fa) from 05ff01 to 001101
+FRAME = bytes([0x10, 0x81, 0x00, 0x01, 0x05, 0xff, 0x01, 0x00, 0x11, 0x01,
+               0x72, 0x02, 0x80, 0x01, 0x30, 0xe0, 0x02, 0x00, 0xfa])
+_OPC = COMMON_HDR_LEN - 1
+
+
+class EOJTest(unittest.TestCase):
+    def test_interned(self):
+        self.assertIs(EOJ(0x00, 0x11, 0x01), EOJ(eoj=0x001101))
+        self.assertEqual(EOJ(0x00, 0x11, 0x01), 0x001101)
+        self.assertEqual(hash(EOJ(0x00, 0x11, 0x01)), 0x001101)
+
+    def test_immutable(self):
+        eoj = EOJ(0x00, 0x11, 0x01)
+        with self.assertRaises(AttributeError):
+            eoj._eoj = 0x001102
+        with self.assertRaises(AttributeError):
+            del eoj._eoj
+        self.assertEqual(int(EOJ(0x00, 0x11, 0x01)), 0x001101)
+
+    def test_compare_with_other_types(self):
+        eoj = EOJ(0x00, 0x11, 0x01)
+        self.assertFalse(eoj == 'foo')
+        self.assertTrue(eoj != None)
+        self.assertNotIn(eoj, ['foo', None])
+
+
+class PropertyTest(unittest.TestCase):
+    def test_edt_types(self):
+        for edt in (b'\x01\x02', bytearray(b'\x01\x02'),
+                    memoryview(b'\x01\x02'), [1, 2], (1, 2)):
+            p = Property(0x80, edt)
+            self.assertIs(type(p.edt), bytes)
+            self.assertEqual((p.pdc, p.edt), (2, b'\x01\x02'))
+        p = Property(0x80)
+        self.assertEqual((p.pdc, p.edt), (0, None))
+
+    def test_invalid_edt(self):
+        for edt in (5, 'ab', 1.0):
+            with self.assertRaises(TypeError):
+                Property(0x80, edt)
+
+
+class DecodeTest(unittest.TestCase):
+    def test_decode(self):
+        msg = decode(FRAME)
+        self.assertEqual(msg.tid, 1)
+        self.assertEqual(int(msg.seoj), int(SEOJ))
+        self.assertEqual(int(msg.deoj), int(DEOJ))
+        self.assertEqual(msg.esv, ESV_CODE['GET_RES'])
+        self.assertEqual(msg.opc, 2)
+        self.assertEqual([(p.epc, p.pdc, p.edt) for p in msg.properties],
+                         [(0x80, 1, b'\x30'), (0xe0, 2, b'\x00\xfa')])
+
+    def test_round_trip(self):
+        self.assertEqual(bytes(encode(decode(FRAME))), FRAME)
+        msg = _message(properties=[Property(0x80), Property(0x9f, bytes(17)),
+                                   Property(0xe0, b'\x00\xfa')])
+        decoded = decode(encode(msg))
+        self.assertEqual([(p.epc, p.edt) for p in decoded.properties],
+                         [(0x80, None), (0x9f, bytes(17)),
+                          (0xe0, b'\x00\xfa')])
+
+    def test_buffer_types(self):
+        for data in (bytearray(FRAME), memoryview(FRAME)):
+            msg = decode(data)
+            self.assertIs(type(msg.properties[1].edt), bytes)
+            self.assertEqual(msg.properties[1].edt, b'\x00\xfa')
+
+    def test_edt_does_not_pin_the_datagram(self):
+        data = bytearray(FRAME)
+        msg = decode(data)
+        data[-1] = 0
+        self.assertEqual(msg.properties[1].edt, b'\x00\xfa')
+        # the datagram can still be resized, so no view is held on it.
+        data.extend(b'\x00')
+
+    def test_errors(self):
+        for data in (FRAME[:11],                      # short header
+                     b'\x10\x82' + FRAME[2:],        # format 2
+                     b'\x11\x81' + FRAME[2:],        # not Echonet Lite
+                     FRAME[:13],                      # no PDC
+                     FRAME[:-1],                      # short EDT
+                     FRAME[:11] + b'\x03' + FRAME[12:],  # OPC too large
+                     FRAME + b'\x00'):                # trailing byte
+            with self.assertRaises(DecodeError):
+                decode(data)
+
+
+
+class EncodeTest(unittest.TestCase):
+    def test_encode(self):
+        msg = _message(properties=[Property(0x80, b'\x30'),
+                                   Property(0xe0, [0x00, 0xfa])])
+        self.assertEqual(bytes(encode(msg)), FRAME)
+
+    def test_encode_into(self):
+        msg = decode(FRAME)
+        buffer = bytearray(4 + len(FRAME) + 4)
+        end = encode_into(msg, buffer, 4)
+        self.assertEqual(end, 4 + len(FRAME))
+        self.assertEqual(bytes(buffer[4:end]), FRAME)
+        self.assertEqual(bytes(buffer[:4] + buffer[end:]), bytes(8))
+        end = encode_into(msg, memoryview(buffer), 0)
+        self.assertEqual(bytes(buffer[:end]), FRAME)
+
+    def test_buffer_too_small(self):
+        with self.assertRaises(EncodeError):
+            encode_into(decode(FRAME), bytearray(len(FRAME) - 1))
+
+    def test_header_template(self):
+        # messages sharing a template differ in TID and OPC.
+        first = encode(_message(tid=0x1234,
+                                properties=[Property(0x80, b'\x30')]))
+        second = encode(_message(tid=0xffff, properties=[]))
+        self.assertEqual(bytes(first[:COMMON_HDR_LEN]),
+                         bytes([0x10, 0x81, 0x12, 0x34, 0x05, 0xff, 0x01,
+                                0x00, 0x11, 0x01, 0x72, 0x01]))
+        self.assertEqual(bytes(second),
+                         bytes([0x10, 0x81, 0xff, 0xff, 0x05, 0xff, 0x01,
+                                0x00, 0x11, 0x01, 0x72, 0x00]))
+
+    def test_opc_from_properties(self):
+        msg = _message(properties=[Property(0x80)])
+        msg.opc = None
+        self.assertEqual(encode(msg)[_OPC], 1)
+
+    def test_encode_segments(self):
+        segments = [encode_segment(0x80, b'\x30'),
+                    encode_segment(0xe0, b'\x00\xfa')]
+        self.assertEqual(bytes(encode_segments(1, SEOJ, DEOJ,
+                                               ESV_CODE['GET_RES'],
+                                               segments)),
+                         FRAME)
+        self.assertEqual(encode_segment(0x80, None), b'\x80\x00')
+
+
+class PropertyMapTest(unittest.TestCase):
+    def _epcs(self, count):
+        return list(range(0x80, 0x80 + count))
+
+    def test_list_below_threshold(self):
+        epcs = self._epcs(15)
+        edt = PropertyMap(epcs).encode()
+        self.assertEqual(edt, bytes([15] + epcs))
+        self.assertEqual(list(PropertyMap.decode(edt)), epcs)
+
+    def test_bitmap_at_threshold(self):
+        for count in (16, 17):
+            epcs = self._epcs(count)
+            edt = PropertyMap(epcs).encode()
+            self.assertEqual(len(edt), 17)
+            self.assertEqual(edt[0], count)
+            self.assertEqual(list(PropertyMap.decode(edt)), epcs)
+
+    def test_bitmap_layout(self):
+        # EPC (b << 4 | a) is bit (b - 8) of byte a.
+        epcs = self._epcs(15) + [0xff]
+        edt = PropertyMap(epcs).encode()
+        self.assertEqual(edt[1], 0x01)
+        self.assertEqual(edt[16], 0x80)
+        self.assertEqual(edt[15], 0x01)
+
+    def test_all_epcs(self):
+        epcs = list(range(0x80, 0x100))
+        edt = PropertyMap(epcs).encode()
+        self.assertEqual(edt, bytes([128] + [0xff] * 16))
+        self.assertEqual(list(PropertyMap.decode(edt)), epcs)
+
+    def test_set_operations(self):
+        m = PropertyMap([0x9f, 0x80])
+        m += [0xe0, 0x80]
+        self.assertEqual(list(m), [0x80, 0x9f, 0xe0])
+        self.assertIn(0xe0, m)
+        self.assertNotIn(0x81, m)
+        m.remove(0x9f)
+        with self.assertRaises(KeyError):
+            m.remove(0x9f)
+        self.assertEqual(m, [0x80, 0xe0])
+        with self.assertRaises(ValueError):
+            m.add(0x100)
+
+    def test_not_hashable(self):
+        with self.assertRaises(TypeError):
+            hash(PropertyMap([0x80]))
+
+    def test_low_epcs_in_bitmap(self):
+        with self.assertRaises(EncodeError):
+            PropertyMap(range(0x70, 0x90)).encode()
+
+    def test_decode_errors(self):
+        for edt in (b'', b'\x02\x80', bytes([16]) + bytes(15)):
+            with self.assertRaises(DecodeError):
+                PropertyMap.decode(edt)
+
+
+if __name__ == '__main__':
+    unittest.main()
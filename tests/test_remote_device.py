@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import middleware
+from echonetlite.interfaces import RequestTimeoutError
+from echonetlite.protocol import *
+from tests import helpers
+
+NODE_ID = '192.0.2.2'
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EPC_TEMPERATURE = 0xe0
+
+
+class RemoteDeviceTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(RemoteDeviceTest, self).setUp()
+        self.device = middleware.RemoteDevice(EOJ_SENSOR, NODE_ID)
+        self.monitor.add_node(NODE_ID).add_device(self.device)
+        self.results = []
+
+    def _receive(self, esv, props, tid=0):
+        msg = Message(tid=tid, seoj=EOJ_SENSOR, deoj=self.profile.eoj,
+                      esv=ESV_CODE[esv], properties=props)
+        self.monitor.on_did_receive(bytes(encode(msg)), NODE_ID)
+
+    def _requests(self):
+        # the requests sent to the sensor.
+        self.monitor.runtime.advance()
+        return [msg for (msg, _) in helpers.sent_messages(self.monitor)
+                if msg.deoj == EOJ_SENSOR]
+
+    def _read(self, epcs, **kwargs):
+        d = self.device.read(epcs, self.profile, **kwargs)
+        self.monitor.runtime.add_callbacks(d, self.results.append,
+                                           self.results.append)
+
+    def test_ttl(self):
+        runtime = self.monitor.runtime
+        self.device.set_ttl(0x80, 10)
+        self._receive('INF', [Property(0x80, b'\x30'),
+                              Property(EPC_TEMPERATURE, b'\x00\xfa')])
+        runtime.advance(10)
+        self.assertEqual(self.device.get_property(0x80), b'\x30')
+        self.assertIsNone(self.device.get_property(0x80, max_age=5))
+        runtime.advance(1)
+        self.assertIsNone(self.device.get_property(0x80))
+        self.assertEqual(self.device.get_value(EPC_TEMPERATURE), 25.0)
+        runtime.advance(self.device.default_ttl)
+        self.assertIsNone(self.device.get_value(EPC_TEMPERATURE))
+
+    def test_set_response_invalidates(self):
+        self._receive('INF', [Property(0x80, b'\x30')])
+        self._receive('SET_RES', [Property(0x80)])
+        self.assertIsNone(self.device.get_property(0x80))
+
+    def test_read_from_cache(self):
+        self._receive('INF', [Property(0x80, b'\x30')])
+        self._requests()
+        self._read([0x80])
+        self.assertEqual(self.results, [{0x80: b'\x30'}])
+        self.assertEqual(self._requests(), [])
+
+    def test_read_requests_missing(self):
+        self._receive('INF', [Property(0x80, b'\x30')])
+        self._requests()
+        self._read([0x80, EPC_TEMPERATURE])
+        [request] = self._requests()
+        self.assertEqual([p.epc for p in request.properties],
+                         [EPC_TEMPERATURE])
+        self._receive('GET_RES', [Property(EPC_TEMPERATURE, b'\x00\xfa')],
+                      tid=request.tid)
+        self.assertEqual(self.results,
+                         [{0x80: b'\x30', EPC_TEMPERATURE: b'\x00\xfa'}])
+        self.assertEqual(self.device.get_property(EPC_TEMPERATURE),
+                         b'\x00\xfa')
+
+    def test_read_timeout(self):
+        self._read([0x80], timeout=1, retries=0)
+        self.assertEqual(len(self._requests()), 1)
+        self.monitor.runtime.advance(1)
+        [error] = self.results
+        self.assertIsInstance(error, RequestTimeoutError)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite.interfaces import RequestError, RequestTimeoutError
+from echonetlite.protocol import *
+from tests import helpers
+
+NODE_ID = '192.0.2.2'
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EPC_TEMPERATURE = 0xe0
+
+
+class RequestTest(helpers.MonitorTestCase):
+    def setUp(self):
+        super(RequestTest, self).setUp()
+        self.results = []
+        self.errors = []
+
+    def _request(self, esv, props, timeout=5, retries=2):
+        d = self.profile.request(esv, props, EOJ_SENSOR, NODE_ID,
+                                 timeout=timeout, retries=retries)
+        self.monitor.runtime.add_callbacks(d, self.results.append,
+                                           self.errors.append)
+        self.monitor.runtime.advance()
+        return helpers.sent_messages(self.monitor)
+
+    def _reply(self, request, esv, props):
+        msg = Message(tid=request.tid, seoj=request.deoj,
+                      deoj=request.seoj, esv=esv, opc=len(props),
+                      properties=props)
+        self.monitor.on_did_receive(encode(msg), NODE_ID)
+
+    def test_reply(self):
+        [(msg, node_id)] = self._request(ESV_CODE['GET'],
+                                         [Property(EPC_TEMPERATURE)])
+        self.assertEqual(node_id, NODE_ID)
+        self._reply(msg, ESV_CODE['GET_RES'],
+                    [Property(EPC_TEMPERATURE, b'\x00\xfa')])
+        [reply] = self.results
+        self.assertEqual(reply.properties[0].edt, b'\x00\xfa')
+        self.assertEqual(self.errors, [])
+
+    def test_timeout_after_retries(self):
+        [(msg, _)] = self._request(ESV_CODE['GET'],
+                                   [Property(EPC_TEMPERATURE)])
+        self.monitor.runtime.advance(14.9)
+        sent = helpers.sent_messages(self.monitor)
+        self.assertEqual([m.tid for (m, _) in sent], [msg.tid, msg.tid])
+        self.assertEqual(self.errors, [])
+        self.monitor.runtime.advance(0.1)
+        [error] = self.errors
+        self.assertIsInstance(error, RequestTimeoutError)
+        self.assertEqual(self.results, [])
+        # a late reply is ignored.
+        self._reply(msg, ESV_CODE['GET_RES'],
+                    [Property(EPC_TEMPERATURE, b'\x00\xfa')])
+        self.assertEqual(self.results, [])
+
+    def test_get_sna(self):
+        [(msg, _)] = self._request(ESV_CODE['GET'],
+                                   [Property(EPC_TEMPERATURE)])
+        self._reply(msg, ESV_CODE['GET_SNA'], [Property(EPC_TEMPERATURE)])
+        [error] = self.errors
+        self.assertIsInstance(error, RequestError)
+        self.assertEqual(error.msg.esv, ESV_CODE['GET_SNA'])
+        # no retransmission after the error reply.
+        self.monitor.runtime.advance(30)
+        self.assertEqual(helpers.sent_messages(self.monitor), [])
+
+    def test_setc_sna(self):
+        [(msg, _)] = self._request(ESV_CODE['SETC'],
+                                   [Property(0x80, b'\x30')])
+        self._reply(msg, ESV_CODE['SETC_SNA'], [Property(0x80, b'\x30')])
+        [error] = self.errors
+        self.assertIsInstance(error, RequestError)
+
+    def test_reply_from_other_node_is_ignored(self):
+        [(msg, _)] = self._request(ESV_CODE['GET'],
+                                   [Property(EPC_TEMPERATURE)])
+        reply = Message(tid=msg.tid, seoj=msg.deoj, deoj=msg.seoj,
+                        esv=ESV_CODE['GET_RES'], opc=1,
+                        properties=[Property(EPC_TEMPERATURE, b'\x00\xfa')])
+        self.monitor.on_did_receive(encode(reply), '192.0.2.3')
+        self.assertEqual(self.results, [])
+
+    def test_seti_is_rejected(self):
+        with self.assertRaisesRegex(ValueError, 'has no response'):
+            self.profile.request(ESV_CODE['SETI'], [Property(0x80, b'\x30')],
+                                 EOJ_SENSOR, NODE_ID)
+        self.assertEqual(helpers.sent_messages(self.monitor), [])
+
+    def test_non_request_is_rejected(self):
+        for esv in (ESV_CODE['GET_RES'], 0x00):
+            with self.assertRaisesRegex(ValueError, 'not a request'):
+                self.profile.request(esv, [Property(0x80)],
+                                     EOJ_SENSOR, NODE_ID)
+        self.assertEqual(helpers.sent_messages(self.monitor), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from echonetlite import sendqueue
+from tests.helpers import FakeMonitor
+
+
+class SendQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.monitor = FakeMonitor()
+        self.queue = sendqueue.SendQueue(self.monitor)
+
+    def test_sends_in_order_per_destination(self):
+        self.queue.put(b'a1', '10.0.0.1')
+        self.queue.put(b'b1', '10.0.0.2')
+        self.queue.put(b'a2', '10.0.0.1')
+        self.monitor.runtime.advance()
+        self.assertEqual(self.monitor.sender.sent,
+                         [(b'a1', '10.0.0.1'), (b'b1', '10.0.0.2'),
+                          (b'a2', '10.0.0.1')])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_destination_pacing(self):
+        self.queue.set_pacing(destination_rate=10)
+        for i in range(3):
+            self.queue.put(bytes([i]), '10.0.0.1')
+        self.monitor.runtime.advance()
+        self.assertEqual(len(self.monitor.sender.sent), 1)
+        self.monitor.runtime.advance(0.1)
+        self.assertEqual(len(self.monitor.sender.sent), 2)
+        self.monitor.runtime.advance(0.1)
+        self.assertEqual(len(self.monitor.sender.sent), 3)
+
+    def test_global_pacing(self):
+        self.queue.set_pacing(rate=4, burst=2)
+        for i in range(4):
+            self.queue.put(bytes([i]), '10.0.0.{0}'.format(i))
+        self.monitor.runtime.advance()
+        self.assertEqual(len(self.monitor.sender.sent), 2)
+        self.monitor.runtime.advance(0.5)
+        self.assertEqual(len(self.monitor.sender.sent), 4)
+
+    def test_multicast_and_unicast_throttled_together(self):
+        # both destinations are throttled with the same deadline.
+        self.queue.set_pacing(destination_rate=10)
+        for i in range(2):
+            self.queue.put(b'm' + bytes([i]), None)
+            self.queue.put(b'u' + bytes([i]), '10.0.0.1')
+        self.monitor.runtime.advance()
+        self.assertEqual(self.monitor.sender.sent,
+                         [(b'm\x00', None), (b'u\x00', '10.0.0.1')])
+        self.monitor.runtime.advance(0.1)
+        self.assertEqual(len(self.monitor.sender.sent), 4)
+        self.assertEqual(len(self.queue), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+import echonetlite.interfaces
+from echonetlite import middleware
+from echonetlite import simadapter
+from echonetlite.protocol import *
+from tests import helpers
+
+HOST_ID = '10.0.0.1'
+NODE_ID = '10.1.0.1'
+EOJ_SENSOR = EOJ(0x00, 0x11, 0x01)
+EOJ_CONTROLLER = EOJ(0x05, 0xff, 0x01)
+EPC_TEMPERATURE = 0xe0
+
+
+def _sensor(instance_id=1):
+    return simadapter.VirtualDevice(EOJ(0x00, 0x11, instance_id),
+                                    {EPC_TEMPERATURE: b'\x00\xfa'},
+                                    set_epcs=[0x81])
+
+
+class VirtualNodeTest(unittest.TestCase):
+    def setUp(self):
+        self.device = _sensor()
+        network = simadapter.Network()
+        self.node = network.add_node(NODE_ID, [self.device])
+
+    def _handle(self, esv, props):
+        return self.node.handle(self.device,
+                                Message(tid=1, seoj=EOJ_CONTROLLER,
+                                        deoj=EOJ_SENSOR, esv=ESV_CODE[esv],
+                                        properties=props))
+
+    def test_get(self):
+        reply = self._handle('GET', [Property(EPC_TEMPERATURE)])
+        self.assertEqual(reply.esv, ESV_CODE['GET_RES'])
+        self.assertEqual(reply.tid, 1)
+        self.assertEqual(reply.deoj, EOJ_CONTROLLER)
+        self.assertEqual(bytes(reply.properties[0].edt), b'\x00\xfa')
+        reply = self._handle('GET', [Property(EPC_TEMPERATURE),
+                                     Property(0xf0)])
+        self.assertEqual(reply.esv, ESV_CODE['GET_SNA'])
+
+    def test_set(self):
+        reply = self._handle('SETC', [Property(0x81, b'\x01')])
+        self.assertEqual(reply.esv, ESV_CODE['SET_RES'])
+        self.assertEqual(self.device.get(0x81), b'\x01')
+        self.assertIsNone(self._handle('SETI', [Property(0x81, b'\x02')]))
+        reply = self._handle('SETI', [Property(EPC_TEMPERATURE, b'\x00')])
+        self.assertEqual(reply.esv, ESV_CODE['SETI_SNA'])
+
+    def test_instance_list(self):
+        self.node.add_device(_sensor(2), announce=False)
+        self.assertEqual(
+            self.node.profile.get(EPC_SELF_NODE_INSTANCE_LIST_S),
+            b'\x02\x00\x11\x01\x00\x11\x02')
+        self.assertEqual(self.node.find_devices(EOJ(0x00, 0x11, 0x00)),
+                         [self.device, self.node.devices[0x001102]])
+
+
+class NetworkTest(unittest.TestCase):
+    def setUp(self):
+        self.runtime = helpers.FakeRuntime()
+        self.network = simadapter.Network(latency=0.01, seed=1)
+        self.received = []
+        self.network.attach(self.runtime, HOST_ID,
+                            lambda datagram, node_id: self.received.append(
+                                (decode(datagram), node_id)))
+
+    def _get(self, to_node_id, deoj=EOJ_SENSOR):
+        msg = Message(tid=1, seoj=EOJ_CONTROLLER, deoj=deoj,
+                      esv=ESV_CODE['GET'],
+                      properties=[Property(EPC_TEMPERATURE)])
+        self.network.transmit(bytes(encode(msg)), HOST_ID, to_node_id)
+
+    def test_reply_after_latency(self):
+        self.network.add_node(NODE_ID, [_sensor()])
+        self._get(NODE_ID)
+        self.runtime.advance(0.015)
+        self.assertEqual(self.received, [])
+        self.runtime.advance(0.01)
+        [(reply, node_id)] = self.received
+        self.assertEqual(node_id, NODE_ID)
+        self.assertEqual(reply.esv, ESV_CODE['GET_RES'])
+
+    def test_multicast(self):
+        for i in range(3):
+            self.network.add_node('10.1.0.{0}'.format(i + 1), [_sensor()])
+        self._get(None)
+        self.runtime.advance(1)
+        self.assertEqual(sorted(node_id for (_, node_id) in self.received),
+                         ['10.1.0.1', '10.1.0.2', '10.1.0.3'])
+        self.network.announce_all()
+        del self.received[:]
+        self.runtime.advance(1)
+        self.assertEqual(len(self.received), 3)
+
+    def test_loss(self):
+        self.network.add_node(NODE_ID, [_sensor()], loss=1.0)
+        self._get(NODE_ID)
+        self.runtime.advance(1)
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.network.dropped, 1)
+
+    def test_removed_node(self):
+        self.network.add_node(NODE_ID, [_sensor()])
+        self._get(NODE_ID)
+        self.network.remove_node(NODE_ID)
+        self.runtime.advance(1)
+        self.assertEqual(self.received, [])
+        self._get(NODE_ID)
+        self.assertEqual(self.network.dropped, 2)
+
+
+class SimulatedMonitorTest(unittest.TestCase):
+    def setUp(self):
+        self._saved_monitor = echonetlite.interfaces.monitor
+        self.addCleanup(setattr, echonetlite.interfaces, 'monitor',
+                        self._saved_monitor)
+
+    def test_discovery_and_request(self):
+        network = simadapter.Network(latency=0.001, seed=1)
+        for i in range(20):
+            network.add_node('10.1.0.{0}'.format(i + 1),
+                             [_sensor(1), _sensor(2)])
+        monitor = echonetlite.interfaces.Monitor()
+        monitor.set_adapter(simadapter, network=network)
+        echonetlite.interfaces.monitor = monitor
+        profile = middleware.NodeProfile()
+        controller = middleware.Controller(instance_id=1)
+        results = []
+        def request():
+            d = controller.request(ESV_CODE['GET'],
+                                   [Property(EPC_TEMPERATURE)],
+                                   EOJ(0x00, 0x11, 0x02), '10.1.0.20')
+            monitor.runtime.add_callbacks(d, results.append,
+                                          results.append)
+        monitor.runtime.call_later(0.05, network.announce_all)
+        monitor.runtime.call_later(0.2, request)
+        monitor.runtime.call_later(0.3, monitor.stop)
+        monitor.start(HOST_ID, [profile, controller], shell_port=None)
+        monitor.runtime.loop.close()
+        self.assertEqual(len(monitor.nodes), 21)
+        self.assertEqual(profile.get_instances('10.1.0.20'),
+                         frozenset([0x001101, 0x001102]))
+        [reply] = results
+        self.assertEqual(bytes(reply.properties[0].edt), b'\x00\xfa')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import echonetlite.interfaces
+from echonetlite import middleware
+from echonetlite import topology
+from echonetlite.protocol import *
+from tests import helpers
+
+SELF_NODE_ID = '192.0.2.1'
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self._saved = echonetlite.interfaces.monitor
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'topology.json')
+
+    def tearDown(self):
+        echonetlite.interfaces.monitor = self._saved
+        shutil.rmtree(self.directory)
+
+    def _start(self, node_filter=None):
+        monitor = helpers.new_monitor()
+        monitor.node_filter = node_filter
+        monitor.enable_snapshot(self.path, interval=None)
+        self.profile = middleware.NodeProfile()
+        monitor.start(SELF_NODE_ID, [self.profile], shell_port=None)
+        return monitor
+
+    def _save(self, nodes):
+        monitor = self._start()
+        for (node_id, eojs) in nodes:
+            monitor.add_node(node_id)
+            edt = bytes([len(eojs)]) + b''.join(
+                eoj.to_bytes(3, 'big') for eoj in eojs)
+            self.profile._on_did_receive_instance_list(
+                node_id, Property(EPC_SELF_NODE_INSTANCE_LIST_S, edt))
+        topology.save(monitor, self.path)
+
+    def test_round_trip(self):
+        self._save([('192.0.2.2', [0x001101, 0x001102]),
+                    ('192.0.2.3', [0x001101])])
+        monitor = self._start()
+        self.assertEqual(sorted(monitor.get_node('192.0.2.2').devices),
+                         [0x001101, 0x001102])
+        self.assertEqual(sorted(monitor.get_node('192.0.2.3').devices),
+                         [0x001101])
+
+    def test_node_filter(self):
+        self._save([('192.0.2.2', [0x001101]), ('192.0.2.3', [0x001101])])
+        monitor = self._start(node_filter=lambda n: n == '192.0.2.3')
+        self.assertIsNone(monitor.get_node('192.0.2.2'))
+        self.assertIsNotNone(monitor.get_node('192.0.2.3'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import errno
+import unittest
+
+from echonetlite import udp
+
+
+class _Socket(object):
+    # returns or raises the given results in turn.
+    def __init__(self, results):
+        self._results = list(results)
+        self.reads = 0
+
+    def recvfrom(self, size):
+        self.reads += 1
+        if not self._results:
+            raise BlockingIOError()
+        result = self._results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class DrainTest(unittest.TestCase):
+    def test_reads_at_most_batch_size(self):
+        sock = _Socket([(b'x', ('10.0.0.1', 3610))] * 10)
+        self.assertEqual(udp.drain(sock, 4), [(b'x', '10.0.0.1')] * 4)
+        self.assertEqual(sock.reads, 4)
+
+    def test_stops_when_empty(self):
+        sock = _Socket([(b'x', ('10.0.0.1', 3610))])
+        self.assertEqual(udp.drain(sock, 4), [(b'x', '10.0.0.1')])
+
+    def test_skips_transient_errors(self):
+        sock = _Socket([OSError(errno.ECONNREFUSED, 'refused'),
+                        (b'x', ('10.0.0.1', 3610))])
+        self.assertEqual(udp.drain(sock, 4), [(b'x', '10.0.0.1')])
+
+    def test_bounded_by_attempts(self):
+        # a socket failing with transient errors forever.
+        class Refusing(object):
+            reads = 0
+            def recvfrom(self, size):
+                self.reads += 1
+                raise OSError(errno.ECONNREFUSED, 'refused')
+        sock = Refusing()
+        self.assertEqual(udp.drain(sock, 8), [])
+        self.assertEqual(sock.reads, 8)
+
+    def test_stops_on_persistent_error(self):
+        sock = _Socket([OSError(errno.EBADF, 'bad file descriptor'),
+                        (b'x', ('10.0.0.1', 3610))])
+        self.assertEqual(udp.drain(sock, 4), [])
+        self.assertEqual(sock.reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()